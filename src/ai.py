@@ -4,16 +4,81 @@ Copyright 2018 Mark Mitterdorfer
 Class to implement AI and score heuristics.
 """
 
+import collections
+import json
+import time
+
+
+class SearchTimeout(Exception):
+    """Raised inside a search when the AI.deadline has passed."""
+    pass
+
 
 class AI(object):
     """Class for AI player.
 
     Attributes:
         MAX_SCORE (int): Absolute maximum winning / losing score.
+        nodes (int): Number of nodes visited by the searches, reset by the caller.
+        root_best (tuple): (best_score, best_move) found so far at the root of the running search.
+        search_depth (int): Depth of the result of the last timed_abnegamax() search.
+        deadline (float): time.time() after which a running search raises SearchTimeout, None for no limit.
+        FIRST_MOVE_LIMIT (int): Maximum number of first moves (nearest the centre) searched per player.
+        SEARCH_LIMITS (list): (max_free_boxes, depth, time_budget) search defaults by board size.
+        late_move_reductions (bool): Enable late move reductions in abnegamax.
+        LMR_MIN_DEPTH (int): Minimum remaining depth to reduce late moves at.
+        LMR_FULL_MOVES (int): Number of moves searched to full depth before reducing.
+        LMR_REDUCTION (int): Depth reduction of late moves, even so reduced searches score their leaves
+            with the same sign as full depth searches.
+        futility_pruning (bool): Enable futility pruning / razoring in abnegamax.
+        FUTILITY_MARGINS (tuple): Score margin per remaining depth, in mobility (score_func2) units.
+            Futility pruning only applies with score_func2, see mobility_units().
+        threat_search (bool): Enable the forced win / loss detection of threat_result() in abnegamax.
+        THREAT_MOBILITY (int): Run the detection when either player has at most this many moves.
+        THREAT_PLIES (int): Maximum length of the forced sequences searched for.
+        THREAT_CACHE_SIZE (int): Maximum number of cached forced_win() results.
+        threat_cache (collections.OrderedDict): (position_hash, plies) -> forced_win() result, least recently used first.
+        tablebase (tablebase.Tablebase): Endgame tablebase probed by abnegamax, None for no tablebase.
     """
 
     MAX_SCORE = 10000
 
+    FIRST_MOVE_LIMIT = 25
+
+    # Keep per move latency bounded as the board grows, the time budget (seconds)
+    # stops iterative deepening early on large boards
+    SEARCH_LIMITS = [(25, 5, None),
+                     (64, 5, 2.0),
+                     (256, 4, 2.0),
+                     (1024, 3, 2.0)]
+
+    # Search statistics, these are polled while a search is running to report progress
+    nodes = 0
+    root_best = None
+    search_depth = None
+    deadline = None
+
+    # Selective search, off by default. Set through timed_abnegamax() or directly.
+    late_move_reductions = False
+    LMR_MIN_DEPTH = 3
+    LMR_FULL_MOVES = 3
+    # The leaves are signed by "player", so their sign flips with the depth parity
+    LMR_REDUCTION = 2
+
+    futility_pruning = False
+    # Between the median and the 90th percentile of the static score error at each depth on random 6x6 positions
+    FUTILITY_MARGINS = (0, 6, 4)
+
+    # Threat space search near the end of the game, off by default. Set through timed_abnegamax() or directly.
+    threat_search = False
+    THREAT_MOBILITY = 2
+    THREAT_PLIES = 5
+    THREAT_CACHE_SIZE = 100000
+    threat_cache = collections.OrderedDict()
+
+    # Solved endgames, see tablebase.py. Set through timed_abnegamax() or directly.
+    tablebase = None
+
     @staticmethod
     def manhattan_distance(x1, y1, x2, y2):
         """Obtain the Manhattan distance between two points in 2d coordinates.
@@ -51,6 +116,108 @@ class AI(object):
             return total + 5
         return int((1.0 / dist) * total)
 
+    @staticmethod
+    def search_moves(board):
+        """Obtain the moves to search for the active player.
+        On large boards a players first move can go to any free box. Restrict these to
+        the FIRST_MOVE_LIMIT free boxes closest to the centre of the board.
+
+        Args:
+            board (board.Board): Game board object.
+
+        Returns:
+            moves (list): List of tuples (X, Y) with coordinates of moves to search.
+
+        """
+        moves = board.get_legal_moves()
+        if board.player_pos(board.active_player) is None and len(moves) > AI.FIRST_MOVE_LIMIT:
+            centre = board.columns // 2, board.rows // 2
+            moves.sort(key=lambda move: AI.manhattan_distance(*move, *centre))
+            del moves[AI.FIRST_MOVE_LIMIT:]
+        return moves
+
+    @staticmethod
+    def mobility_units(score_func):
+        """Determine if a scoring heuristic scores in mobility (score_func2) units, the units of
+        FUTILITY_MARGINS. Looks through ScoreCache wrappers.
+
+        Args:
+            score_func (function pointer): Scoring heuristic.
+
+        Returns:
+            True if the heuristic is score_func2, False otherwise.
+
+        """
+        while isinstance(score_func, ScoreCache):
+            score_func = score_func.score_func
+        return score_func is AI.score_func2
+
+    @staticmethod
+    def search_limits(board):
+        """Obtain the default search depth and time budget for a board from SEARCH_LIMITS.
+
+        Args:
+            board (board.Board): Game board object.
+
+        Returns:
+            depth (int), time_budget (float): Maximum search depth and time budget in seconds,
+            time_budget is None for no limit.
+
+        """
+        free = board.num_free_boxes
+        for max_free, depth, time_budget in AI.SEARCH_LIMITS:
+            if free <= max_free:
+                return depth, time_budget
+        max_free, depth, time_budget = AI.SEARCH_LIMITS[-1]
+        return depth, time_budget
+
+    @staticmethod
+    def second_order_mobility(board, player):
+        """Obtain the number of moves "player" would have after each of its legal moves.
+
+        Args:
+            board (board.Board): Game board object.
+            player (int): Player.
+
+        Returns:
+            (int): Sum of the number of moves from each legal move.
+
+        """
+        return sum(len(board.get_moves_from(*move)) for move in board.get_legal_moves(player))
+
+    @staticmethod
+    def reachable_area(board, player):
+        """Obtain the number of free boxes "player" could eventually reach.
+        Flood fill the free boxes connected horizontally, vertically and diagonally to the player,
+        as moves of any length pass through these neighbours.
+
+        Args:
+            board (board.Board): Game board object.
+            player (int): Player.
+
+        Returns:
+            (int): Number of reachable free boxes.
+
+        """
+        pos = board.player_pos(player)
+        if pos is None:
+            return board.num_free_boxes
+
+        seen = {pos}
+        stack = [pos]
+        while stack:
+            x, y = stack.pop()
+            for dx, dy in ((-1, -1), (+0, -1), (+1, -1), (+1, +0),
+                           (+1, +1), (+0, +1), (-1, +1), (-1, +0)):
+                nx, ny = x + dx, y + dy
+                if 0 <= nx < board.columns and 0 <= ny < board.rows and (nx, ny) not in seen \
+                        and not board.box_blocked(nx, ny):
+                    seen.add((nx, ny))
+                    stack.append((nx, ny))
+
+        # Do not count the players own box
+        return len(seen) - 1
+
     #################################################################################
     # These are the scoring functions. Scoring should be relative to both players.  #
     # That is maximising a score for the active player should be to the detriment   #
@@ -177,6 +344,131 @@ class AI(object):
             return total + 5
         return int((1.0 / dist) * total)
 
+    @staticmethod
+    def constraining_moves(board):
+        """Moves of the active player which leave the inactive player at most one move. Blocking the
+        destination box only removes the opponent moves to it and beyond it in the same direction.
+
+        Args:
+            board (board.Board): Game board object, both players must have made their first move.
+
+        Returns:
+            moves (list): List of tuples (X, Y), most constraining first.
+
+        """
+        opp_x, opp_y = board.player_pos(board.inactive_player)
+        opp_moves = board.get_moves_from(opp_x, opp_y)
+        if not opp_moves:
+            return board.get_legal_moves()
+
+        constraining = []
+        for move_x, move_y in board.get_legal_moves():
+            dx1, dy1 = move_x - opp_x, move_y - opp_y
+            remaining = 0
+            for x, y in opp_moves:
+                dx2, dy2 = x - opp_x, y - opp_y
+                # Cut off if the move is on the same ray from the opponent, and not further away
+                cut = (dx1 * dy2 == dy1 * dx2 and dx1 * dx2 >= 0 and dy1 * dy2 >= 0 and
+                       max(abs(dx1), abs(dy1)) <= max(abs(dx2), abs(dy2)))
+                if not cut:
+                    remaining += 1
+                    if remaining > 1:
+                        break
+            if remaining <= 1:
+                constraining.append((remaining, (move_x, move_y)))
+
+        constraining.sort()
+        return [move for remaining, move in constraining]
+
+    @staticmethod
+    def forced_win(board, plies):
+        """Search for a forced win of the active player within "plies" plies, only trying the
+        constraining_moves() of the active player. The opponent then has at most one reply, so the
+        search stays narrow. Results are cached in threat_cache by position.
+
+        Args:
+            board (board.Board): Game board object, both players must have made their first move.
+            plies (int): Maximum number of plies, counting the moves of both players.
+
+        Returns:
+            move (int, int): First move of a forced win, None if none was found.
+
+        """
+        key = (board.position_hash, plies)
+        if key in AI.threat_cache:
+            AI.threat_cache.move_to_end(key)
+            return AI.threat_cache[key]
+
+        attacker = board.active_player
+        result = None
+        if plies >= 1:
+            for move in AI.constraining_moves(board):
+                AI.nodes += 1
+                child = board.make_move_copy(*move)
+                winner = child.is_game_over()
+                if winner:
+                    if winner == attacker:
+                        result = move
+                        break
+                    # Isolated ourselves
+                    continue
+                if plies < 3:
+                    continue
+
+                # The opponent has exactly one reply, the attacker has to win after it
+                reply = child.get_legal_moves()[0]
+                AI.nodes += 1
+                grandchild = child.make_move_copy(*reply)
+                winner = grandchild.is_game_over()
+                if winner == attacker or (not winner and AI.forced_win(grandchild, plies - 2) is not None):
+                    result = move
+                    break
+
+        AI.threat_cache[key] = result
+        if len(AI.threat_cache) > AI.THREAT_CACHE_SIZE:
+            AI.threat_cache.popitem(last=False)
+        return result
+
+    @staticmethod
+    def threat_result(board, plies):
+        """Prove a short forced win or loss of the active player when either player's mobility is at
+        most THREAT_MOBILITY. A win is proven by forced_win(). A loss is proven if the active player
+        has few moves and the opponent has a forced_win() after each of them.
+
+        Args:
+            board (board.Board): Game board object, the game must be in play.
+            plies (int): Maximum length of the forced sequence.
+
+        Returns:
+            best_score (int), best_move (int, int): MAX_SCORE for a proven win and -MAX_SCORE for a proven
+            loss, from the perspective of the active player. None if neither was proven.
+
+        """
+        pos = board.player_pos(board.active_player)
+        opp_pos = board.player_pos(board.inactive_player)
+        # Not near the end of the game before both players have moved
+        if pos is None or opp_pos is None:
+            return None
+
+        moves = board.get_moves_from(*pos)
+        if min(len(moves), len(board.get_moves_from(*opp_pos))) > AI.THREAT_MOBILITY:
+            return None
+
+        move = AI.forced_win(board, plies)
+        if move is not None:
+            return AI.MAX_SCORE, move
+
+        if len(moves) <= AI.THREAT_MOBILITY:
+            for move in moves:
+                AI.nodes += 1
+                child = board.make_move_copy(*move)
+                # Any move which is not proven to lose refutes the loss
+                if not child.is_game_over() and AI.forced_win(child, plies - 1) is None:
+                    return None
+            return -AI.MAX_SCORE, moves[0]
+
+        return None
+
     @staticmethod
     def negamax(board, depth, player, score_func):
         """Perform negamax from the perspective of "player" as the active player.
@@ -192,6 +484,7 @@ class AI(object):
             best_score (int), best_move (int, int): Best score and associated move for "player".
 
         """
+        AI.nodes += 1
         player_sign = +1 if board.active_player == player else -1
 
         winner = board.is_game_over()
@@ -216,7 +509,7 @@ class AI(object):
         return best_score, best_move
 
     @staticmethod
-    def abnegamax(board, depth, player, alpha, beta, score_func):
+    def abnegamax(board, depth, player, alpha, beta, score_func, ply=0):
         """Perform abnegamax from the perspective of "player" as the active player.
         This from the Wikipedia site: https://en.wikipedia.org/wiki/Negamax
         Sign +1 if "player" is the active player, and sign -1 for opponent.
@@ -228,11 +521,15 @@ class AI(object):
             alpha (int): Lower bound.
             beta (int): Upper bound.
             score_func (function pointer): Scoring heuristic.
+            ply (int, optional): Distance from the root of the search, 0 at the root.
 
         Returns:
             best_score (int), best_move (int, int): Best score and associated move for "player".
 
         """
+        AI.nodes += 1
+        if AI.deadline is not None and time.time() > AI.deadline:
+            raise SearchTimeout()
         player_sign = +1 if board.active_player == player else -1
 
         winner = board.is_game_over()
@@ -240,19 +537,71 @@ class AI(object):
         if winner or depth == 0:
             return player_sign * score_func(board, winner, player), None
 
+        # Below the tablebase threshold look the solved position up instead of searching it
+        if AI.tablebase is not None and AI.tablebase.covers(board):
+            if ply == 0:
+                win, distance, best_move = AI.tablebase.best_move(board)
+                AI.root_best = (AI.MAX_SCORE if win else -AI.MAX_SCORE), best_move
+                return AI.root_best
+            win, distance = AI.tablebase.probe(board)
+            return (AI.MAX_SCORE if win else -AI.MAX_SCORE), None
+
+        # Prove short forced sequences near the end of the game without searching the full width.
+        # At the root only wins are used, so a lost root still searches for the most resilient move.
+        if AI.threat_search:
+            result = AI.threat_result(board, AI.THREAT_PLIES)
+            if result is not None and (ply > 0 or result[0] > 0):
+                if ply == 0:
+                    AI.root_best = result
+                return result
+
+        # Futility pruning (depth 1) / razoring (depth 2): if the static score plus a margin can not
+        # raise alpha, assume searching the remaining depth will not either and fail low.
+        # The margins are in mobility units, so only prune with heuristics scoring in them.
+        # The leaves are signed by "player", not the active player, so the static score only estimates
+        # the search when the leaves "depth" moves below have "player" to move, with the opposite sign
+        # of this nodes leaf score at an odd depth.
+        leaves_player_to_move = (depth % 2 == 0) == (player_sign > 0)
+        if AI.futility_pruning and ply > 0 and depth < len(AI.FUTILITY_MARGINS) and leaves_player_to_move \
+                and AI.mobility_units(score_func):
+            static_score = player_sign * score_func(board, winner, player)
+            if depth % 2:
+                static_score = -static_score
+            if static_score + AI.FUTILITY_MARGINS[depth] <= alpha:
+                return static_score, None
+
+        moves = AI.search_moves(board)
+        reduce_late_moves = AI.late_move_reductions and depth >= AI.LMR_MIN_DEPTH
+        if reduce_late_moves:
+            # Order moves with the most mobility at the destination first, so late moves are the weak ones
+            moves.sort(key=lambda move: len(board.get_moves_from(*move)), reverse=True)
+
         best_move = None
         best_score = float("-inf")
 
         # Explore all possible states
-        for move in board.get_legal_moves():
+        for index, move in enumerate(moves):
             new_board = board.make_move_copy(*move)
 
-            rec_score, current_move = AI.abnegamax(new_board, depth - 1, player, -beta, -alpha, score_func)
+            # Late move reduction: search late moves shallower, and only search them
+            # to full depth again if they look like they can raise alpha
+            full_depth = True
+            if reduce_late_moves and index >= AI.LMR_FULL_MOVES:
+                rec_score, current_move = AI.abnegamax(new_board, depth - 1 - AI.LMR_REDUCTION, player,
+                                                       -beta, -alpha, score_func, ply + 1)
+                full_depth = -rec_score > alpha
+
+            if full_depth:
+                rec_score, current_move = AI.abnegamax(new_board, depth - 1, player, -beta, -alpha, score_func,
+                                                       ply + 1)
             current_score = -rec_score
 
             if current_score > best_score:
                 best_score = current_score
                 best_move = move
+                # Publish the best root move so far for progress reporting
+                if ply == 0:
+                    AI.root_best = (best_score, best_move)
 
             alpha = max(alpha, current_score)
             if alpha >= beta:
@@ -307,3 +656,434 @@ class AI(object):
 
         return best_score, best_move
 
+    @staticmethod
+    def timed_abnegamax(board, depth, player, score_func, time_budget=None, late_move_reductions=False,
+                        futility_pruning=False, optimistic=True, threat_search=False, tablebase=None,
+                        stop_func=None):
+        """Perform power abnegamax as iterative deepening from depth 1 up to "depth" within a time budget.
+        The result of the deepest completed depth is used. As in power_abnegamax(), if that score is
+        losing then the deepest completed depth with a better than losing score is used instead.
+        Use search_limits() to obtain a depth and time budget suited to the board size.
+
+        Args:
+            board (board.Board): Game board object.
+            depth (int): The maximum search depth for each state move.
+            player (int): "Player" to maximise / check as winner.
+            score_func (function pointer): Scoring heuristic.
+            time_budget (float, optional): Seconds to search for, None for no limit.
+            late_move_reductions (bool, optional): Enable late move reductions for this search.
+            futility_pruning (bool, optional): Enable futility pruning / razoring for this search, only
+                applies with score_func2.
+            optimistic (bool, optional): Fall back to a shallower non losing score as power_abnegamax does.
+                Disable to obtain the score of the deepest completed depth, e.g. for analysis.
+            threat_search (bool, optional): Enable forced win / loss detection near the end of the game.
+            tablebase (tablebase.Tablebase, optional): Endgame tablebase to probe, None for no tablebase.
+            stop_func (function pointer, optional): Called after each completed depth as stop_func(results, elapsed)
+                with the (best_score, best_move) per depth and the seconds searched, return True to stop
+                deepening, e.g. clock.StopCondition. None to search until the depth or time budget is reached.
+
+        Returns:
+            best_score (int), best_move (int, int): Best score and associated move for "player".
+
+        """
+        results = []
+        start = time.time()
+        AI.deadline = start + time_budget if time_budget is not None else None
+        selective = AI.late_move_reductions, AI.futility_pruning, AI.threat_search, AI.tablebase
+        AI.late_move_reductions = late_move_reductions
+        AI.futility_pruning = futility_pruning
+        AI.threat_search = threat_search
+        AI.tablebase = tablebase
+        try:
+            try:
+                for i_depth in range(1, depth + 1):
+                    results.append(AI.abnegamax(board, i_depth, player, float("-inf"), float("inf"), score_func))
+                    # Game decided, searching deeper will not change the outcome
+                    if results[-1][0] >= AI.MAX_SCORE:
+                        break
+                    if stop_func is not None and stop_func(results, time.time() - start):
+                        break
+            except SearchTimeout:
+                pass
+
+            # Always complete depth 1 so there is a move to play, with the search settings asked for
+            if not results:
+                AI.deadline = None
+                results.append(AI.abnegamax(board, 1, player, float("-inf"), float("inf"), score_func))
+        finally:
+            AI.deadline = None
+            AI.late_move_reductions, AI.futility_pruning, AI.threat_search, AI.tablebase = selective
+
+        best_score, best_move = results[-1]
+        AI.search_depth = len(results)
+        if optimistic and best_score <= -AI.MAX_SCORE:
+            # Try shallower depths to get a positive, "optimistic" score
+            for i_depth in range(len(results) - 1, 0, -1):
+                score, move = results[i_depth - 1]
+                if score > -AI.MAX_SCORE:
+                    best_score, best_move = score, move
+                    AI.search_depth = i_depth
+                    break
+
+        return best_score, best_move
+
+
+class WeightedScore(object):
+    """Weighted linear scoring heuristic. Instances are called like a score_funcN and are picklable,
+    so they can be passed to search_worker.SearchWorker. Fit the weights with tuner.py.
+    Each feature is the active players value minus the inactive players value, except for
+    "distance" which is the distance between the players.
+
+    Attributes:
+        FEATURES (tuple): Feature names, in weight order.
+        DEFAULT_WEIGHTS (tuple): Weights which score the same as score_func2.
+        weights (list): Weight per feature.
+    """
+
+    FEATURES = ("mobility", "centre", "distance", "second_order_mobility", "reachable_area")
+    DEFAULT_WEIGHTS = (1.0, 0.0, 0.0, 0.0, 0.0)
+
+    def __init__(self, weights=None):
+        if weights is None:
+            weights = WeightedScore.DEFAULT_WEIGHTS
+        assert len(weights) == len(WeightedScore.FEATURES)
+        self.weights = list(weights)
+
+    @staticmethod
+    def features(board, weights=None):
+        """Obtain the feature values of a board for the active player.
+
+        Args:
+            board (board.Board): Game board object.
+            weights (list, optional): Weight per feature, features weighing 0 are not computed and
+                valued 0. None to compute every feature.
+
+        Returns:
+            values (list): Value per feature in FEATURES.
+
+        """
+        if weights is None:
+            weights = (1.0,) * len(WeightedScore.FEATURES)
+        mobility, centre, distance, second_order_mobility, reachable_area = (weight != 0 for weight in weights)
+
+        active = board.active_player
+        inactive = board.inactive_player
+        a_pos = board.player_pos(active)
+        o_pos = board.player_pos(inactive)
+        placed = a_pos is not None and o_pos is not None
+
+        values = [0] * len(WeightedScore.FEATURES)
+        if mobility:
+            values[0] = len(board.get_legal_moves(active)) - len(board.get_legal_moves(inactive))
+        if centre and placed:
+            values[1] = AI.inv_dist_to_centre(board, active) - AI.inv_dist_to_centre(board, inactive)
+        if distance and placed:
+            values[2] = AI.manhattan_distance(*a_pos, *o_pos)
+        # Second order mobility and the flood fill are far slower than the others, skip them unless weighted
+        if second_order_mobility:
+            values[3] = AI.second_order_mobility(board, active) - AI.second_order_mobility(board, inactive)
+        if reachable_area:
+            values[4] = AI.reachable_area(board, active) - AI.reachable_area(board, inactive)
+        return values
+
+    def __call__(self, board, winner, player):
+        """Score a move for the active player, see AI.score_func1.
+
+        Args:
+            board (board.Board): Game board object.
+            winner (boolean/int): False if game is in play, and int for the winning player.
+            player (int): "Player" check as winner.
+
+        Returns:
+            score (float): Score for the active player.
+
+        """
+        # Terminal heuristic / game over scenario
+        if winner:
+            if winner == player:
+                # "player" won
+                return AI.MAX_SCORE
+            # "player" lost
+            return -AI.MAX_SCORE
+
+        # Non-terminal scoring heuristic, keep it inside the winning / losing scores
+        score = sum(weight * value for weight, value in zip(self.weights, WeightedScore.features(board, self.weights)))
+        return max(-AI.MAX_SCORE + 1, min(AI.MAX_SCORE - 1, score))
+
+    def save(self, filename):
+        """Save the weights as a JSON weights file.
+
+        Args:
+            filename (str): Weights filename.
+
+        """
+        with open(filename, "w") as output_file:
+            json.dump(dict(zip(WeightedScore.FEATURES, self.weights)), output_file, indent=4)
+
+    @staticmethod
+    def load(filename):
+        """Load a JSON weights file written by save(). Features missing from the file weigh 0.
+
+        Args:
+            filename (str): Weights filename.
+
+        Returns:
+            (WeightedScore): Scoring heuristic with the loaded weights.
+
+        """
+        with open(filename, "r") as input_file:
+            weights = json.load(input_file)
+        return WeightedScore([float(weights.get(feature, 0.0)) for feature in WeightedScore.FEATURES])
+
+
+class ScoreCache(object):
+    """Memoising wrapper for any scoring heuristic (score_funcN or WeightedScore) keyed by
+    Board.position_hash. Positions reached through transpositions, or scored again at every
+    depth of an iterative deepening search, are only scored once. Bounded with LRU eviction.
+    Pickling a cache (e.g. to send it to search_worker.SearchWorker) drops the cached scores.
+
+    Attributes:
+        score_func (function pointer): Scoring heuristic to cache.
+        maxsize (int): Maximum number of cached scores.
+        hits (int): Number of scores returned from the cache.
+        misses (int): Number of scores computed.
+        hit_rate (property, float): Fraction of scores returned from the cache.
+        __scores (collections.OrderedDict): Private (position_hash, player) -> score, least recently used first.
+    """
+
+    def __init__(self, score_func, maxsize=100000):
+        self.score_func = score_func
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.__scores = collections.OrderedDict()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_ScoreCache__scores"] = collections.OrderedDict()
+        return state
+
+    def __len__(self):
+        return len(self.__scores)
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def clear(self):
+        """Clear the cached scores and statistics.
+
+        """
+        self.__scores.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, board, winner, player):
+        """Score a move for the active player, see AI.score_func1.
+
+        Args:
+            board (board.Board): Game board object.
+            winner (boolean/int): False if game is in play, and int for the winning player.
+            player (int): "Player" check as winner.
+
+        Returns:
+            score (int): Score for the active player.
+
+        """
+        # The winner follows from the position, only the player checked as winner is added
+        key = (board.position_hash, player)
+        score = self.__scores.get(key)
+        if score is not None:
+            self.__scores.move_to_end(key)
+            self.hits += 1
+            return score
+
+        self.misses += 1
+        score = self.score_func(board, winner, player)
+        self.__scores[key] = score
+        if len(self.__scores) > self.maxsize:
+            self.__scores.popitem(last=False)
+        return score
+
+
+class TerritoryScore(object):
+    """Territory (Voronoi) scoring heuristic. A simultaneous breadth first search from both players
+    over the queen move graph counts the free boxes each player reaches in fewer moves than the
+    opponent. Boxes both reach in the same number of moves count for neither. Instances are called
+    like a score_funcN and are picklable, so they can be passed to search_worker.SearchWorker.
+    The search buffers are allocated once per board size and reused, pickling drops them.
+
+    Attributes:
+        max_depth (int): Stop the search after this many moves, None to search until every reachable
+            free box is claimed.
+        __buffers (dict): Private (rows, columns) -> (rays, owner, level, active_queue, inactive_queue).
+    """
+
+    # Box owners in the owner buffer
+    UNCLAIMED = 0
+    ACTIVE = 1
+    INACTIVE = 2
+    CONTESTED = 3
+    BLOCKED = 255
+
+    # Board list value to owner: free boxes (board.Board.BOX_CLEAR) are unclaimed, every other box is blocked
+    OWNER_TABLE = bytes(0 if value == 4 else 255 for value in range(256))
+
+    def __init__(self, max_depth=None):
+        self.max_depth = max_depth
+        self.__buffers = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_TerritoryScore__buffers"] = {}
+        return state
+
+    def __get_buffers(self, board):
+        """Obtain the search buffers for the board dimensions, allocating them on first use.
+
+        Args:
+            board (board.Board): Game board object.
+
+        Returns:
+            rays (list), owner (bytearray), level (bytearray), active_queue (list), inactive_queue (list)
+
+        """
+        key = (board.rows, board.columns)
+        buffers = self.__buffers.get(key)
+        if buffers is None:
+            size = board.rows * board.columns
+            rays = []
+            for offset in range(size):
+                x, y = offset % board.columns, offset // board.columns
+                box_rays = []
+                for dx, dy in ((-1, -1), (+0, -1), (+1, -1), (+1, +0),
+                               (+1, +1), (+0, +1), (-1, +1), (-1, +0)):
+                    ray = []
+                    move_x, move_y = x + dx, y + dy
+                    while 0 <= move_x < board.columns and 0 <= move_y < board.rows:
+                        ray.append(move_x + move_y * board.columns)
+                        move_x += dx
+                        move_y += dy
+                    if ray:
+                        box_rays.append(tuple(ray))
+                rays.append(tuple(box_rays))
+            buffers = (rays, bytearray(size), bytearray(size), [0] * size, [0] * size)
+            self.__buffers[key] = buffers
+        return buffers
+
+    def territory(self, board):
+        """Count the free boxes each player reaches first.
+
+        Args:
+            board (board.Board): Game board object, both players must have made their first move.
+
+        Returns:
+            active (int), inactive (int): Boxes claimed by the active and the inactive player.
+
+        """
+        rays, owner, level, active_queue, inactive_queue = self.__get_buffers(board)
+        owner[:] = bytes(board.board_list).translate(TerritoryScore.OWNER_TABLE)
+        unclaimed = board.num_free_boxes
+
+        active_queue[0] = board.offset(*board.player_pos(board.active_player))
+        inactive_queue[0] = board.offset(*board.player_pos(board.inactive_player))
+        active_head, active_tail = 0, 1
+        inactive_head, inactive_tail = 0, 1
+        active = inactive = 0
+
+        depth = 0
+        # Early exit once every reachable box is claimed, or at max_depth
+        while unclaimed and (active_head < active_tail or inactive_head < inactive_tail):
+            depth += 1
+            if self.max_depth is not None and depth > self.max_depth:
+                break
+            moves = min(depth, 255)
+
+            # The active player moves first, so claims the boxes it reaches in "depth" moves first
+            end = active_tail
+            while active_head < end:
+                for ray in rays[active_queue[active_head]]:
+                    for offset in ray:
+                        box = owner[offset]
+                        if box == TerritoryScore.BLOCKED:
+                            break
+                        if box == TerritoryScore.UNCLAIMED:
+                            owner[offset] = TerritoryScore.ACTIVE
+                            level[offset] = moves
+                            active_queue[active_tail] = offset
+                            active_tail += 1
+                            active += 1
+                            unclaimed -= 1
+                active_head += 1
+
+            # Boxes the active player claimed in the same number of moves are contested
+            end = inactive_tail
+            while inactive_head < end:
+                for ray in rays[inactive_queue[inactive_head]]:
+                    for offset in ray:
+                        box = owner[offset]
+                        if box == TerritoryScore.BLOCKED:
+                            break
+                        if box == TerritoryScore.UNCLAIMED:
+                            owner[offset] = TerritoryScore.INACTIVE
+                            inactive_queue[inactive_tail] = offset
+                            inactive_tail += 1
+                            inactive += 1
+                            unclaimed -= 1
+                        elif box == TerritoryScore.ACTIVE and level[offset] == moves:
+                            owner[offset] = TerritoryScore.CONTESTED
+                            inactive_queue[inactive_tail] = offset
+                            inactive_tail += 1
+                            active -= 1
+                inactive_head += 1
+
+        return active, inactive
+
+    def __call__(self, board, winner, player):
+        """Score a move for the active player, see AI.score_func1.
+        Difference of the boxes claimed by the active player and the inactive player.
+
+        Args:
+            board (board.Board): Game board object.
+            winner (boolean/int): False if game is in play, and int for the winning player.
+            player (int): "Player" check as winner.
+
+        Returns:
+            score (int): Score for the active player.
+
+        """
+        # Terminal heuristic / game over scenario
+        if winner:
+            if winner == player:
+                return AI.MAX_SCORE
+            return -AI.MAX_SCORE
+
+        # Before both players have moved there is no territory, fall back to mobility
+        if board.player1_pos is None or board.player2_pos is None:
+            return AI.score_func2(board, winner, player)
+
+        active, inactive = self.territory(board)
+        return active - inactive
+
+
+def main():
+    import board
+
+    game = board.Board(5, 5)
+    game.make_move(1, 1)
+    game.make_move(3, 3)
+
+    for name, score_func in (("score_func2", AI.score_func2), ("cached score_func2", ScoreCache(AI.score_func2))):
+        AI.nodes = 0
+        start = time.time()
+        best_score, best_move = AI.timed_abnegamax(game, 6, game.active_player, score_func)
+        print(name, "move:", best_move, "score:", best_score, "nodes:", AI.nodes,
+              "time: {:.3f}".format(time.time() - start))
+        if isinstance(score_func, ScoreCache):
+            print("cache size:", len(score_func), "hits:", score_func.hits, "misses:", score_func.misses,
+                  "hit rate: {:.1%}".format(score_func.hit_rate))
+
+
+if __name__ == "__main__":
+    main()
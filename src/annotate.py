@@ -0,0 +1,184 @@
+"""Replay annotator.
+Copyright 2018 Mark Mitterdorfer
+
+Re-search every position of recorded games (replay files from main.py) at a higher depth
+or time budget, and record the score swings and blunders. Files are annotated in parallel,
+one JSON line per file is appended to the output file as soon as the file is done, and a
+restarted run skips the files already in the output file. Does not need Pygame.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+
+import ai
+import record
+
+# Search settings of a worker process, set once by _init_worker()
+_settings = None
+
+
+def _init_worker(depth, time_budget, threshold, cache_size):
+    """Pool initializer, keep the search settings and a score cache shared by every file
+    the worker process annotates.
+
+    Args:
+        depth (int): The maximum search depth.
+        time_budget (float): Seconds to search each position for, None for no limit.
+        threshold (float): Score loss for a move to count as a blunder.
+        cache_size (int): Maximum size of the score cache.
+
+    """
+    global _settings
+    _settings = (depth, time_budget, threshold, ai.ScoreCache(ai.AI.score_func2, cache_size))
+
+
+def annotate_replay(filename, depth, time_budget=None, threshold=3, score_func=ai.AI.score_func2):
+    """Re-search every position of a recorded game.
+    A move is a blunder if the mover's score after it is at least threshold lower than the best
+    score before it, or if it turns a position which is not lost in to a lost one. Both scores
+    are of the same search depth.
+
+    Args:
+        filename (str): Pickled replay filename.
+        depth (int): The maximum search depth.
+        time_budget (float, optional): Seconds to search each position for, None for no limit.
+        threshold (float, optional): Score loss for a move to count as a blunder.
+        score_func (function pointer, optional): Scoring heuristic.
+
+    Returns:
+        annotation (dict): JSON serialisable annotation, one entry in "plies" per recorded move.
+
+    """
+    game, human_playing, record_play = record.load_replay(filename)
+
+    plies = []
+    for ply, (active_player, recorded_score, move) in enumerate(record_play):
+        best_score, best_move = ai.AI.timed_abnegamax(game, depth, game.active_player, score_func,
+                                                      time_budget, optimistic=False)
+        search_depth = ai.AI.search_depth
+
+        # Score of the move played, for the player who played it. The leaves are signed by the searching
+        # player, so scores of different depths can differ in sign, and with a time budget the depth
+        # varies between positions. Score the move in the same search as the best move instead.
+        played_score = best_score
+        if tuple(move) != best_move:
+            rec_score, _ = ai.AI.abnegamax(game.make_move_copy(*move), search_depth - 1, game.active_player,
+                                           float("-inf"), float("inf"), score_func, 1)
+            played_score = -rec_score
+        loss = best_score - played_score
+        blunder = loss >= threshold or (best_score > -ai.AI.MAX_SCORE and played_score <= -ai.AI.MAX_SCORE)
+
+        # Swing of the score from player 1's point of view
+        swing = -loss if active_player == game.PLAYER1 else loss
+
+        plies.append({"ply": ply,
+                      "player": active_player,
+                      "move": list(move),
+                      "recorded_score": recorded_score,
+                      "search_depth": search_depth,
+                      "best_move": list(best_move) if best_move else None,
+                      "best_score": best_score,
+                      "played_score": played_score,
+                      "loss": loss,
+                      "swing": swing,
+                      "blunder": blunder})
+
+        game.make_move(*move)
+
+    return {"file": filename,
+            "rows": game.rows,
+            "columns": game.columns,
+            "human_playing": human_playing,
+            "depth": depth,
+            "time_budget": time_budget,
+            "blunders": sum(entry["blunder"] for entry in plies),
+            "plies": plies}
+
+
+def _annotate_job(filename):
+    """Pool worker wrapper for annotate_replay().
+
+    Args:
+        filename (str): Pickled replay filename.
+
+    Returns:
+        annotation (dict): See annotate_replay().
+
+    """
+    depth, time_budget, threshold, score_func = _settings
+    return annotate_replay(filename, depth, time_budget, threshold, score_func)
+
+
+def done_files(out):
+    """Obtain the files already annotated in an output file.
+
+    Args:
+        out (str): JSON lines output filename.
+
+    Returns:
+        filenames (set): Annotated filenames.
+
+    """
+    filenames = set()
+    if os.path.exists(out):
+        with open(out, "r") as input_file:
+            for line in input_file:
+                # Ignore a line cut short by an interrupted run
+                try:
+                    filenames.add(json.loads(line)["file"])
+                except ValueError:
+                    pass
+    return filenames
+
+
+def annotate_replays(filenames, out, depth, time_budget=None, threshold=3, jobs=None, cache_size=100000):
+    """Annotate many replay files in parallel, resuming from an existing output file.
+
+    Args:
+        filenames (list): Pickled replay filenames.
+        out (str): JSON lines output filename, appended to.
+        depth (int): The maximum search depth.
+        time_budget (float, optional): Seconds to search each position for, None for no limit.
+        threshold (float, optional): Score loss for a move to count as a blunder.
+        jobs (int, optional): Number of worker processes, default to the number of CPUs.
+        cache_size (int, optional): Maximum size of each workers score cache.
+
+    Yields:
+        annotation (dict): See annotate_replay(), in completion order.
+
+    """
+    done = done_files(out)
+    todo = [filename for filename in filenames if filename not in done]
+
+    with multiprocessing.Pool(jobs, initializer=_init_worker,
+                              initargs=(depth, time_budget, threshold, cache_size)) as pool, \
+            open(out, "a+") as output_file:
+        # Terminate a line cut short by an interrupted run
+        if output_file.tell() > 0:
+            output_file.seek(output_file.tell() - 1)
+            if output_file.read(1) != "\n":
+                output_file.write("\n")
+        for annotation in pool.imap_unordered(_annotate_job, todo):
+            output_file.write(json.dumps(annotation) + "\n")
+            output_file.flush()
+            yield annotation
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-search recorded Isolation games and flag blunders.")
+    parser.add_argument("filenames", nargs="+", help="pickled replay filename(s)")
+    parser.add_argument("--out", default="annotations.jsonl", help="JSON lines output file, resumed if it exists")
+    parser.add_argument("--depth", type=int, default=6, help="search depth")
+    parser.add_argument("--time", type=float, default=None, help="time budget per position in seconds")
+    parser.add_argument("--threshold", type=float, default=3, help="score loss for a move to count as a blunder")
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes")
+    args = parser.parse_args()
+
+    for annotation in annotate_replays(args.filenames, args.out, args.depth, args.time, args.threshold, args.jobs):
+        print(annotation["file"], "plies:", len(annotation["plies"]), "blunders:", annotation["blunders"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""Batch analysis.
+Copyright 2018 Mark Mitterdorfer
+
+Find the best move and score for many positions in one call, e.g. for replay annotation
+or puzzle generation. Positions are written to shared memory (shared_boards.SharedBoards)
+and only their slots are sent to a process pool in chunks, and the search settings and
+score cache are sent once per worker process.
+"""
+
+import itertools
+import multiprocessing
+import os
+import queue
+from multiprocessing import resource_tracker
+
+import ai
+import board
+import shared_boards
+
+# Search settings of a worker process, set once by _init_worker()
+_settings = None
+# Shared board arrays a worker process has attached to, by (name, rows, columns, count)
+_attached = {}
+
+
+def _init_worker(depth, score_func, time_budget, cache_size):
+    """Pool initializer, keep the search settings and a score cache shared by every position
+    the worker process analyses.
+
+    Args:
+        depth (int): The maximum search depth.
+        score_func (function pointer): Scoring heuristic.
+        time_budget (float): Seconds to search each position for, None for no limit.
+        cache_size (int): Maximum size of the score cache, 0 for no cache.
+
+    """
+    global _settings
+    if cache_size:
+        score_func = ai.ScoreCache(score_func, cache_size)
+    _settings = (depth, score_func, time_budget)
+
+
+def _analyse_chunk(chunk):
+    """Analyse a chunk of positions in a worker process.
+
+    Args:
+        chunk (list): List of (index, address, slot), the board is in slot of the shared_boards.SharedBoards
+            at address (name, rows, columns, count).
+
+    Returns:
+        results (list): List of (index, best_score, best_move, nodes).
+
+    """
+    depth, score_func, time_budget = _settings
+    results = []
+    for index, address, slot in chunk:
+        boards = _attached.get(address)
+        if boards is None:
+            name, rows, columns, count = address
+            boards = _attached[address] = shared_boards.SharedBoards(rows, columns, count, name)
+        game = boards.read(slot)
+        ai.AI.nodes = 0
+        if game.is_game_over():
+            results.append((index, None, None, 0))
+            continue
+        best_score, best_move = ai.AI.timed_abnegamax(game, depth, game.active_player, score_func, time_budget)
+        results.append((index, best_score, best_move, ai.AI.nodes))
+    return results
+
+
+def _chunks(positions, chunksize):
+    """Split an iterable of boards in to chunks of (index, board), consuming it a chunk at a time.
+
+    Args:
+        positions (iterable): Iterable of board.Board.
+        chunksize (int): Positions per chunk.
+
+    Yields:
+        chunk (list): List of (index, board.Board).
+
+    """
+    numbered = enumerate(positions)
+    while True:
+        chunk = list(itertools.islice(numbered, chunksize))
+        if not chunk:
+            return
+        yield chunk
+
+
+def analyse(positions, depth, score_func=ai.AI.score_func2, time_budget=None, jobs=None, chunksize=16,
+            ordered=True, cache_size=100000, chunks_in_flight=None):
+    """Find the best move and score for the active player of every position.
+    At most chunks_in_flight chunks are taken from positions ahead of the results yielded,
+    so a long generator of positions is never held in memory at once.
+
+    Args:
+        positions (iterable): Iterable of board.Board, consumed as the results are yielded.
+        depth (int): The maximum search depth, see ai.AI.timed_abnegamax.
+        score_func (function pointer, optional): Scoring heuristic, must be picklable.
+        time_budget (float, optional): Seconds to search each position for, None for no limit.
+        jobs (int, optional): Number of worker processes, default to the number of CPUs.
+        chunksize (int, optional): Positions sent to a worker at a time.
+        ordered (bool, optional): Yield results in input order, otherwise as soon as they are ready.
+        cache_size (int, optional): Maximum size of each workers score cache, 0 for no cache.
+        chunks_in_flight (int, optional): Most chunks sent to the workers but not yet yielded,
+            default to 4 per worker process.
+
+    Yields:
+        index (int), best_score (int), best_move (int, int), nodes (int): Per position, index in to
+        positions. best_score and best_move are None if the game is over in that position.
+
+    """
+    if chunks_in_flight is None:
+        chunks_in_flight = 4 * (jobs or os.cpu_count() or 1)
+    chunks = enumerate(_chunks(positions, chunksize))
+    # (chunk number, results, error) posted by the pools result thread as chunks complete
+    finished = queue.Queue()
+    # Completed chunks waiting for the chunks before them, to yield in order
+    waiting = {}
+    submitted = yielded = 0
+    exhausted = False
+    # (shared_boards.SharedBoards, free slots, address) by board dimensions, enough slots for every chunk in flight
+    shared = {}
+    # Slots of the chunks in the workers by chunk number, freed as the chunks complete
+    chunk_slots = {}
+    # Start the resource tracker before the workers so they share it. A worker attaching to the shared boards
+    # would otherwise start its own, which tries to remove them again when the worker exits.
+    resource_tracker.ensure_running()
+
+    try:
+        with multiprocessing.Pool(jobs, initializer=_init_worker,
+                                  initargs=(depth, score_func, time_budget, cache_size)) as pool:
+            while True:
+                # Pool.imap() would read the whole iterable ahead, submit only a window of chunks instead
+                while not exhausted and submitted - yielded < chunks_in_flight:
+                    item = next(chunks, None)
+                    if item is None:
+                        exhausted = True
+                        break
+                    number, chunk = item
+                    task = []
+                    chunk_slots[number] = []
+                    for index, game in chunk:
+                        key = (game.rows, game.columns)
+                        if key not in shared:
+                            boards = shared_boards.SharedBoards(game.rows, game.columns, chunks_in_flight * chunksize)
+                            shared[key] = (boards, list(range(boards.count)),
+                                           (boards.name, boards.rows, boards.columns, boards.count))
+                        boards, free_slots, address = shared[key]
+                        slot = free_slots.pop()
+                        boards.write(slot, game)
+                        task.append((index, address, slot))
+                        chunk_slots[number].append((free_slots, slot))
+                    pool.apply_async(_analyse_chunk, (task,),
+                                     callback=lambda results, number=number: finished.put((number, results, None)),
+                                     error_callback=lambda error, number=number: finished.put((number, None, error)))
+                    submitted += 1
+                if submitted == yielded:
+                    return
+
+                number, results, error = finished.get()
+                if error is not None:
+                    raise error
+                for free_slots, slot in chunk_slots.pop(number):
+                    free_slots.append(slot)
+                if not ordered:
+                    yielded += 1
+                    yield from results
+                    continue
+
+                waiting[number] = results
+                while yielded in waiting:
+                    yield from waiting.pop(yielded)
+                    yielded += 1
+    finally:
+        # The pool has terminated its workers, nothing reads the shared boards any more
+        for boards, free_slots, address in shared.values():
+            boards.close()
+
+
+def main():
+    import random
+    import time
+
+    rng = random.Random(0)
+    positions = []
+    for _ in range(200):
+        game = board.Board(5, 5)
+        for _ in range(rng.randint(2, 8)):
+            if game.is_game_over():
+                break
+            game.make_move(*rng.choice(game.get_legal_moves()))
+        positions.append(game)
+
+    start = time.time()
+    nodes = 0
+    for index, best_score, best_move, position_nodes in analyse(positions, 4):
+        nodes += position_nodes
+    print(len(positions), "positions, nodes:", nodes, "time: {:.2f}".format(time.time() - start))
+
+
+if __name__ == "__main__":
+    main()
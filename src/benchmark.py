@@ -0,0 +1,696 @@
+"""Benchmarks.
+Copyright 2018 Mark Mitterdorfer
+
+Benchmarks for the AI search, run e.g.:
+
+    python benchmark.py selective
+    python benchmark.py serialise
+    python benchmark.py startup
+    python benchmark.py threats
+    python benchmark.py memory
+    python benchmark.py territory
+    python benchmark.py verify
+
+"verify" asserts that the optimised implementations agree with plain reference implementations.
+"""
+
+import argparse
+import os
+import pickle
+import random
+import gc
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import ai
+import board
+import bounded
+import positions as position_files
+import shared_boards
+import tablebase
+
+
+def random_positions(count, rows, columns, moves, seed):
+    """Generate positions by playing seeded random moves.
+
+    Args:
+        count (int): Number of positions.
+        rows (int), columns (int): Board dimensions.
+        moves (int): Random moves played per position.
+        seed (int): Random seed.
+
+    Returns:
+        positions (list): List of board.Board, none of them game over.
+
+    """
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        game = board.Board(rows, columns)
+        for _ in range(moves):
+            if game.is_game_over():
+                break
+            game.make_move(*rng.choice(game.get_legal_moves()))
+        if not game.is_game_over():
+            positions.append(game)
+    return positions
+
+
+def play_match(search1, search2, rows, columns, random_moves, seed):
+    """Play a game between two search functions, after seeded random opening moves.
+
+    Args:
+        search1 (function pointer): Search for player 1, called as search(board, player).
+        search2 (function pointer): Search for player 2, called as search(board, player).
+        rows (int), columns (int): Board dimensions.
+        random_moves (int): Random opening moves.
+        seed (int): Random seed for the opening moves.
+
+    Returns:
+        winner (int): Winning player.
+
+    """
+    rng = random.Random(seed)
+    game = board.Board(rows, columns)
+    searches = {game.PLAYER1: search1, game.PLAYER2: search2}
+
+    ply = 0
+    winner = game.is_game_over()
+    while not winner:
+        if ply < random_moves:
+            move = rng.choice(game.get_legal_moves())
+        else:
+            best_score, move = searches[game.active_player](game, game.active_player)
+        game.make_move(*move)
+        ply += 1
+        winner = game.is_game_over()
+
+    return winner
+
+
+def match_results(search, baseline, rows, columns, games, random_moves, seed):
+    """Play search against baseline, each opening played once with each colour.
+
+    Args:
+        search (function pointer): Search under test, called as search(board, player).
+        baseline (function pointer): Baseline search, called as search(board, player).
+        rows (int), columns (int): Board dimensions.
+        games (int): Number of openings.
+        random_moves (int): Random opening moves.
+        seed (int): Base random seed.
+
+    Returns:
+        wins (int), losses (int): Games won and lost by search.
+
+    """
+    wins = 0
+    for game_num in range(games):
+        if play_match(search, baseline, rows, columns, random_moves, seed + game_num) == board.Board.PLAYER1:
+            wins += 1
+        if play_match(baseline, search, rows, columns, random_moves, seed + game_num) == board.Board.PLAYER2:
+            wins += 1
+    return wins, 2 * games - wins
+
+
+# Least share of positions where futility pruning / late move reductions must choose a move scoring as well
+# as the unpruned best move
+FUTILITY_BEST_KEPT = 0.9
+LMR_BEST_KEPT = 0.85
+
+
+def best_move_kept(game, depth, move, best_score):
+    """Check whether a move scores as well as the best move of the unpruned search.
+
+    Args:
+        game (board.Board): Game board object.
+        depth (int): Search depth.
+        move (int, int): Move to check.
+        best_score (int): Best score of the unpruned search to depth.
+
+    Returns:
+        True if the unpruned search scores the move as best_score.
+
+    """
+    # Score the move the way the unpruned root search scores it
+    score, _ = ai.AI.abnegamax(game.make_move_copy(*move), depth - 1, game.active_player, float("-inf"),
+                               float("inf"), ai.AI.score_func2, 1)
+    return -score >= best_score
+
+
+def bench_selective(args):
+    """Compare late move reductions and futility pruning against the unpruned search.
+    Report nodes, node reduction, time, best move agreement and best move kept (a move scoring
+    as well as the unpruned best) over random positions, and match results against the
+    unpruned search. Asserts futility pruning keeps the best move in FUTILITY_BEST_KEPT of the positions,
+    and late move reductions in LMR_BEST_KEPT.
+
+    Args:
+        args (argparse.Namespace): Command line arguments.
+
+    """
+    # (name, late_move_reductions, futility_pruning, least share of best moves kept)
+    configs = [("unpruned", False, False, 1.0),
+               ("lmr", True, False, LMR_BEST_KEPT),
+               ("futility", False, True, FUTILITY_BEST_KEPT),
+               ("lmr+futility", True, True, LMR_BEST_KEPT)]
+
+    positions = random_positions(args.positions, args.rows, args.columns, args.moves, args.seed)
+
+    def searcher(late_move_reductions, futility_pruning, optimistic=True):
+        def search(game, player):
+            return ai.AI.timed_abnegamax(game, args.depth, player, ai.AI.score_func2, None,
+                                         late_move_reductions, futility_pruning, optimistic)
+        return search
+
+    print("{} positions, {}x{} board, depth {}".format(len(positions), args.rows, args.columns, args.depth))
+    print("{:<14} {:>10} {:>10} {:>9} {:>10} {:>10}".format("search", "nodes", "reduction", "time(s)", "same move",
+                                                            "best kept"))
+    baseline_nodes = None
+    baseline_results = None
+    failed = []
+    for name, late_move_reductions, futility_pruning, best_kept in configs:
+        # Not optimistic, so the scores compare at the same depth
+        search = searcher(late_move_reductions, futility_pruning, False)
+        ai.AI.nodes = 0
+        start = time.time()
+        results = [search(game, game.active_player) for game in positions]
+        elapsed = time.time() - start
+        nodes = ai.AI.nodes
+
+        if baseline_nodes is None:
+            baseline_nodes, baseline_results = nodes, results
+        reduction = 1.0 - nodes / float(baseline_nodes)
+        same = sum(move == baseline_move for (score, move), (baseline_score, baseline_move)
+                   in zip(results, baseline_results))
+        kept = sum(best_move_kept(game, args.depth, move, baseline_score) for game, (score, move), (baseline_score, _)
+                   in zip(positions, results, baseline_results))
+        if kept < best_kept * len(positions):
+            failed.append("{} kept the best move in only {}/{} positions".format(name, kept, len(positions)))
+        print("{:<14} {:>10} {:>10.1%} {:>9.2f} {:>10} {:>10}".format(
+            name, nodes, reduction, elapsed, "{}/{}".format(same, len(positions)),
+            "{}/{}".format(kept, len(positions))))
+
+    assert not failed, ", ".join(failed)
+
+    if args.games <= 0:
+        return
+
+    print("Matches against the unpruned search, {} openings x 2 colours:".format(args.games))
+    baseline = searcher(False, False)
+    for name, late_move_reductions, futility_pruning, best_kept in configs[1:]:
+        wins, losses = match_results(searcher(late_move_reductions, futility_pruning), baseline,
+                                     args.rows, args.columns, args.games, args.moves, args.seed)
+        print("{:<14} won {} lost {}".format(name, wins, losses))
+
+
+def bench_threats(args):
+    """Compare the search with and without forced win / loss detection on endgame positions,
+    where either player has at most ai.AI.THREAT_MOBILITY moves. Report nodes, time, proven
+    wins / losses at the root and best move agreement.
+
+    Args:
+        args (argparse.Namespace): Command line arguments.
+
+    """
+    # Draw from a larger pool of late positions, keeping the ones near the end of the game
+    positions = []
+    for game in random_positions(20 * args.positions, args.rows, args.columns, args.moves, args.seed):
+        mobility = min(len(game.get_legal_moves(player)) for player in (game.PLAYER1, game.PLAYER2))
+        if mobility <= ai.AI.THREAT_MOBILITY:
+            positions.append(game)
+    positions = positions[:args.positions]
+
+    print("{} endgame positions, {}x{} board, depth {}".format(len(positions), args.rows, args.columns, args.depth))
+    print("{:<10} {:>10} {:>9} {:>6} {:>6} {:>10}".format("search", "nodes", "time(s)", "wins", "losses",
+                                                           "same move"))
+    baseline_moves = None
+    for name, threat_search in (("full", False), ("threats", True)):
+        ai.AI.threat_cache.clear()
+        ai.AI.nodes = 0
+        start = time.time()
+        results = [ai.AI.timed_abnegamax(game, args.depth, game.active_player, ai.AI.score_func2, None,
+                                         threat_search=threat_search) for game in positions]
+        elapsed = time.time() - start
+
+        moves = [move for score, move in results]
+        if baseline_moves is None:
+            baseline_moves = moves
+        wins = sum(score >= ai.AI.MAX_SCORE for score, move in results)
+        losses = sum(score <= -ai.AI.MAX_SCORE for score, move in results)
+        same = sum(move == baseline_move for move, baseline_move in zip(moves, baseline_moves))
+        print("{:<10} {:>10} {:>9.2f} {:>6} {:>6} {:>10}".format(name, ai.AI.nodes, elapsed, wins, losses,
+                                                               "{}/{}".format(same, len(positions))))
+
+
+def bench_memory(args):
+    """Compare the memory use of timed_abnegamax, which copies the board per node, with the
+    memory bounded search move by move through a game. Report per move the nodes, the change in
+    allocated memory blocks and net garbage collector objects, and the peak traced memory.
+
+    Args:
+        args (argparse.Namespace): Command line arguments.
+
+    """
+    def measure(search, game):
+        # Start each search from a collected heap, with the collector off as in the bounded search
+        gc.collect()
+        gc.disable()
+        gc_count = gc.get_count()[0]
+        blocks = sys.getallocatedblocks()
+        ai.AI.nodes = 0
+        result = search(game)
+        nodes = ai.AI.nodes
+        blocks = sys.getallocatedblocks() - blocks
+        gc_objects = gc.get_count()[0] - gc_count
+        gc.enable()
+
+        # Search again with tracing on for the peak, tracing changes the allocated block counts
+        gc.collect()
+        tracemalloc.start()
+        search(game)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return result, nodes, blocks, gc_objects, peak
+
+    bounded_search = bounded.BoundedSearch(args.rows, args.columns, args.depth)
+    searches = [("timed", lambda game: ai.AI.timed_abnegamax(game, args.depth, game.active_player,
+                                                                 ai.AI.score_func2)),
+                ("bounded", lambda game: bounded_search.search(game, args.depth))]
+
+    # The positions of a game, both searches play the same moves
+    positions = [random_positions(1, args.rows, args.columns, 2, args.seed)[0]]
+    while not positions[-1].is_game_over() and len(positions) < args.moves:
+        positions.append(positions[-1].make_move_copy(*bounded_search.search(positions[-1], args.depth)[1]))
+    if positions[-1].is_game_over():
+        positions.pop()
+
+    # Measure each search in a separate pass, the garbage one search leaves behind skews the next
+    measurements = []
+    for name, search in searches:
+        measurements.append([measure(search, game) for game in positions])
+
+    print("{}x{} board, depth {}".format(args.rows, args.columns, args.depth))
+    print("{:>4} {:<8} {:>8} {:>8} {:>8} {:>10}".format("ply", "search", "nodes", "blocks", "gc objs", "peak(KiB)"))
+    for ply in range(len(positions)):
+        results = []
+        for (name, search), measured in zip(searches, measurements):
+            result, nodes, blocks, gc_objects, peak = measured[ply]
+            results.append(result)
+            print("{:>4} {:<8} {:>8} {:>8} {:>8} {:>10.1f}".format(ply, name, nodes, blocks, gc_objects, peak / 1024))
+        assert results[0] == results[1]
+
+
+def bench_territory(args):
+    """Compare the territory heuristic against the score_func2 mobility heuristic. Report time per
+    evaluation over random positions, and match results with the same time budget per move.
+
+    Args:
+        args (argparse.Namespace): Command line arguments.
+
+    """
+    territory = ai.TerritoryScore()
+    score_funcs = [("score_func2", ai.AI.score_func2), ("territory", territory)]
+    positions = random_positions(args.positions, args.rows, args.columns, args.moves, args.seed)
+
+    print("{} positions, {}x{} board".format(len(positions), args.rows, args.columns))
+    print("{:<12} {:>12}".format("heuristic", "us/eval"))
+    for name, score_func in score_funcs:
+        times = []
+        for _ in range(args.iterations):
+            start = time.perf_counter()
+            for game in positions:
+                score_func(game, False, game.active_player)
+            times.append(time.perf_counter() - start)
+        print("{:<12} {:>12.1f}".format(name, 1e6 * min(times) / len(positions)))
+
+    if args.games <= 0:
+        return
+
+    def searcher(score_func):
+        def search(game, player):
+            return ai.AI.timed_abnegamax(game, args.depth, player, score_func, args.time_budget)
+        return search
+
+    print("Territory against score_func2, {} openings x 2 colours, {}s per move:".format(args.games,
+                                                                                      args.time_budget))
+    wins, losses = match_results(searcher(territory), searcher(ai.AI.score_func2), args.rows, args.columns,
+                                 args.games, args.moves, args.seed)
+    print("territory won {} lost {}".format(wins, losses))
+
+
+def solve_endgame(game):
+    """Solve a position by searching every move to the end of the game, the reference for tablebase.py.
+
+    Args:
+        game (board.Board): Game board object, both players must have made their first move.
+
+    Returns:
+        win (bool), distance (int): As tablebase.Tablebase.probe().
+
+    """
+    winner = game.is_game_over()
+    if winner:
+        return winner == game.active_player, 0
+    results = [solve_endgame(game.make_move_copy(*move)) for move in game.get_legal_moves()]
+    win_distances = [distance for win, distance in results if not win]
+    if win_distances:
+        return True, min(win_distances) + 1
+    return False, max(distance for win, distance in results) + 1
+
+
+def plain_territory(game, max_depth=None):
+    """Count the free boxes each player reaches first with a separate breadth first search per
+    player, the reference for ai.TerritoryScore.territory().
+
+    Args:
+        game (board.Board): Game board object, both players must have made their first move.
+        max_depth (int, optional): Only count boxes reached within this many moves.
+
+    Returns:
+        active (int), inactive (int): Boxes reached first by the active and the inactive player.
+
+    """
+    def distances(pos):
+        reached = {pos: 0}
+        frontier = [pos]
+        depth = 0
+        while frontier and (max_depth is None or depth < max_depth):
+            depth += 1
+            next_frontier = []
+            for box in frontier:
+                for move in game.get_moves_from(*box):
+                    if move not in reached:
+                        reached[move] = depth
+                        next_frontier.append(move)
+            frontier = next_frontier
+        del reached[pos]
+        return reached
+
+    active = distances(game.player_pos(game.active_player))
+    inactive = distances(game.player_pos(game.inactive_player))
+    unreached = float("inf")
+    return (sum(depth < inactive.get(box, unreached) for box, depth in active.items()),
+            sum(depth < active.get(box, unreached) for box, depth in inactive.items()))
+
+
+def random_endgames(count, rows, columns, max_free, seed):
+    """Generate positions with at most max_free free boxes and both players placed.
+
+    Args:
+        count (int): Number of positions.
+        rows (int), columns (int): Board dimensions.
+        max_free (int): Maximum number of free boxes.
+        seed (int): Random seed.
+
+    Returns:
+        positions (list): List of board.Board, some of them game over.
+
+    """
+    rng = random.Random(seed)
+    size = rows * columns
+    endgames = []
+    while len(endgames) < count:
+        free = rng.randint(0, max_free)
+        # Place both players, and sometimes move again so either player can be to move
+        moves = rng.randint(2, 3)
+        if free + moves > size:
+            continue
+        game = board.Board(rows, columns)
+        game.gen_random_blocked_boxes(size - free - moves, size - free - moves, rng)
+        for _ in range(moves):
+            legal_moves = game.get_legal_moves()
+            if not legal_moves:
+                break
+            game.make_move(*rng.choice(legal_moves))
+        else:
+            endgames.append(game)
+    return endgames
+
+
+def verify_bounded(args):
+    """Check the memory bounded search returns the same score, move and node count as timed_abnegamax,
+    on the board size and a non square board one column wider.
+
+    Args:
+        args (argparse.Namespace): Command line arguments.
+
+    """
+    checked = 0
+    for rows, columns in ((args.rows, args.columns), (args.rows, args.columns + 1)):
+        bounded_search = bounded.BoundedSearch(rows, columns, args.depth)
+        for moves in (0, 1, 2, 2 * rows, 3 * rows):
+            for game in random_positions(args.positions // 5, rows, columns, moves, args.seed + moves):
+                ai.AI.nodes = 0
+                expected = ai.AI.timed_abnegamax(game, args.depth, game.active_player, ai.AI.score_func2)
+                expected_nodes = ai.AI.nodes
+                ai.AI.nodes = 0
+                result = bounded_search.search(game, args.depth)
+                assert (result, ai.AI.nodes) == (expected, expected_nodes), \
+                    "bounded search {} nodes {}, timed_abnegamax {} nodes {}:\n{}".format(
+                        result, ai.AI.nodes, expected, expected_nodes, game.board_list)
+                checked += 1
+    print("bounded: {} positions agree with timed_abnegamax at depth {}".format(checked, args.depth))
+
+
+def verify_tablebase(args):
+    """Generate a small tablebase and check its values against a full search of every move, and its
+    win / loss against full depth negamax.
+
+    Args:
+        args (argparse.Namespace): Command line arguments.
+
+    """
+    size = args.tablebase_size
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "tablebase.bin")
+        tablebase.generate(filename, size, size, args.tablebase_free, args.jobs, verbose=False)
+        endgames = tablebase.Tablebase(filename)
+        try:
+            for game in random_endgames(args.positions, size, size, args.tablebase_free, args.seed):
+                value = endgames.probe(game)
+                assert value == solve_endgame(game), "tablebase {}, search {}:\n{}".format(
+                    value, solve_endgame(game), game.board_list)
+                score, move = ai.AI.negamax(game, game.num_free_boxes + 1, game.active_player, ai.AI.score_func2)
+                assert value[0] == (score >= ai.AI.MAX_SCORE), "tablebase {}, negamax {}:\n{}".format(
+                    value, score, game.board_list)
+        finally:
+            endgames.close()
+    print("tablebase: {} positions of a {}x{} tablebase up to {} free boxes agree with a full search".format(
+        args.positions, size, size, args.tablebase_free))
+
+
+def verify_territory(args):
+    """Check ai.TerritoryScore counts the same boxes as a separate breadth first search per player.
+
+    Args:
+        args (argparse.Namespace): Command line arguments.
+
+    """
+    checked = 0
+    for max_depth in (None, 1, 2):
+        territory = ai.TerritoryScore(max_depth)
+        for moves in (2, 2 * args.rows, 3 * args.rows):
+            for game in random_positions(args.positions // 3, args.rows, args.columns, moves, args.seed + moves):
+                result = territory.territory(game)
+                expected = plain_territory(game, max_depth)
+                assert result == expected, "territory {}, plain breadth first search {}, max_depth {}:\n{}".format(
+                    result, expected, max_depth, game.board_list)
+                checked += 1
+    print("territory: {} positions agree with a plain breadth first search".format(checked))
+
+
+def verify_positions(args):
+    """Check positions.py writes the same file with one and with several processes, and that its
+    positions are unique and in play.
+
+    Args:
+        args (argparse.Namespace): Command line arguments.
+
+    """
+    count = 20 * args.positions
+    with tempfile.TemporaryDirectory() as directory:
+        for symmetry in (False, True):
+            contents = []
+            for jobs in (1, args.jobs):
+                filename = os.path.join(directory, "positions{}.bin".format(jobs))
+                written = position_files.generate(filename, args.rows, args.columns, count, args.seed, (0.0, 0.2),
+                                                  (2, 12), "random", symmetry, jobs, count // 8, verbose=False)
+                assert written == count, "wrote {} of {} positions".format(written, count)
+                with open(filename, "rb") as input_file:
+                    contents.append(input_file.read())
+            assert contents[0] == contents[1], "--jobs 1 and --jobs {} wrote different files".format(args.jobs)
+
+            games = list(position_files.read_positions(filename))
+            keys = {game.canonical_hash() if symmetry else game.position_hash for game in games}
+            assert len(games) == len(keys) == count, "duplicate positions"
+            assert not any(game.is_game_over() for game in games), "positions not in play"
+    print("positions: {} positions, identical with --jobs 1 and --jobs {}, unique and in play".format(
+        count, args.jobs))
+
+
+# Checks of verify by name
+VERIFY_CHECKS = {"bounded": verify_bounded,
+                 "tablebase": verify_tablebase,
+                 "territory": verify_territory,
+                 "positions": verify_positions}
+
+
+def check_name(name):
+    """Argument type of the verify checks. Not argparse choices, which reject an empty list of positionals.
+
+    Args:
+        name (str): Check name.
+
+    Returns:
+        name (str): A key of VERIFY_CHECKS.
+
+    """
+    if name not in VERIFY_CHECKS:
+        raise argparse.ArgumentTypeError("unknown check {}, expected one of: {}".format(
+            name, ", ".join(sorted(VERIFY_CHECKS))))
+    return name
+
+
+def verify(args):
+    """Run the checks named on the command line, every check by default.
+
+    Args:
+        args (argparse.Namespace): Command line arguments.
+
+    """
+    for name in args.checks:
+        start = time.time()
+        VERIFY_CHECKS[name](args)
+        print("{} checked in {:.1f}s".format(name, time.time() - start))
+
+
+def bench_serialise(args):
+    """Compare the pickle round trip of a board (as used by make_move_copy) with the
+    to_bytes() / from_bytes() encoding and passing boards through shared memory.
+
+    Args:
+        args (argparse.Namespace): Command line arguments.
+
+    """
+    print("{:>6} {:<24} {:>8} {:>12}".format("board", "method", "bytes", "us/round trip"))
+    for size in args.sizes:
+        # A board part way through a game
+        game = random_positions(1, size, size, 2 * size, args.seed)[0]
+        shared = shared_boards.SharedBoards(size, size, 1)
+
+        methods = [("pickle", lambda: pickle.loads(pickle.dumps(game, protocol=pickle.HIGHEST_PROTOCOL)),
+                    len(pickle.dumps(game, protocol=pickle.HIGHEST_PROTOCOL))),
+                   ("to_bytes/from_bytes", lambda: board.Board.from_bytes(game.to_bytes()), len(game.to_bytes())),
+                   ("shared memory", lambda: (shared.write(0, game), shared.read(0)), shared.slot_size)]
+
+        for name, round_trip, num_bytes in methods:
+            copy = round_trip()
+            if isinstance(copy, tuple):
+                copy = copy[1]
+            assert copy == game
+
+            start = time.time()
+            for _ in range(args.iterations):
+                round_trip()
+            elapsed = time.time() - start
+            print("{:>6} {:<24} {:>8} {:>12.1f}".format("{}x{}".format(size, size), name, num_bytes,
+                                                          1e6 * elapsed / args.iterations))
+        shared.close()
+
+
+def bench_startup(args):
+    """Time importing modules in a fresh interpreter, as paid on startup, and check the
+    headless modules do not import Pygame.
+
+    Args:
+        args (argparse.Namespace): Command line arguments.
+
+    """
+    # Each module is imported in a new interpreter so nothing is already cached in sys.modules
+    script = ("import sys, time\n"
+              "start = time.perf_counter()\n"
+              "import {}\n"
+              "print(time.perf_counter() - start, 'pygame' in sys.modules)\n")
+    src_dir = os.path.dirname(os.path.abspath(__file__))
+
+    print("{:<12} {:>10} {:>8}".format("module", "ms", "pygame"))
+    for module in args.modules:
+        times = []
+        for _ in range(args.iterations):
+            output = subprocess.run([sys.executable, "-c", script.format(module)], cwd=src_dir,
+                                    capture_output=True, text=True)
+            if output.returncode:
+                print("{:<12} failed: {}".format(module, output.stderr.strip().splitlines()[-1]))
+                break
+            elapsed, pygame_imported = output.stdout.split()
+            times.append(float(elapsed))
+        else:
+            print("{:<12} {:>10.1f} {:>8}".format(module, 1e3 * min(times), pygame_imported))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AI search benchmarks.")
+    parser.add_argument("--rows", type=int, default=6, help="number of rows in the board")
+    parser.add_argument("--columns", type=int, default=6, help="number of columns in the board")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    selective = subparsers.add_parser("selective", help="late move reductions and futility pruning")
+    selective.add_argument("--positions", type=int, default=20, help="number of random positions")
+    selective.add_argument("--moves", type=int, default=4, help="random moves played per position / opening")
+    selective.add_argument("--depth", type=int, default=4, help="search depth")
+    selective.add_argument("--games", type=int, default=5, help="match openings, 0 to skip the matches")
+    selective.set_defaults(func=bench_selective)
+
+    threats = subparsers.add_parser("threats", help="forced win / loss detection near the end of the game")
+    threats.add_argument("--positions", type=int, default=50, help="number of endgame positions")
+    threats.add_argument("--moves", type=int, default=12, help="random moves played per position")
+    threats.add_argument("--depth", type=int, default=5, help="search depth")
+    threats.set_defaults(func=bench_threats)
+
+    territory = subparsers.add_parser("territory", help="territory heuristic against score_func2")
+    territory.add_argument("--positions", type=int, default=200, help="number of random positions")
+    territory.add_argument("--moves", type=int, default=4, help="random moves played per position / opening")
+    territory.add_argument("--iterations", type=int, default=5,
+                           help="passes over the positions, the fastest is reported")
+    territory.add_argument("--games", type=int, default=10, help="match openings, 0 to skip the matches")
+    territory.add_argument("--depth", type=int, default=20, help="maximum search depth of the matches")
+    territory.add_argument("--time-budget", type=float, default=0.2, help="seconds per move in the matches")
+    territory.set_defaults(func=bench_territory)
+
+    memory = subparsers.add_parser("memory", help="memory use of the bounded search move by move")
+    memory.add_argument("--moves", type=int, default=10, help="moves to play")
+    memory.add_argument("--depth", type=int, default=3, help="search depth")
+    memory.set_defaults(func=bench_memory)
+
+    serialise = subparsers.add_parser("serialise", help="board serialisation for inter-process transfer")
+    serialise.add_argument("--sizes", type=int, nargs="+", default=[5, 16, 32], help="board sizes")
+    serialise.add_argument("--iterations", type=int, default=10000, help="round trips per method")
+    serialise.set_defaults(func=bench_serialise)
+
+    startup = subparsers.add_parser("startup", help="import time of the headless and windowed modules")
+    startup.add_argument("--modules", nargs="+", default=["board", "ai", "controller", "main", "window"],
+                         help="modules to import")
+    startup.add_argument("--iterations", type=int, default=5, help="imports per module, the fastest is reported")
+    startup.set_defaults(func=bench_startup)
+
+    verify_parser = subparsers.add_parser("verify", help="check the optimised implementations against plain ones")
+    verify_parser.add_argument("checks", nargs="*", type=check_name, default=sorted(VERIFY_CHECKS), metavar="CHECK",
+                               help="checks to run, default to all of: {}".format(", ".join(sorted(VERIFY_CHECKS))))
+    verify_parser.add_argument("--positions", type=int, default=100, help="positions per check")
+    verify_parser.add_argument("--depth", type=int, default=3, help="search depth of the bounded search check")
+    verify_parser.add_argument("--tablebase-size", type=int, default=4, help="board size of the tablebase check")
+    verify_parser.add_argument("--tablebase-free", type=int, default=4, help="free boxes of the tablebase check")
+    verify_parser.add_argument("--jobs", type=int, default=4,
+                               help="worker processes, compared with 1 in the positions check")
+    verify_parser.set_defaults(func=verify)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,8 +4,10 @@ Copyright 2018 Mark Mitterdorfer
 Class to implement board state and valid moves.
 """
 
+import itertools
 import random
 import pickle
+import struct
 
 
 class Board(object):
@@ -23,6 +25,10 @@ class Board(object):
         __players_position (dict): Private dict of players position, key corresponds to player.
         player1_pos (property, tuple): (X, Y) location of player 1. Can be None if game just started.
         player2_pos (property, tuple): (X, Y) location of player 2. Can be None if game just started.
+        __free (set): Private set of board list offsets of all free i.e. non-blocked boxes.
+        num_free_boxes (property, int): Number of free boxes.
+        __hash (int): Private Zobrist hash of the position, updated as moves are made.
+        position_hash (property, int): ""
     """
 
     # Board/box states, must be unique and in powers of 2 (bit masking)
@@ -32,11 +38,22 @@ class Board(object):
     BOX_BLOCK = 8
     BOX_BLOCKED_MASK = 16  # Leave blocked as the last entry of block states and the highest
 
+    # to_bytes() header: rows, columns, player1 x, y, player2 x, y, active player, position hash
+    HEADER = struct.Struct("<BBbbbbBQ")
+
+    # Zobrist hash keys per board dimensions, (rows, columns) -> (blocked, player1, player2, player2_to_move)
+    __zobrist_tables = {}
+
+    # Box offset permutations of the board symmetries per board dimensions, see __symmetry_table()
+    __symmetry_tables = {}
+
     def __init__(self, rows, columns):
         self.rows = rows
         self.columns = columns
 
         self.__board = []
+        self.__free = set()
+        self.__hash = 0
         self.__active_player = Board.PLAYER1
         self.__inactive_player = Board.PLAYER2
 
@@ -53,26 +70,218 @@ class Board(object):
         """
         return self.__dict__ == other.__dict__
 
+    @staticmethod
+    def packed_size(rows, columns):
+        """Obtain the size of the to_bytes() encoding of a board.
+
+        Args:
+            rows (int): Number of rows in the board.
+            columns (int): Number of columns in the board.
+
+        Returns:
+            (int): Size in bytes.
+
+        """
+        return Board.HEADER.size + rows * columns
+
+    def to_bytes(self, buffer=None, offset=0):
+        """Encode the board in a compact fixed layout: HEADER followed by one byte per box.
+        HEADER is (rows, columns, player1 x, player1 y, player2 x, player2 y, active player,
+        position hash), a player position is (-1, -1) if the player has not moved yet.
+
+        Args:
+            buffer (writable buffer, optional): Encode in to this buffer (e.g. a bytearray or
+                shared memory) at offset instead of returning new bytes.
+            offset (int, optional): Offset in to buffer.
+
+        Returns:
+            data (bytes): The encoding, or None if buffer was given.
+
+        """
+        player1_pos = self.__players_position[Board.PLAYER1] or (-1, -1)
+        player2_pos = self.__players_position[Board.PLAYER2] or (-1, -1)
+        header = (self.rows, self.columns) + tuple(player1_pos) + tuple(player2_pos) + (self.__active_player,
+                                                                                       self.__hash)
+
+        if buffer is None:
+            return Board.HEADER.pack(*header) + bytes(self.__board)
+
+        Board.HEADER.pack_into(buffer, offset, *header)
+        start = offset + Board.HEADER.size
+        buffer[start:start + len(self.__board)] = bytes(self.__board)
+        return None
+
+    @staticmethod
+    def from_bytes(data, offset=0):
+        """Decode a board encoded by to_bytes().
+
+        Args:
+            data (buffer): bytes, bytearray, memoryview or shared memory buffer.
+            offset (int, optional): Offset in to data.
+
+        Returns:
+            board (Board): Board object with the encoded state.
+
+        """
+        (rows, columns, player1_x, player1_y, player2_x, player2_y,
+         active_player, position_hash) = Board.HEADER.unpack_from(data, offset)
+        start = offset + Board.HEADER.size
+        size = rows * columns
+
+        # Bypass __init__, every attribute is set from the encoding
+        board = Board.__new__(Board)
+        board.rows = rows
+        board.columns = columns
+        board.__board = list(data[start:start + size])
+        board.__free = set(itertools.compress(range(size), map(Board.BOX_CLEAR.__eq__, board.__board)))
+        board.__hash = position_hash
+        board.__active_player = active_player
+        board.__inactive_player = Board.PLAYER2 if active_player == Board.PLAYER1 else Board.PLAYER1
+        board.__players_position = {Board.PLAYER1: (player1_x, player1_y) if player1_x >= 0 else None,
+                                    Board.PLAYER2: (player2_x, player2_y) if player2_x >= 0 else None}
+        return board
+
+    def __rehash(self):
+        """Compute the Zobrist hash of the position from scratch.
+
+        """
+        blocked, player1, player2, player2_to_move = self.__zobrist_table()
+        self.__hash = 0
+        for offset, box in enumerate(self.__board):
+            if box & Board.BOX_BLOCKED_MASK:
+                self.__hash ^= blocked[offset]
+        for player, keys in ((Board.PLAYER1, player1), (Board.PLAYER2, player2)):
+            if self.__players_position[player] is not None:
+                self.__hash ^= keys[self.offset(*self.__players_position[player])]
+        if self.__active_player == Board.PLAYER2:
+            self.__hash ^= player2_to_move
+
     def clear_board(self):
         """Clear the game board list.
 
         """
         self.__board = [Board.BOX_CLEAR for _ in range(self.rows * self.columns)]
+        self.__free = set(range(self.rows * self.columns))
+        # Only blocked boxes, player positions and the player to move affect play
+        self.__rehash()
+
+    def __zobrist_table(self):
+        """Obtain the Zobrist hash keys for the board dimensions, the same in every process.
+
+        Returns:
+            blocked (list), player1 (list), player2 (list), player2_to_move (int): 64 bit keys
+            per box for a blocked box and each players position, and a key for player 2 to move.
+
+        """
+        key = (self.rows, self.columns)
+        table = Board.__zobrist_tables.get(key)
+        if table is None:
+            # Seed from the dimensions so every process generates the same keys
+            rng = random.Random(self.rows * 1000 + self.columns)
+            size = self.rows * self.columns
+            table = ([rng.getrandbits(64) for _ in range(size)],
+                     [rng.getrandbits(64) for _ in range(size)],
+                     [rng.getrandbits(64) for _ in range(size)],
+                     rng.getrandbits(64))
+            Board.__zobrist_tables[key] = table
+        return table
+
+    def __symmetry_table(self):
+        """Obtain the box offset permutations of the board symmetries for the board dimensions:
+        the reflections, and on square boards the rotations and diagonal reflections too.
+
+        Returns:
+            permutations (list): List per symmetry of the transformed offset per box offset,
+            the identity first.
+
+        """
+        key = (self.rows, self.columns)
+        permutations = Board.__symmetry_tables.get(key)
+        if permutations is None:
+            permutations = []
+            for transpose, flip_x, flip_y in itertools.product((False, True), repeat=3):
+                if transpose and self.rows != self.columns:
+                    continue
+                permutation = []
+                for offset in range(self.rows * self.columns):
+                    x, y = offset % self.columns, offset // self.columns
+                    if flip_x:
+                        x = self.columns - 1 - x
+                    if flip_y:
+                        y = self.rows - 1 - y
+                    if transpose:
+                        x, y = y, x
+                    permutation.append(self.offset(x, y))
+                permutations.append(permutation)
+            Board.__symmetry_tables[key] = permutations
+        return permutations
+
+    def canonical_hash(self):
+        """Obtain a hash of the position that is the same for all its symmetric positions, see
+        __symmetry_table(). Symmetric positions play the same, so e.g. only one of them needs
+        to be stored in a data set.
 
-    def gen_random_blocked_boxes(self, min, max):
-        """Generate random blocked boxes.
+        Returns:
+            (int): The smallest position_hash of the symmetric positions.
+
+        """
+        blocked, player1, player2, player2_to_move = self.__zobrist_table()
+        blocked_offsets = [offset for offset, box in enumerate(self.__board) if box & Board.BOX_BLOCKED_MASK]
+        players = [(keys, self.offset(*self.__players_position[player]))
+                   for player, keys in ((Board.PLAYER1, player1), (Board.PLAYER2, player2))
+                   if self.__players_position[player] is not None]
+
+        best = None
+        for permutation in self.__symmetry_table():
+            position_hash = player2_to_move if self.__active_player == Board.PLAYER2 else 0
+            for offset in blocked_offsets:
+                position_hash ^= blocked[permutation[offset]]
+            for keys, offset in players:
+                position_hash ^= keys[permutation[offset]]
+            if best is None or position_hash < best:
+                best = position_hash
+        return best
+
+    def gen_random_blocked_boxes(self, min, max, rng=None):
+        """Generate random blocked boxes, each on a different free box.
 
         Args:
             min (int): Minimum bound of blocked boxes.
-            max (int): Maximum bound of blocked boxes.
+            max (int): Maximum bound of blocked boxes, at most all free boxes are blocked.
+            rng (random.Random, optional): Random number generator, e.g. seeded to generate the same
+                boxes again. Default to the random module.
 
         """
+        rng = rng or random
         # Number of blocked boxes in random range of [min, max]
-        num = random.randint(min, max)
+        num = rng.randint(min, max)
+
+        # Sorted, so a seeded rng picks the same boxes whatever the set order
+        free = sorted(self.__free)
+        for pos in rng.sample(free, num if num < len(free) else len(free)):
+            self.__block_box(pos % self.columns, pos // self.columns, Board.BOX_BLOCK)
+
+    def get_blocked_boxes(self):
+        """Return a list containing a tuple of (X, Y) coordinates of all boxes blocked
+        by the board itself, i.e. not by a player. Use this to record the starting board.
 
-        for _ in range(num):
-            pos = random.randint(0, self.columns * self.rows - 1)
-            self.__board[pos] = Board.BOX_BLOCK | Board.BOX_BLOCKED_MASK
+        Returns:
+            boxes (list): List of tuples (X, Y) containing all board blocked boxes.
+
+        """
+        blocked = Board.BOX_BLOCK | Board.BOX_BLOCKED_MASK
+        return [(offset % self.columns, offset // self.columns)
+                for offset, box in enumerate(self.__board) if box == blocked]
+
+    def set_blocked_boxes(self, boxes):
+        """Block boxes on the board, e.g. to restore a starting board from get_blocked_boxes().
+
+        Args:
+            boxes (iterable): Tuples (X, Y) of the boxes to block.
+
+        """
+        for x, y in boxes:
+            self.__block_box(x, y, Board.BOX_BLOCK)
 
     @property
     def active_player(self):
@@ -86,6 +295,14 @@ class Board(object):
     def board_list(self):
         return self.__board
 
+    @property
+    def num_free_boxes(self):
+        return len(self.__free)
+
+    @property
+    def position_hash(self):
+        return self.__hash
+
     def player_pos(self, player):
         """Obtain the position for "player".
 
@@ -139,23 +356,24 @@ class Board(object):
             board_state (int): State to block, i.e. PLAYER1, PLAYER2 etc.
 
         """
-        self.__board[self.offset(x, y)] = board_state | Board.BOX_BLOCKED_MASK
+        offset = self.offset(x, y)
+        if offset in self.__free:
+            self.__hash ^= self.__zobrist_table()[0][offset]
+        self.__board[offset] = board_state | Board.BOX_BLOCKED_MASK
+        self.__free.discard(offset)
 
     def get_free_boxes(self):
         """Return a list containing a tuple of (X, Y) coordinates of all free
-        i.e. non-blocked boxes in the board.
+        i.e. non-blocked boxes in the board, ordered by row then column.
+        The free boxes are maintained as moves are made, so this is O(free) rather than
+        O(rows * columns).
 
         Returns:
             moves (list): List of tuples (X, Y) containing all free boxes.
 
         """
-        moves = []
-        for y in range(self.rows):
-            for x in range(self.columns):
-                if not self.box_blocked(x, y):
-                    moves.append((x, y))
-
-        return moves
+        columns = self.columns
+        return [(offset % columns, offset // columns) for offset in sorted(self.__free)]
 
     def get_legal_moves(self, player=None):
         """Return a list of all legal moves for the a player.
@@ -177,6 +395,18 @@ class Board(object):
         if not loc:
             return self.get_free_boxes()
 
+        return self.get_moves_from(*loc)
+
+    def get_moves_from(self, x, y):
+        """Return a list of all moves a player positioned at (x, y) could make.
+
+        Args:
+            x (int): X box coordinate.
+            y (int): Y box coordinate.
+
+        Returns:
+            moves (list): List of tuples (X, Y) with coordinates of valid moves.
+        """
         # Define the directional deltas which span out in
         # 8 directions from any position in the grid
         dirs_deltas = [(-1, -1), (+0, -1), (+1, -1), (+1, +0),
@@ -185,15 +415,15 @@ class Board(object):
         moves = []
         for dx, dy in dirs_deltas:
             # Explore all possible directional deltas from the starting position
-            x, y = loc
-            while (0 <= (x + dx) < self.columns) and (0 <= (y + dy) < self.rows):
-                x += dx
-                y += dy
+            move_x, move_y = x, y
+            while (0 <= (move_x + dx) < self.columns) and (0 <= (move_y + dy) < self.rows):
+                move_x += dx
+                move_y += dy
                 # If any square is blocked in the directional delta
                 # then break out of this one and explore the next directional delta
-                if self.box_blocked(x, y):
+                if self.box_blocked(move_x, move_y):
                     break
-                moves.append((x, y))
+                moves.append((move_x, move_y))
 
         return moves
 
@@ -210,6 +440,14 @@ class Board(object):
         # assert the box we are moving to is not blocked
         assert not self.box_blocked(x, y)
 
+        # Move the players position in the hash
+        blocked, player1, player2, player2_to_move = self.__zobrist_table()
+        keys = player1 if self.__active_player == Board.PLAYER1 else player2
+        old_pos = self.__players_position[self.__active_player]
+        if old_pos is not None:
+            self.__hash ^= keys[self.offset(*old_pos)]
+        self.__hash ^= keys[self.offset(x, y)] ^ player2_to_move
+
         # Make the move to the new position and block it
         self.__players_position[self.__active_player] = (x, y)
         self.__block_box(x, y, self.__active_player)
@@ -235,21 +473,7 @@ class Board(object):
             board_copy (Board): Board object with new state applied.
         """
         board_copy = pickle.loads(pickle.dumps(self, protocol=pickle.HIGHEST_PROTOCOL))
-
-        # assert the box we are moving to is not blocked
-        assert not board_copy.box_blocked(x, y)
-
-        # Make the move to the new position and block it
-        board_copy.__players_position[board_copy.__active_player] = (x, y)
-        board_copy.__block_box(x, y, board_copy.__active_player)
-
-        # Switch the player
-        if board_copy.__active_player == Board.PLAYER1:
-            board_copy.__active_player = Board.PLAYER2
-            board_copy.__inactive_player = Board.PLAYER1
-        else:
-            board_copy.__active_player = Board.PLAYER1
-            board_copy.__inactive_player = Board.PLAYER2
+        board_copy.make_move(x, y)
 
         return board_copy
 
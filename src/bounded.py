@@ -0,0 +1,316 @@
+"""Memory bounded search.
+Copyright 2018 Mark Mitterdorfer
+
+Class to run the AI search in a fixed amount of memory, for deep endgames on large boards.
+The position is held in flat buffers which are changed in place by making and unmaking
+moves, and the moves of each ply are generated in to buffers preallocated for the maximum
+depth, so no board objects or move lists are allocated per node. The garbage collector is
+disabled while searching.
+"""
+
+import gc
+import sys
+import time
+
+import ai
+
+# Preallocate for at least this depth, so the buffers are rarely reallocated for deeper searches
+MIN_DEPTH = 16
+
+NEG_INF = float("-inf")
+POS_INF = float("inf")
+
+
+class BoundedSearch(object):
+    """Iterative deepening abnegamax as ai.AI.timed_abnegamax with the ai.AI.score_func2 mobility
+    heuristic, searching in buffers preallocated for one board size and maximum depth. Plays the
+    same moves as ai.AI.timed_abnegamax(board, depth, player, ai.AI.score_func2, time_budget).
+
+    Attributes:
+        rows (int): Number of rows in the board.
+        columns (int): Number of columns in the board.
+        max_depth (int): Maximum search depth.
+        allocated_blocks (int): Change in the number of memory blocks allocated by the interpreter
+            over the last search, see sys.getallocatedblocks(). Stays flat from move to move.
+        gc_objects (int): Net number of objects tracked by the garbage collector allocated over the
+            last search, see gc.get_count().
+        __rays (list): Private, per box the tuples of box offsets in each direction, in the order of
+            board.Board.get_moves_from().
+        __board_order (tuple): Private box offsets in board order.
+        __first_moves (tuple): Private box offsets ordered by distance to the centre, for first moves.
+        __blocked (bytearray): Private, 1 per blocked box.
+        __positions (list): Private box offset by player, -1 if the player has not moved yet.
+        __active (int): Private active player.
+        __player (int): Private player searched for, the active player at the root.
+        __free (int): Private number of free boxes.
+        __moves (list): Private preallocated move buffer per ply.
+        __best_box (int): Private best root move of the last depth searched.
+    """
+
+    def __init__(self, rows, columns, max_depth=MIN_DEPTH):
+        self.rows = rows
+        self.columns = columns
+        self.max_depth = max_depth
+        self.allocated_blocks = 0
+        self.gc_objects = 0
+
+        size = rows * columns
+        dirs_deltas = [(-1, -1), (+0, -1), (+1, -1), (+1, +0),
+                       (+1, +1), (+0, +1), (-1, +1), (-1, +0)]
+        self.__rays = []
+        for offset in range(size):
+            x, y = offset % columns, offset // columns
+            rays = []
+            for dx, dy in dirs_deltas:
+                ray = []
+                move_x, move_y = x + dx, y + dy
+                while 0 <= move_x < columns and 0 <= move_y < rows:
+                    ray.append(move_x + move_y * columns)
+                    move_x += dx
+                    move_y += dy
+                if ray:
+                    rays.append(tuple(ray))
+            self.__rays.append(tuple(rays))
+
+        # As ai.AI.search_moves(), a stable sort keeps boxes at the same distance in board order
+        centre = columns // 2, rows // 2
+        self.__board_order = tuple(range(size))
+        self.__first_moves = tuple(sorted(self.__board_order, key=lambda offset: ai.AI.manhattan_distance(
+            offset % columns, offset // columns, *centre)))
+
+        capacity = max(max(sum(len(ray) for ray in rays) for rays in self.__rays), min(size, ai.AI.FIRST_MOVE_LIMIT))
+        self.__moves = [[0] * capacity for _ in range(max_depth + 1)]
+        self.__blocked = bytearray(size)
+        self.__positions = [-1, -1, -1]
+        # Player 1 moves first
+        self.__active = 1
+        self.__player = 1
+        self.__free = size
+        self.__best_box = -1
+
+    def __load(self, board):
+        """Copy a board in to the buffers.
+
+        Args:
+            board (board.Board): Game board object.
+
+        """
+        assert board.rows == self.rows and board.columns == self.columns
+        blocked_mask = board.BOX_BLOCKED_MASK
+        for offset, box in enumerate(board.board_list):
+            self.__blocked[offset] = 1 if box & blocked_mask else 0
+        for player in (board.PLAYER1, board.PLAYER2):
+            pos = board.player_pos(player)
+            self.__positions[player] = board.offset(*pos) if pos else -1
+        self.__active = board.active_player
+        self.__player = board.active_player
+        self.__free = board.num_free_boxes
+
+    def __generate(self, player, moves):
+        """Generate the moves to search for a player in to a move buffer, as ai.AI.search_moves().
+
+        Args:
+            player (int): Player to move.
+            moves (list): Move buffer.
+
+        Returns:
+            count (int): Number of moves in the buffer.
+
+        """
+        blocked = self.__blocked
+        count = 0
+        pos = self.__positions[player]
+        if pos < 0:
+            limit = ai.AI.FIRST_MOVE_LIMIT
+            # All free boxes in board order, unless there are more than the limit
+            order = self.__first_moves if self.__free > limit else self.__board_order
+            for offset in order:
+                if not blocked[offset]:
+                    moves[count] = offset
+                    count += 1
+                    if count == limit:
+                        break
+            return count
+
+        for ray in self.__rays[pos]:
+            for offset in ray:
+                if blocked[offset]:
+                    break
+                moves[count] = offset
+                count += 1
+        return count
+
+    def __mobility(self, player):
+        """Count the legal moves of a player, as len(board.Board.get_legal_moves(player)).
+
+        Args:
+            player (int): Player.
+
+        Returns:
+            count (int): Number of legal moves.
+
+        """
+        pos = self.__positions[player]
+        if pos < 0:
+            return self.__free
+
+        blocked = self.__blocked
+        count = 0
+        for ray in self.__rays[pos]:
+            for offset in ray:
+                if blocked[offset]:
+                    break
+                count += 1
+        return count
+
+    def __abnegamax(self, depth, alpha, beta, ply):
+        """ai.AI.abnegamax() with ai.AI.score_func2 on the buffers, making and unmaking moves in place.
+
+        Args:
+            depth (int): The remaining search depth.
+            alpha (int): Lower bound.
+            beta (int): Upper bound.
+            ply (int): Distance from the root of the search, indexes the move buffer.
+
+        Returns:
+            best_score (int): Best score for the active player, the best root move is kept in __best_box.
+
+        """
+        ai.AI.nodes += 1
+        if ai.AI.deadline is not None and time.time() > ai.AI.deadline:
+            raise ai.SearchTimeout()
+
+        active = self.__active
+        inactive = 3 - active
+        moves = self.__moves[ply]
+        count = self.__generate(active, moves)
+
+        # Game over as board.Board.is_game_over(), checking the active player first
+        if not count:
+            return -ai.AI.MAX_SCORE
+        opponent_mobility = self.__mobility(inactive)
+        if not opponent_mobility:
+            return ai.AI.MAX_SCORE
+        if depth == 0:
+            mobility = count if self.__positions[active] >= 0 else self.__free
+            # As ai.AI.abnegamax(), signed by the player searched for rather than the active player
+            if active == self.__player:
+                return mobility - opponent_mobility
+            return opponent_mobility - mobility
+
+        positions = self.__positions
+        blocked = self.__blocked
+        old_pos = positions[active]
+        best_score = NEG_INF
+        for index in range(count):
+            offset = moves[index]
+            # Make the move
+            positions[active] = offset
+            blocked[offset] = 1
+            self.__free -= 1
+            self.__active = inactive
+
+            current_score = -self.__abnegamax(depth - 1, -beta, -alpha, ply + 1)
+
+            # Unmake the move
+            self.__active = active
+            self.__free += 1
+            blocked[offset] = 0
+            positions[active] = old_pos
+
+            if current_score > best_score:
+                best_score = current_score
+                if ply == 0:
+                    self.__best_box = offset
+                    ai.AI.root_best = (best_score, (offset % self.columns, offset // self.columns))
+
+            if current_score > alpha:
+                alpha = current_score
+            if alpha >= beta:
+                break
+
+        return best_score
+
+    def search(self, board, depth, time_budget=None, optimistic=True):
+        """Search the active player's best move as ai.AI.timed_abnegamax() with ai.AI.score_func2.
+        Updates allocated_blocks and gc_objects.
+
+        Args:
+            board (board.Board): Game board object, not changed.
+            depth (int): The maximum search depth, at most max_depth.
+            time_budget (float, optional): Seconds to search for, None for no limit.
+            optimistic (bool, optional): Fall back to a shallower non losing score.
+
+        Returns:
+            best_score (int), best_move (int, int): Best score and associated move for the active player.
+
+        """
+        assert depth <= self.max_depth
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        blocks = sys.getallocatedblocks()
+        gc_count = gc.get_count()[0]
+
+        # One (score, box) per depth
+        results = []
+        try:
+            ai.AI.deadline = time.time() + time_budget if time_budget is not None else None
+            self.__load(board)
+            try:
+                for i_depth in range(1, depth + 1):
+                    results.append((self.__abnegamax(i_depth, NEG_INF, POS_INF, 0), self.__best_box))
+                    # Game decided, searching deeper will not change the outcome
+                    if results[-1][0] >= ai.AI.MAX_SCORE:
+                        break
+            except ai.SearchTimeout:
+                pass
+            finally:
+                ai.AI.deadline = None
+
+            # Always complete depth 1 so there is a move to play, a timeout leaves moves made in the buffers
+            if not results:
+                self.__load(board)
+                results.append((self.__abnegamax(1, NEG_INF, POS_INF, 0), self.__best_box))
+
+            best_score, best_box = results[-1]
+            if optimistic and best_score <= -ai.AI.MAX_SCORE:
+                for score, box in reversed(results[:-1]):
+                    if score > -ai.AI.MAX_SCORE:
+                        best_score, best_box = score, box
+                        break
+
+            self.gc_objects = gc.get_count()[0] - gc_count
+            self.allocated_blocks = sys.getallocatedblocks() - blocks
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+        return best_score, (best_box % self.columns, best_box // self.columns)
+
+
+# Searches of this process by board dimensions, so the buffers are allocated once
+_searches = {}
+
+
+def bounded_abnegamax(board, depth, player, time_budget=None, optimistic=True):
+    """Search with a BoundedSearch for the board dimensions, reused by later calls in the same
+    process. Call as ai.AI.timed_abnegamax() with ai.AI.score_func2, e.g. in search_worker.SearchWorker.
+
+    Args:
+        board (board.Board): Game board object.
+        depth (int): The maximum search depth.
+        player (int): Player to search for, must be the active player.
+        time_budget (float, optional): Seconds to search for, None for no limit.
+        optimistic (bool, optional): Fall back to a shallower non losing score.
+
+    Returns:
+        best_score (int), best_move (int, int): Best score and associated move for "player".
+
+    """
+    assert player == board.active_player
+    key = (board.rows, board.columns)
+    search = _searches.get(key)
+    if search is None or search.max_depth < depth:
+        search = BoundedSearch(board.rows, board.columns, max(depth, MIN_DEPTH))
+        _searches[key] = search
+    return search.search(board, depth, time_budget, optimistic)
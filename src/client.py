@@ -0,0 +1,181 @@
+"""Game server client.
+Copyright 2018 Mark Mitterdorfer
+
+Asyncio client for server.py. Run e.g.:
+
+    python server.py &
+    python client.py --games 16
+
+to play concurrent AI vs. AI games on the server, or with --local to start a server in
+this process on a free port first, so nothing else needs to be running.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import time
+
+import players
+import server
+
+
+class Client(object):
+    """Connection to a game server. Requests can be made concurrently, responses are
+    matched to requests by id.
+
+    Attributes:
+        __reader (asyncio.StreamReader): Private connection reader.
+        __writer (asyncio.StreamWriter): Private connection writer.
+        __pending (dict): Private, futures of requests in flight by id.
+        __ids (itertools.count): Private request id counter.
+        __receiver (asyncio.Task): Private task dispatching responses.
+    """
+
+    def __init__(self, reader, writer):
+        self.__reader = reader
+        self.__writer = writer
+        self.__pending = {}
+        self.__ids = itertools.count(1)
+        self.__receiver = asyncio.ensure_future(self.__receive())
+
+    @staticmethod
+    async def connect(host="127.0.0.1", port=8765):
+        """Connect to a game server.
+
+        Args:
+            host (str, optional): Server address.
+            port (int, optional): Server port.
+
+        Returns:
+            client (Client): Connected client.
+
+        """
+        reader, writer = await asyncio.open_connection(host, port)
+        return Client(reader, writer)
+
+    async def __receive(self):
+        """Resolve the futures of requests as their responses arrive.
+
+        """
+        try:
+            while True:
+                line = await self.__reader.readline()
+                if not line:
+                    break
+                response = json.loads(line)
+                future = self.__pending.pop(response.pop("id", None), None)
+                if future is not None and not future.done():
+                    future.set_result(response)
+        finally:
+            for future in self.__pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("connection to the server closed"))
+
+    async def request(self, cmd, **fields):
+        """Make a request and wait for its response.
+
+        Args:
+            cmd (str): Command, see server.py.
+            **fields: Request fields.
+
+        Returns:
+            response (dict): Server response.
+
+        Raises:
+            RuntimeError: The server responded with an error.
+
+        """
+        request_id = next(self.__ids)
+        future = asyncio.get_running_loop().create_future()
+        self.__pending[request_id] = future
+        self.__writer.write(json.dumps(dict(fields, id=request_id, cmd=cmd)).encode() + b"\n")
+        await self.__writer.drain()
+
+        response = await future
+        if "error" in response:
+            raise RuntimeError(response["error"])
+        return response
+
+    async def close(self):
+        """Close the connection.
+
+        """
+        self.__writer.close()
+        await self.__writer.wait_closed()
+        self.__receiver.cancel()
+
+
+async def play_game(client, rows, columns, player1, player2):
+    """Play an AI vs. AI game on the server.
+
+    Args:
+        client (Client): Connected client.
+        rows (int), columns (int): Board dimensions.
+        player1 (str or dict), player2 (str or dict): Player settings, see players.create_player().
+
+    Returns:
+        game_id (int), winner (int), ply (int): Game id, winning player and number of moves.
+
+    """
+    state = await client.request("new", rows=rows, columns=columns, player1=player1, player2=player2)
+    state = await client.request("advance", game=state["game"])
+    await client.request("close", game=state["game"])
+    return state["game"], state["winner"], state["ply"]
+
+
+async def run(args):
+    """Play args.games concurrent games over one connection and report the results.
+
+    Args:
+        args (argparse.Namespace): Command line arguments.
+
+    """
+    game_server = None
+    port = args.port
+    if args.local:
+        game_server = server.GameServer(args.jobs)
+        local = await game_server.start(args.host, 0)
+        port = local.sockets[0].getsockname()[1]
+
+    client = await Client.connect(args.host, port)
+    player1 = {"type": args.player1, "depth": args.depth}
+    player2 = {"type": args.player2, "depth": args.depth}
+
+    start = time.time()
+    results = await asyncio.gather(*[play_game(client, args.rows, args.columns, player1, player2)
+                                     for _ in range(args.games)])
+    elapsed = time.time() - start
+
+    for game_id, winner, ply in results:
+        print("Game", game_id, "player", winner, "wins after", ply, "moves")
+    wins = sum(winner == 1 for game_id, winner, ply in results)
+    print("Player 1 won {}/{} games, time: {:.2f}".format(wins, len(results), elapsed))
+
+    await client.close()
+    if game_server is not None:
+        local.close()
+        await local.wait_closed()
+        game_server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play AI vs. AI games on a game server.")
+    parser.add_argument("--host", default="127.0.0.1", help="server address")
+    parser.add_argument("--port", type=int, default=8765, help="server port")
+    parser.add_argument("--local", action="store_true", help="start a server in this process on a free port")
+    parser.add_argument("--jobs", type=int, default=None, help="search processes of the --local server")
+    parser.add_argument("--games", type=int, default=8, help="number of concurrent games")
+    parser.add_argument("--rows", type=int, default=5, help="number of rows in the board")
+    parser.add_argument("--columns", type=int, default=5, help="number of columns in the board")
+    ai_players = sorted(name for name, player in players.PLAYERS.items() if not player.is_human)
+    parser.add_argument("--player1", choices=ai_players, default="abnegamax", help="player 1")
+    parser.add_argument("--player2", choices=ai_players, default="abnegamax", help="player 2")
+    parser.add_argument("--depth", type=int, default=4, help="search depth of fixed depth AI players")
+    args = parser.parse_args()
+
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
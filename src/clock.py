@@ -0,0 +1,197 @@
+"""Game clock time management.
+Copyright 2018 Mark Mitterdorfer
+
+Classes to play a game on a clock: each player has a total time for the game and an
+increment added after every move. The time of a move is planned from the number of free
+boxes and the root branching factor, and while searching the iterative deepening stops
+early when the best move is stable, or searches longer when it changes between depths.
+"""
+
+import ai
+
+
+class StopCondition(object):
+    """Decide after each completed depth of ai.AI.timed_abnegamax() whether to search deeper,
+    pass as its stop_func. Picklable so it can be sent with the search to another process,
+    use a new instance per search.
+
+    Attributes:
+        target (float): Planned seconds for the move.
+        maximum (float): Most seconds the move may take, the time budget of the search.
+        STABLE_DEPTHS (int): Number of depths with the same best move for it to be stable.
+        STABLE_SHARE (float): Share of the target to search for once the best move is stable.
+        UNSTABLE_EXTENSION (float): Target multiplier when the best move or score changed at the last depth.
+        score_swing (int): Score change between depths counted as unstable, None to only count best move
+            changes and games becoming won or lost, e.g. for heuristics not scoring in mobility units.
+        SCORE_SWING (int): Default score_swing, in mobility (score_func2) units.
+        GROWTH (float): Estimated ratio of the time of a depth to the time of the previous depth,
+            until two depths have been timed.
+        __searched (float): Private seconds searched at the previous check.
+        __iteration (float): Private seconds the previous depth took.
+    """
+
+    STABLE_DEPTHS = 3
+    STABLE_SHARE = 0.5
+    UNSTABLE_EXTENSION = 2.0
+    SCORE_SWING = 3
+    GROWTH = 4.0
+
+    def __init__(self, target, maximum, score_swing=SCORE_SWING):
+        self.target = target
+        self.maximum = maximum
+        self.score_swing = score_swing
+        self.__searched = 0.0
+        self.__iteration = 0.0
+
+    def __call__(self, results, elapsed):
+        """Check whether to stop the search after a completed depth.
+
+        Args:
+            results (list): (best_score, best_move) per completed depth, the last is the deepest.
+            elapsed (float): Seconds searched so far.
+
+        Returns:
+            True to stop, False to search the next depth.
+
+        """
+        iteration = elapsed - self.__searched
+        growth = StopCondition.GROWTH
+        if self.__iteration > 0.0:
+            growth = min(max(iteration / self.__iteration, 1.5), 10.0)
+        self.__searched = elapsed
+        self.__iteration = iteration
+
+        budget = self.target
+        if len(results) >= 2:
+            (last_score, last_move), (score, move) = results[-2:]
+            decided = score != last_score and ai.AI.MAX_SCORE in (abs(score), abs(last_score))
+            swing = self.score_swing is not None and abs(score - last_score) >= self.score_swing
+            if move != last_move or decided or swing:
+                budget = min(self.target * StopCondition.UNSTABLE_EXTENSION, self.maximum)
+            elif len(results) > StopCondition.STABLE_DEPTHS and all(
+                    stable_move == move for _, stable_move in results[-StopCondition.STABLE_DEPTHS - 1:]):
+                budget = self.target * StopCondition.STABLE_SHARE
+
+        # A depth the deadline interrupts is thrown away, so only start one that is expected to complete
+        return elapsed + iteration * growth > budget
+
+
+class TimeManager(object):
+    """Clock of one player, plans the time of each move and logs planned vs. actual time.
+
+    Attributes:
+        total (float): Seconds for the whole game.
+        increment (float): Seconds added after every move.
+        remaining (float): Seconds left on the clock, negative once the time is exceeded.
+        log (list): Dict per move with the move number, free boxes, root branching factor, planned
+            and maximum seconds, actual seconds and the seconds remaining after the move.
+        MIN_MOVES_LEFT (int): Fewest own moves assumed left in the game.
+        MAX_MOVES_LEFT (int): Most own moves assumed left in the game, games on large boards end
+            long before the board fills up.
+        BRANCHING_SCALE (list): (max_branching, scale) target multiplier by root branching factor,
+            less time for wide positions like the opening, more for narrow critical ones.
+        MAX_FACTOR (float): Most a move may take as a multiple of its target.
+        MAX_SHARE (float): Most a move may take as a share of the remaining time.
+        MIN_TIME (float): Least seconds planned for a move.
+        __plan (dict): Private plan of the move being searched, logged by update().
+    """
+
+    MIN_MOVES_LEFT = 4
+    MAX_MOVES_LEFT = 25
+
+    BRANCHING_SCALE = [(1, 0.0),
+                       (8, 1.5),
+                       (16, 1.0),
+                       (32, 0.6)]
+
+    MAX_FACTOR = 3.0
+    MAX_SHARE = 0.5
+    MIN_TIME = 0.01
+
+    def __init__(self, total, increment=0.0):
+        self.total = total
+        self.increment = increment
+        self.remaining = total
+        self.log = []
+        self.__plan = None
+
+    def plan(self, game):
+        """Plan the time of the active player's move.
+
+        Args:
+            game (board.Board): Game board object.
+
+        Returns:
+            target (float), maximum (float): Planned and most seconds for the move.
+
+        """
+        free = game.num_free_boxes
+        branching = len(ai.AI.search_moves(game))
+        # Every move fills a box, so each player has at most half the free boxes left to move to
+        moves_left = min(max(free // 2, TimeManager.MIN_MOVES_LEFT), TimeManager.MAX_MOVES_LEFT)
+        remaining = max(self.remaining, 0.0)
+
+        scale = TimeManager.BRANCHING_SCALE[-1][1]
+        for max_branching, branching_scale in TimeManager.BRANCHING_SCALE:
+            if branching <= max_branching:
+                scale = branching_scale
+                break
+
+        maximum = max(remaining * TimeManager.MAX_SHARE, TimeManager.MIN_TIME)
+        target = (remaining / moves_left + self.increment) * scale
+        target = min(max(target, TimeManager.MIN_TIME), maximum)
+        maximum = min(target * TimeManager.MAX_FACTOR, maximum)
+
+        self.__plan = {"free": free, "branching": branching, "planned": target, "maximum": maximum}
+        return target, maximum
+
+    def stop_condition(self, game, score_func):
+        """Plan the time of the active player's move, see plan().
+
+        Args:
+            game (board.Board): Game board object.
+            score_func (function pointer): Scoring heuristic of the search, score swings only count
+                towards instability for heuristics scoring in mobility units, see ai.AI.mobility_units().
+
+        Returns:
+            stop_func (StopCondition): Stop condition for ai.AI.timed_abnegamax(), its maximum is the time budget.
+
+        """
+        score_swing = StopCondition.SCORE_SWING if ai.AI.mobility_units(score_func) else None
+        return StopCondition(*self.plan(game), score_swing=score_swing)
+
+    def update(self, elapsed):
+        """Charge the time of a move to the clock and log it.
+
+        Args:
+            elapsed (float): Seconds the move took.
+
+        """
+        self.remaining += self.increment - elapsed
+        entry = {"move": len(self.log) + 1, "free": None, "branching": None, "planned": None, "maximum": None}
+        entry.update(self.__plan or {})
+        entry.update(actual=elapsed, remaining=self.remaining)
+        self.log.append(entry)
+        self.__plan = None
+
+    def format_log(self):
+        """Format the log as a table, with the total planned and actual time.
+
+        Returns:
+            table (str): One line per move.
+
+        """
+        lines = ["{:>4} {:>5} {:>9} {:>9} {:>9} {:>9} {:>10}".format("move", "free", "branching", "planned",
+                                                                     "maximum", "actual", "remaining")]
+        for entry in self.log:
+            planned = "-" if entry["planned"] is None else "{:.3f}".format(entry["planned"])
+            maximum = "-" if entry["maximum"] is None else "{:.3f}".format(entry["maximum"])
+            lines.append("{:>4} {:>5} {:>9} {:>9} {:>9} {:>9.3f} {:>10.3f}".format(
+                entry["move"], "-" if entry["free"] is None else entry["free"],
+                "-" if entry["branching"] is None else entry["branching"], planned, maximum, entry["actual"],
+                entry["remaining"]))
+        planned = sum(entry["planned"] or 0.0 for entry in self.log)
+        actual = sum(entry["actual"] for entry in self.log)
+        lines.append("total planned {:.3f}s actual {:.3f}s of {:.3f}s + {:.3f}s/move".format(
+            planned, actual, self.total, self.increment))
+        return "\n".join(lines)
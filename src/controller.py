@@ -0,0 +1,159 @@
+"""Game controller.
+Copyright 2018 Mark Mitterdorfer
+
+Class to implement the game loop state, turn taking and recording of a game.
+Does not need Pygame, see window.py for playing a game in a Pygame window.
+"""
+
+import time
+
+import board
+import players
+import record
+
+
+class GameController(object):
+    """Game controller for one game between two players, see players.py.
+
+    Attributes:
+        game (board.Board): Game board object.
+        players (dict): players.Player by board.Board.PLAYER1/PLAYER2.
+        human_playing (bool): True if a human player takes part, False for AI vs. AI.
+        record_play (list): Recorded play, see record.py.
+        winner (int): Winning player, or False while the game is in play.
+        game_over (property, bool): True if the game is over.
+        ply (property, int): Number of moves played.
+        active (property, players.Player): Player to move.
+        ai_to_move (property, bool): True if it is an AI players turn to move.
+        __turn_start (float): Private time.time() at the start of the active players turn, to time
+            moves played without a measured search time, e.g. human moves.
+    """
+
+    def __init__(self, rows, columns, player1=None, player2=None, blocked_boxes=None):
+        self.game = board.Board(rows, columns)
+        if blocked_boxes:
+            self.game.set_blocked_boxes(blocked_boxes)
+        # Default to AI vs. AI
+        self.players = {board.Board.PLAYER1: player1 or players.TimedAbnegamaxPlayer(),
+                        board.Board.PLAYER2: player2 or players.TimedAbnegamaxPlayer()}
+        self.human_playing = any(player.is_human for player in self.players.values())
+
+        self.record_play = [(rows, columns, self.human_playing, self.game.get_blocked_boxes())]
+        self.winner = self.game.is_game_over()
+        self.__turn_start = time.time()
+
+    @property
+    def game_over(self):
+        return bool(self.winner)
+
+    @property
+    def ply(self):
+        return len(self.record_play) - 1
+
+    @property
+    def active(self):
+        return self.players[self.game.active_player]
+
+    @property
+    def ai_to_move(self):
+        return not self.game_over and not self.active.is_human
+
+    def search_task(self):
+        """Obtain the AI search of the active player in the current position, e.g. to run in
+        search_worker.SearchWorker or a process pool.
+
+        Returns:
+            search (function pointer), args (tuple): Call search(*args) to obtain (best_score, best_move).
+            None if the game is over or the active player does not search, e.g. a human player.
+
+        """
+        if self.game_over:
+            return None
+        return self.active.search_task(self.game)
+
+    def think(self):
+        """Run the AI search for the active player in this process.
+
+        Returns:
+            best_score (int), best_move (int, int): Best score and associated move.
+
+        Raises:
+            RuntimeError: The game is over or the active player does not search.
+
+        """
+        task = self.search_task()
+        if task is None:
+            raise RuntimeError("no AI search for player {}".format(self.game.active_player))
+        search, args = task
+        return search(*args)
+
+    def is_legal_move(self, x, y):
+        """Determine if the active player can move to (x, y).
+
+        Args:
+            x (int): X box coordinate.
+            y (int): Y box coordinate.
+
+        Returns:
+            True if successful, False otherwise.
+
+        """
+        return not self.game_over and not self.game.box_blocked(x, y) and (x, y) in self.game.get_legal_moves()
+
+    def play(self, move, score=None, elapsed=None):
+        """Record and make a move for the active player, and report the time of the move to it,
+        see players.Player.moved().
+
+        Args:
+            move (int, int): (X, Y) box coordinates to move to.
+            score (int, optional): AI score of the move, None for a human player.
+            elapsed (float, optional): Seconds the AI search took, measured where it ran so time spent
+                starting or waiting for a worker process is not charged. None to use the time since
+                the players turn started, e.g. for a human player.
+
+        """
+        now = time.time()
+        self.active.moved(now - self.__turn_start if elapsed is None else elapsed)
+        self.__turn_start = now
+
+        self.record_play.append((self.game.active_player, score, move))
+        # Update the game board state and flip the player
+        self.game.make_move(*move)
+        self.winner = self.game.is_game_over()
+
+    def play_headless(self, verbose=True):
+        """Play AI vs. AI until the game is over, in this process.
+
+        Args:
+            verbose (bool, optional): Print each move.
+
+        Returns:
+            winner (int): Winning player.
+
+        """
+        assert not self.human_playing
+        while not self.game_over:
+            start = time.time()
+            best_score, best_move = self.think()
+            elapsed = time.time() - start
+            if verbose:
+                print("Best move player {}:".format(self.game.active_player), best_move, "score:", best_score,
+                      "time:", elapsed)
+            self.play(best_move, best_score, elapsed)
+
+        return self.winner
+
+    def save(self, filename=None):
+        """Save the recorded moves.
+
+        Args:
+            filename (str, optional): Pickled filename, default to REPLAY<time>.pickle.
+
+        Returns:
+            filename (str): Filename saved to.
+
+        """
+        if filename is None:
+            filename = "REPLAY" + str(int(time.time())) + ".pickle"
+        record.save_replay(filename, self.record_play)
+        return filename
@@ -1,151 +1,101 @@
-"""Main application and game controller.
+"""Main application.
 Copyright 2018 Mark Mitterdorfer
 
-Bind board state, renderer and AI and play a game.
+Parse the command line and play a game with controller.GameController, either in a
+Pygame window or headless. Pygame is only imported when a window is requested.
 """
 
-import board
-import renderer
-import ai
-import pygame
-import sys
-from pygame.locals import *
-import time
-import pickle
-
-
-def main():
-    start_x = 10
-    start_y = 10
-
-    box_width = 50
-    margin_width = 5
-
-    rows = 5
-    columns = 5
-
-    game = board.Board(rows, columns)
-    #game.gen_random_blocked_boxes(7, int(0.4 * rows * columns))
-
-    # Board/box state to rendering mappings
-    box_mapping = {game.PLAYER1: renderer.LBLUE,
-                   game.PLAYER2: renderer.LRED,
-                   game.BOX_CLEAR: renderer.GREY,
-                   game.BOX_BLOCK: renderer.BROWN,
-                   game.BOX_BLOCKED_MASK: renderer.BLACK}  # Masked state is not actually used to draw
-
-    # Player 1 = blue
-    player1_colour = renderer.BLUE
-    # Player 2 = red
-    player2_colour = renderer.RED
-
-    pygame.init()
-    display = pygame.display.set_mode((800, 600), 0, 32)
-    pygame.display.set_caption("Isolation")
-    visual_board = renderer.RenderBoard(display, start_x, start_y, rows, columns, box_mapping, box_width, margin_width)
-
-    render_update = True
-    game_over = False
-    # AI vs. AI, else player1 = first to move = human
-    human_playing = False
-
-    # Record play:
-    # 1st element is a tuple with board dimensions and if AI or human player (rows, columns, human_playing)
-    # Followed by tuple (active_player, score, move)
-    # tuple (active_player, None, move) if human is playing
-    record_play = [(rows, columns, human_playing)]
+import argparse
+import math
+import os
 
-    # Default search depth
-    depth = 5
-
-    while True:
-        # Only refresh the screen if an action caused a state change
-        if render_update:
-            # Unset the box blocked bit mask pattern if it is set to get players colour etc.
-            # TODO Perhaps move this in to board.py
-            board_list = [i & ~game.BOX_BLOCKED_MASK if i != game.BOX_BLOCKED_MASK else
-                          game.BOX_BLOCKED_MASK for i in game.board_list]
-
-            display.fill(renderer.BLACK)
-
-            # Highlight active player by drawing a margin filled box
-            player_pos = game.player1_pos
-            if game.active_player == game.PLAYER2:
-                player_pos = game.player2_pos
-            if player_pos:
-                visual_board.draw_margin_box(*player_pos, renderer.GREEN)
-
-            # Render the entire board from the board_list
-            visual_board.draw_board(board_list)
-
-            # Draw current position of players a darker colour
-            player_pos = game.player1_pos
-            if player_pos:
-                visual_board.draw_box(*player_pos, player1_colour)
-            player_pos = game.player2_pos
-            if player_pos:
-                visual_board.draw_box(*player_pos, player2_colour)
-
-            winner = game.is_game_over()
-            if winner:
-                print("Player", winner, "wins!")
-                game_over = True
-
-            pygame.display.update()
-            render_update = False
-
-        # Human goes first, unless AI vs. AI is in play
-        if game.active_player == game.PLAYER1 and not human_playing and not game_over:
-            score_func = ai.AI.score_func2
-            start = time.time()
-            best_score, best_move = ai.AI.power_abnegamax(game, depth, game.PLAYER1,
-                                                          float("-inf"), float("inf"), score_func)
-            end = time.time()
-            print("Best move player 1:", best_move, "score:", best_score, "time:", end - start)
-
-            # Record move
-            record_play.append((game.active_player, best_score, best_move))
-            game.make_move(*best_move)
-            render_update = True
-
-        elif game.active_player == game.PLAYER2 and not game_over:
-            score_func = ai.AI.score_func2
-            start = time.time()
-            best_score, best_move = ai.AI.power_abnegamax(game, depth, game.PLAYER2,
-                                                          float("-inf"), float("inf"), score_func)
-            end = time.time()
-            print("Best move player 2:", best_move, "score:", best_score, "time:", end - start)
+import ai
+import controller
+import players
+import tablebase
 
-            # Record move
-            record_play.append((game.active_player, best_score, best_move))
-            game.make_move(*best_move)
-            render_update = True
+# Largest supported board dimension
+MAX_BOARD_SIZE = 32
 
-        # Handle Pygame events
-        for event in pygame.event.get():
-            if event.type == QUIT:
-                pygame.quit()
-                # Save recorded moves
-                filename = "REPLAY" + str(int(time.time())) + ".pickle"
-                with open(filename, "wb") as handle:
-                    pickle.dump(record_play, handle, protocol=pickle.HIGHEST_PROTOCOL)
-                sys.exit()
-            # Only process a mouse button event if the game is still running
-            elif event.type == MOUSEBUTTONDOWN and game.active_player == game.PLAYER1\
-                    and human_playing and not game_over:
-                mouse_x, mouse_y = pygame.mouse.get_pos()
 
-                if visual_board.mouse_in_board(mouse_x, mouse_y):
-                    box_x, box_y = visual_board.get_box_coord(mouse_x, mouse_y)
-                    if not visual_board.mouse_in_margin(mouse_x, mouse_y, box_x, box_y):
-                        # Make sure the box selected is not blocked
-                        if not game.box_blocked(box_x, box_y) and (box_x, box_y) in game.get_legal_moves():
-                            # Record move, set best_score = None for human player
-                            record_play.append((game.active_player, None, (box_x, box_y)))
-                            # Update the game board state and flip the player
-                            game.make_move(box_x, box_y)
-                            # Force a render/board refresh
-                            render_update = True
+def main():
+    parser = argparse.ArgumentParser(description="Play a game of Isolation.")
+    parser.add_argument("--rows", type=int, default=5, help="number of rows in the board")
+    parser.add_argument("--columns", type=int, default=5, help="number of columns in the board")
+    parser.add_argument("--player1", choices=sorted(players.PLAYERS), default="timed_abnegamax",
+                        help="player 1 (moves first), human players click on the board to move")
+    parser.add_argument("--player2", choices=sorted(players.PLAYERS), default="timed_abnegamax", help="player 2")
+    parser.add_argument("--depth", type=int, default=5, help="search depth of fixed depth AI players")
+    parser.add_argument("--clock", type=float, default=60.0,
+                        help="seconds on the game clock of each clock_abnegamax player")
+    parser.add_argument("--increment", type=float, default=1.0,
+                        help="seconds added to the game clock of clock_abnegamax players after every move")
+    parser.add_argument("--headless", action="store_true",
+                        help="play AI vs. AI without a window, printing the moves and saving the replay")
+    parser.add_argument("--profile", metavar="FILE", default=None,
+                        help="profile one AI move search and write collapsed stacks (or pstats data) to FILE")
+    parser.add_argument("--profile-ply", type=int, default=0, help="ply of the AI move to profile, 0 is the first")
+    parser.add_argument("--profile-deterministic", action="store_true",
+                        help="profile with cProfile instead of sampling")
+    parser.add_argument("--lmr", action="store_true", help="enable late move reductions in the AI search")
+    parser.add_argument("--futility", action="store_true", help="enable futility pruning / razoring in the AI search")
+    parser.add_argument("--threats", action="store_true",
+                        help="enable forced win / loss detection near the end of the game in the AI search")
+    parser.add_argument("--tablebase", default=None,
+                        help="endgame tablebase from tablebase.py, default to tablebase<rows>x<columns>.bin if it exists")
+    parser.add_argument("--weights", default="weights.json",
+                        help="weights file from tuner.py for the weighted scoring heuristic, if it exists")
+    args = parser.parse_args()
+
+    if not (1 <= args.rows <= MAX_BOARD_SIZE and 1 <= args.columns <= MAX_BOARD_SIZE):
+        parser.error("board dimensions must be between 1 and {}".format(MAX_BOARD_SIZE))
+    if not 1 <= args.depth <= players.MAX_DEPTH:
+        parser.error("--depth must be between 1 and {}".format(players.MAX_DEPTH))
+    if not math.isfinite(args.clock + args.increment) or args.clock <= 0 or args.increment < 0:
+        parser.error("--clock must be positive and --increment non negative")
+    if args.headless and "human" in (args.player1, args.player2):
+        parser.error("human players need a window")
+    if args.headless and args.profile:
+        parser.error("--profile is only supported with a window, use profiler.py for headless profiling")
+
+    # Use the tuned weighted scoring heuristic if a weights file is available
+    score_func = ai.AI.score_func2
+    if os.path.exists(args.weights):
+        score_func = ai.WeightedScore.load(args.weights)
+        print("Loaded weights:", args.weights, score_func.weights)
+
+    # Look up solved endgames if a tablebase for the board is available
+    endgames = None
+    tablebase_filename = args.tablebase or "tablebase{}x{}.bin".format(args.rows, args.columns)
+    if os.path.exists(tablebase_filename):
+        endgames = tablebase.Tablebase(tablebase_filename)
+        if (endgames.rows, endgames.columns) != (args.rows, args.columns):
+            parser.error("{} is a tablebase for {}x{} boards".format(tablebase_filename, endgames.rows,
+                                                                    endgames.columns))
+        print("Loaded tablebase:", tablebase_filename, "up to", endgames.complete - 1, "free boxes")
+
+    settings = {"depth": args.depth, "lmr": args.lmr, "futility": args.futility, "threats": args.threats,
+                "clock": args.clock, "increment": args.increment}
+    try:
+        player1, player2 = [players.create_player(dict(settings, type=name), score_func, endgames)
+                            for name in (args.player1, args.player2)]
+    except ValueError as error:
+        parser.error(str(error))
+    game_controller = controller.GameController(args.rows, args.columns, player1, player2)
+
+    if args.headless:
+        print("Player", game_controller.play_headless(), "wins!")
+        print("Saved replay:", game_controller.save())
+    else:
+        # Deferred so headless use never pays for importing and initialising Pygame
+        import window
+        window.run(game_controller, args.profile, args.profile_ply, args.profile_deterministic)
+
+    # Planned vs. actual time per move, to tune clock.TimeManager
+    for player_num, player in sorted(game_controller.players.items()):
+        if isinstance(player, players.ClockPlayer):
+            print("Clock player {}:".format(player_num))
+            print(player.clock.format_log())
 
 
 if __name__ == "__main__":
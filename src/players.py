@@ -0,0 +1,262 @@
+"""Players.
+Copyright 2018 Mark Mitterdorfer
+
+Classes for the players of a game. A player chooses the search for its moves, the
+search itself is run by the caller, e.g. in this process, in search_worker.SearchWorker
+or in a process pool. Players are picklable so they can be sent to other processes.
+"""
+
+import math
+
+import ai
+import bounded
+import clock
+
+
+class Player(object):
+    """Base class of a player. Subclasses either take moves from outside, like a human
+    clicking on the board, or override search_task() to obtain an AI move.
+
+    Attributes:
+        name (str): Player type name, a key of PLAYERS.
+        is_human (bool): True if moves are made from outside, not searched for.
+    """
+
+    name = None
+    is_human = False
+
+    def search_task(self, game):
+        """Obtain the search for the active player of a position.
+
+        Args:
+            game (board.Board): Game board object.
+
+        Returns:
+            search (function pointer), args (tuple): Call search(*args) to obtain (best_score, best_move).
+            None if the player does not search for its moves, the default, e.g. a human player.
+
+        """
+        return None
+
+    def moved(self, elapsed):
+        """Called by the game controller after each move of this player. Does nothing by default.
+
+        Args:
+            elapsed (float): Seconds from the start of the players turn until the move was played.
+
+        """
+        pass
+
+    def describe(self):
+        """Settings to recreate the player with create_player().
+
+        Returns:
+            settings (dict): Player settings, including "type".
+
+        """
+        return {"type": self.name}
+
+
+class HumanPlayer(Player):
+    """Player whose moves are made from outside, e.g. mouse clicks or a network client.
+
+    """
+
+    name = "human"
+    is_human = True
+
+
+class SearchPlayer(Player):
+    """Base class of the AI players searching to a fixed depth.
+
+    Attributes:
+        depth (int): The maximum search depth.
+        score_func (function pointer): Scoring heuristic, must be picklable to search in another process.
+    """
+
+    def __init__(self, depth=5, score_func=ai.AI.score_func2):
+        self.depth = depth
+        self.score_func = score_func
+
+    def describe(self):
+        return {"type": self.name, "depth": self.depth}
+
+
+class NegamaxPlayer(SearchPlayer):
+    """AI player using ai.AI.negamax.
+
+    """
+
+    name = "negamax"
+
+    def search_task(self, game):
+        return ai.AI.negamax, (game, self.depth, game.active_player, self.score_func)
+
+
+class AbnegamaxPlayer(SearchPlayer):
+    """AI player using ai.AI.abnegamax.
+
+    """
+
+    name = "abnegamax"
+
+    def search_task(self, game):
+        return ai.AI.abnegamax, (game, self.depth, game.active_player, float("-inf"), float("inf"),
+                                 self.score_func)
+
+
+class PowerAbnegamaxPlayer(SearchPlayer):
+    """AI player using ai.AI.power_abnegamax.
+
+    """
+
+    name = "power_abnegamax"
+
+    def search_task(self, game):
+        return ai.AI.power_abnegamax, (game, self.depth, game.active_player, float("-inf"), float("inf"),
+                                       self.score_func)
+
+
+class TimedAbnegamaxPlayer(Player):
+    """AI player using ai.AI.timed_abnegamax, with the depth and time budget scaled to the
+    number of free boxes by ai.AI.search_limits(). The default player.
+
+    Attributes:
+        score_func (function pointer): Scoring heuristic, must be picklable to search in another process.
+        late_move_reductions (bool): Enable late move reductions.
+        futility_pruning (bool): Enable futility pruning / razoring.
+        threat_search (bool): Enable forced win / loss detection near the end of the game.
+        tablebase (tablebase.Tablebase): Endgame tablebase to probe, None for no tablebase.
+    """
+
+    name = "timed_abnegamax"
+
+    def __init__(self, score_func=ai.AI.score_func2, late_move_reductions=False, futility_pruning=False,
+                 threat_search=False, tablebase=None):
+        self.score_func = score_func
+        self.late_move_reductions = late_move_reductions
+        self.futility_pruning = futility_pruning
+        self.threat_search = threat_search
+        self.tablebase = tablebase
+
+    def search_task(self, game):
+        depth, time_budget = ai.AI.search_limits(game)
+        return ai.AI.timed_abnegamax, (game, depth, game.active_player, self.score_func, time_budget,
+                                       self.late_move_reductions, self.futility_pruning, True, self.threat_search,
+                                       self.tablebase)
+
+    def describe(self):
+        return {"type": self.name, "lmr": self.late_move_reductions, "futility": self.futility_pruning,
+                "threats": self.threat_search, "tablebase": self.tablebase.filename if self.tablebase else None}
+
+
+class ClockPlayer(TimedAbnegamaxPlayer):
+    """AI player using ai.AI.timed_abnegamax on a game clock, with the time of each move planned by a
+    clock.TimeManager instead of the fixed limits of ai.AI.search_limits().
+
+    Attributes:
+        clock (clock.TimeManager): Game clock of the player, with the log of planned vs. actual time.
+    """
+
+    name = "clock_abnegamax"
+
+    def __init__(self, total=60.0, increment=1.0, score_func=ai.AI.score_func2, late_move_reductions=False,
+                 futility_pruning=False, threat_search=False, tablebase=None):
+        super(ClockPlayer, self).__init__(score_func, late_move_reductions, futility_pruning, threat_search,
+                                          tablebase)
+        self.clock = clock.TimeManager(total, increment)
+
+    def search_task(self, game):
+        stop_func = self.clock.stop_condition(game, self.score_func)
+        # Every move fills a box, so there is nothing to search deeper than the free boxes
+        return ai.AI.timed_abnegamax, (game, max(game.num_free_boxes, 1), game.active_player, self.score_func,
+                                       stop_func.maximum, self.late_move_reductions, self.futility_pruning, True,
+                                       self.threat_search, self.tablebase, stop_func)
+
+    def moved(self, elapsed):
+        self.clock.update(elapsed)
+
+    def describe(self):
+        return dict(super(ClockPlayer, self).describe(), clock=self.clock.total, increment=self.clock.increment)
+
+
+class BoundedPlayer(Player):
+    """AI player using bounded.bounded_abnegamax, the ai.AI.score_func2 timed_abnegamax search in
+    preallocated buffers, with the depth and time budget of ai.AI.search_limits().
+
+    """
+
+    name = "bounded_abnegamax"
+
+    def search_task(self, game):
+        depth, time_budget = ai.AI.search_limits(game)
+        return bounded.bounded_abnegamax, (game, depth, game.active_player, time_budget)
+
+
+# Player types by name, add new engines here to make them available to main.py and server.py
+PLAYERS = {player.name: player for player in (HumanPlayer, NegamaxPlayer, AbnegamaxPlayer, PowerAbnegamaxPlayer,
+                                              TimedAbnegamaxPlayer, ClockPlayer, BoundedPlayer)}
+
+# Scoring heuristics selectable by name
+SCORE_FUNCS = {"score_func1": ai.AI.score_func1,
+               "score_func2": ai.AI.score_func2,
+               "score_func3": ai.AI.score_func3,
+               "score_func4": ai.AI.score_func4,
+               "territory": ai.TerritoryScore()}
+
+# Deepest search of the fixed depth players
+MAX_DEPTH = 10
+
+
+def create_player(settings, score_func=None, tablebase=None):
+    """Create a player from its settings, e.g. parsed from the command line or a client request.
+
+    Args:
+        settings (str or dict): Player type name, or a dict with "type" and optional "depth",
+            "score_func" (a SCORE_FUNCS name), "lmr", "futility", "threats", and "clock" and "increment"
+            in seconds for the clock_abnegamax player.
+        score_func (function pointer, optional): Scoring heuristic if settings does not name one.
+        tablebase (tablebase.Tablebase, optional): Endgame tablebase for the timed_abnegamax player.
+
+    Returns:
+        player (Player): New player.
+
+    Raises:
+        ValueError: Unknown player type, scoring heuristic, invalid depth or clock.
+
+    """
+    if isinstance(settings, str):
+        settings = {"type": settings}
+    settings = dict(settings)
+
+    player_class = PLAYERS.get(settings.pop("type", None))
+    if player_class is None:
+        raise ValueError("unknown player type, expected one of: {}".format(", ".join(sorted(PLAYERS))))
+
+    if "score_func" in settings:
+        score_func = SCORE_FUNCS.get(settings.pop("score_func"))
+        if score_func is None:
+            raise ValueError("unknown score_func, expected one of: {}".format(", ".join(sorted(SCORE_FUNCS))))
+    if score_func is None:
+        score_func = ai.AI.score_func2
+
+    if player_class in (HumanPlayer, BoundedPlayer):
+        return player_class()
+    if player_class is ClockPlayer:
+        total = settings.get("clock", 60.0)
+        increment = settings.get("increment", 1.0)
+        # Not isinstance(), bools are ints
+        numbers = type(total) in (int, float) and type(increment) in (int, float)
+        if not numbers or not math.isfinite(total + increment) or total <= 0 or increment < 0:
+            raise ValueError("clock must be a positive number of seconds and increment non negative")
+        return ClockPlayer(float(total), float(increment), score_func, bool(settings.get("lmr", False)),
+                           bool(settings.get("futility", False)), bool(settings.get("threats", False)), tablebase)
+    if player_class is TimedAbnegamaxPlayer:
+        return TimedAbnegamaxPlayer(score_func, bool(settings.get("lmr", False)),
+                                    bool(settings.get("futility", False)), bool(settings.get("threats", False)),
+                                    tablebase)
+
+    depth = settings.get("depth", 5)
+    if type(depth) is not int or not 1 <= depth <= MAX_DEPTH:
+        raise ValueError("depth must be an integer between 1 and {}".format(MAX_DEPTH))
+    return player_class(depth, score_func)
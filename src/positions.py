@@ -0,0 +1,241 @@
+"""Position generator.
+Copyright 2018 Mark Mitterdorfer
+
+Generate unique random positions in bulk from a seed, e.g. for benchmark fixtures, tuning
+data sets and tablebase checks. Run e.g.:
+
+    python positions.py --rows 7 --columns 7 --count 1000000 --plies 2 20 --out positions7x7.bin
+
+Positions are generated in parallel chunks, each from its own seed, and written in chunk
+order, so the same settings always write the same file whatever the number of processes.
+Duplicates are dropped by position hash, or with --symmetry by board.Board.canonical_hash()
+so only one of the reflections / rotations of a position is kept.
+
+File layout: HEADER followed by one board.Board.to_bytes() record per position, all of
+board.Board.packed_size(rows, columns) bytes. Read the positions with read_positions().
+"""
+
+import argparse
+import multiprocessing
+import random
+import struct
+import time
+
+import ai
+import board
+
+# magic, version, rows, columns, number of positions
+HEADER = struct.Struct("<5sBBBQ")
+MAGIC = b"ISOPS"
+VERSION = 1
+
+# Player placement: "random" on any free box, "centre" on the free boxes the AI searches for a first move
+PLACEMENTS = ("random", "centre")
+
+
+def random_position(rng, rows, columns, density, plies, placement):
+    """Generate a position: block random boxes, then play random moves.
+
+    Args:
+        rng (random.Random): Random number generator.
+        rows (int), columns (int): Board dimensions.
+        density (float, float): Minimum and maximum share of the boxes blocked before the first move.
+        plies (int, int): Minimum and maximum number of moves played, the first move of a player places it.
+        placement (str): Placement of the players on their first move, one of PLACEMENTS.
+
+    Returns:
+        game (board.Board): Position in play, None if the game ended.
+
+    """
+    size = rows * columns
+    game = board.Board(rows, columns)
+    game.gen_random_blocked_boxes(int(density[0] * size), int(density[1] * size), rng)
+
+    for _ in range(rng.randint(*plies)):
+        if placement == "centre" and game.player_pos(game.active_player) is None:
+            moves = ai.AI.search_moves(game)
+        else:
+            moves = game.get_legal_moves()
+        # Once the game is over a player to move has no moves, cheaper than is_game_over() every move
+        if not moves:
+            return None
+        game.make_move(*rng.choice(moves))
+
+    if game.is_game_over():
+        return None
+    return game
+
+
+def _generate_chunk(task):
+    """Worker process entry point. Generate the positions of a chunk.
+
+    Args:
+        task (tuple): (seed, chunk, count, rows, columns, density, plies, placement, symmetry), count
+            positions are attempted.
+
+    Returns:
+        chunk (int), positions (list): Chunk number and (key, to_bytes() record) per position in play,
+        the key is the canonical_hash() with symmetry, otherwise the position_hash.
+
+    """
+    seed, chunk, count, rows, columns, density, plies, placement, symmetry = task
+    # String seeds are hashed the same in every process
+    rng = random.Random("{}:{}".format(seed, chunk))
+    positions = []
+    for _ in range(count):
+        game = random_position(rng, rows, columns, density, plies, placement)
+        if game is not None:
+            positions.append((game.canonical_hash() if symmetry else game.position_hash, game.to_bytes()))
+    return chunk, positions
+
+
+def generate(filename, rows, columns, count, seed=0, density=(0.0, 0.0), plies=(2, 10), placement="random",
+             symmetry=False, jobs=None, chunk_size=1000, verbose=True):
+    """Generate unique positions in to a file.
+
+    Args:
+        filename (str): Positions filename.
+        rows (int), columns (int): Board dimensions.
+        count (int): Number of positions.
+        seed (int, optional): Random seed.
+        density (float, float), optional: Minimum and maximum share of the boxes blocked before the first move.
+        plies (int, int), optional: Minimum and maximum number of moves played.
+        placement (str, optional): Placement of the players on their first move, one of PLACEMENTS.
+        symmetry (bool, optional): Drop positions symmetric to one already generated too.
+        jobs (int, optional): Number of worker processes, default to the number of CPUs.
+        chunk_size (int, optional): Positions attempted per task.
+        verbose (bool, optional): Print progress.
+
+    Returns:
+        written (int): Number of positions written, less than count if the chunks stop finding new
+        positions, e.g. because there are fewer distinct positions on a small board.
+
+    Raises:
+        ValueError: Invalid board dimensions, density, plies or placement.
+
+    """
+    if not (1 <= rows <= 127 and 1 <= columns <= 127):
+        raise ValueError("board dimensions must be between 1 and 127")
+    if not 0.0 <= density[0] <= density[1] <= 1.0:
+        raise ValueError("density must be 0 <= minimum <= maximum <= 1")
+    if not 0 <= plies[0] <= plies[1]:
+        raise ValueError("plies must be 0 <= minimum <= maximum")
+    if placement not in PLACEMENTS:
+        raise ValueError("placement must be one of: {}".format(", ".join(PLACEMENTS)))
+
+    start_time = time.time()
+    seen = set()
+    written = 0
+    next_chunk = 0
+    with open(filename, "wb") as output_file, multiprocessing.Pool(jobs) as pool:
+        output_file.write(HEADER.pack(MAGIC, VERSION, rows, columns, 0))
+        # Chunks are submitted a round at a time and written in order so the output is reproducible,
+        # a round has a few chunks per worker but no more than needed for the remaining positions
+        max_round_chunks = 4 * (jobs or multiprocessing.cpu_count())
+        while written < count:
+            round_chunks = min(max_round_chunks, -(-(count - written) // chunk_size))
+            tasks = [(seed, chunk, chunk_size, rows, columns, density, plies, placement, symmetry)
+                     for chunk in range(next_chunk, next_chunk + round_chunks)]
+            next_chunk += round_chunks
+
+            new = 0
+            for chunk, positions in pool.imap(_generate_chunk, tasks):
+                for key, data in positions:
+                    if written < count and key not in seen:
+                        seen.add(key)
+                        output_file.write(data)
+                        written += 1
+                        new += 1
+
+            if verbose:
+                print("Positions: {}/{}, time: {:.1f}".format(written, count, time.time() - start_time))
+            # Stop once a whole round finds nothing new
+            if not new:
+                break
+
+        output_file.seek(0)
+        output_file.write(HEADER.pack(MAGIC, VERSION, rows, columns, written))
+
+    return written
+
+
+def read_header(filename):
+    """Read the header of a positions file.
+
+    Args:
+        filename (str): Positions filename.
+
+    Returns:
+        rows (int), columns (int), count (int): Board dimensions and number of positions.
+
+    Raises:
+        ValueError: Not a positions file.
+
+    """
+    with open(filename, "rb") as input_file:
+        data = input_file.read(HEADER.size)
+    if len(data) < HEADER.size:
+        raise ValueError("not a version {} positions file: {}".format(VERSION, filename))
+    magic, version, rows, columns, count = HEADER.unpack(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("not a version {} positions file: {}".format(VERSION, filename))
+    return rows, columns, count
+
+
+def read_positions(filename, start=0, stop=None):
+    """Stream the positions of a positions file.
+
+    Args:
+        filename (str): Positions filename.
+        start (int, optional): Index of the first position.
+        stop (int, optional): Index after the last position, None for all positions.
+
+    Yields:
+        game (board.Board): Position.
+
+    """
+    rows, columns, count = read_header(filename)
+    record_size = board.Board.packed_size(rows, columns)
+    stop = count if stop is None else min(stop, count)
+    # Read many records at a time, a record per read is slow for millions of positions
+    batch = max(1, (1 << 20) // record_size)
+    with open(filename, "rb") as input_file:
+        input_file.seek(HEADER.size + start * record_size)
+        index = start
+        while index < stop:
+            records = min(batch, stop - index)
+            data = input_file.read(records * record_size)
+            for offset in range(0, records * record_size, record_size):
+                yield board.Board.from_bytes(data, offset)
+            index += records
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate unique random positions in to a file.")
+    parser.add_argument("--rows", type=int, default=5, help="number of rows in the board")
+    parser.add_argument("--columns", type=int, default=5, help="number of columns in the board")
+    parser.add_argument("--count", type=int, default=10000, help="number of positions")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    parser.add_argument("--density", type=float, nargs=2, default=[0.0, 0.0], metavar=("MIN", "MAX"),
+                        help="share of the boxes blocked before the first move")
+    parser.add_argument("--plies", type=int, nargs=2, default=[2, 10], metavar=("MIN", "MAX"),
+                        help="number of random moves played, the first move of a player places it")
+    parser.add_argument("--placement", choices=PLACEMENTS, default="random", help="player placement")
+    parser.add_argument("--symmetry", action="store_true",
+                        help="also drop reflections / rotations of positions already generated")
+    parser.add_argument("--out", default=None, help="positions file, default to positions<rows>x<columns>.bin")
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes, default to the number of CPUs")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="positions attempted per task")
+    args = parser.parse_args()
+
+    out = args.out or "positions{}x{}.bin".format(args.rows, args.columns)
+    try:
+        written = generate(out, args.rows, args.columns, args.count, args.seed, tuple(args.density),
+                           tuple(args.plies), args.placement, args.symmetry, args.jobs, args.chunk_size)
+    except ValueError as error:
+        parser.error(str(error))
+    print("Wrote", written, "positions to", out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""Search profiler.
+Copyright 2018 Mark Mitterdorfer
+
+Classes to profile a single AI move search, aggregate per-function self/cumulative time
+and export collapsed stacks for flame graph tools (e.g. flamegraph.pl, speedscope).
+"""
+
+import argparse
+import cProfile
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+
+import ai
+import board
+
+
+def frame_label(code):
+    """Obtain a flame graph label for a code object, e.g. "ai.py:AI.abnegamax".
+
+    Args:
+        code (code): Code object of a frame.
+
+    Returns:
+        (str): Label.
+
+    """
+    return "{}:{}".format(os.path.basename(code.co_filename), getattr(code, "co_qualname", code.co_name))
+
+
+class SamplingProfiler(object):
+    """Sample the call stack of a function running in the current thread from a background thread.
+
+    Attributes:
+        interval (float): Seconds between samples.
+        stacks (dict): (label, ...) root to leaf call stack -> number of samples.
+        samples (int): Total number of samples.
+        elapsed (float): Wall clock seconds the profiled function ran for.
+    """
+
+    def __init__(self, interval=0.001):
+        self.interval = interval
+        self.stacks = {}
+        self.samples = 0
+        self.elapsed = 0.0
+
+    def __sample(self, thread_id, done):
+        """Sampler thread, record the stack of thread_id until done is set.
+
+        Args:
+            thread_id (int): Thread to sample.
+            done (threading.Event): Set to stop sampling.
+
+        """
+        root_code = SamplingProfiler.run.__code__
+        while not done.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            stack = []
+            # Walk from the leaf up to (excluding) run()
+            while frame is not None and frame.f_code is not root_code:
+                stack.append(frame_label(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                stack = tuple(reversed(stack))
+                self.stacks[stack] = self.stacks.get(stack, 0) + 1
+                self.samples += 1
+
+    def run(self, func, *args):
+        """Run and sample func(*args).
+
+        Args:
+            func (function pointer): Function to profile, e.g. ai.AI.power_abnegamax.
+            *args: Arguments passed to func.
+
+        Returns:
+            The result of func(*args).
+
+        """
+        done = threading.Event()
+        sampler = threading.Thread(target=self.__sample, args=(threading.get_ident(), done), daemon=True)
+
+        # Let the sampler thread take the GIL as often as it wants to sample
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(switch_interval, self.interval))
+        start = time.time()
+        sampler.start()
+        try:
+            return func(*args)
+        finally:
+            self.elapsed += time.time() - start
+            done.set()
+            sampler.join()
+            sys.setswitchinterval(switch_interval)
+
+    def function_times(self):
+        """Aggregate the samples per function.
+        Self time counts samples where the function is the leaf, cumulative time counts
+        samples where the function is anywhere in the stack (once per sample for recursion).
+
+        Returns:
+            times (list): List of (label, self_seconds, cumulative_seconds) sorted by self time.
+
+        """
+        per_sample = self.elapsed / self.samples if self.samples else 0.0
+        self_counts = {}
+        cum_counts = {}
+        for stack, count in self.stacks.items():
+            self_counts[stack[-1]] = self_counts.get(stack[-1], 0) + count
+            for label in set(stack):
+                cum_counts[label] = cum_counts.get(label, 0) + count
+
+        times = [(label, self_counts.get(label, 0) * per_sample, count * per_sample)
+                 for label, count in cum_counts.items()]
+        times.sort(key=lambda item: (item[1], item[2]), reverse=True)
+        return times
+
+    def print_stats(self, limit=20):
+        """Print the functions with the most self time.
+
+        Args:
+            limit (int, optional): Number of functions to print.
+
+        """
+        print("{} samples in {:.3f}s".format(self.samples, self.elapsed))
+        print("{:>10} {:>10}  function".format("self(s)", "cum(s)"))
+        for label, self_time, cum_time in self.function_times()[:limit]:
+            print("{:>10.4f} {:>10.4f}  {}".format(self_time, cum_time, label))
+
+    def write_collapsed(self, filename):
+        """Write the samples as collapsed stacks, one "root;...;leaf count" line per stack.
+
+        Args:
+            filename (str): File to write.
+
+        """
+        with open(filename, "w") as output_file:
+            for stack, count in sorted(self.stacks.items()):
+                output_file.write("{} {}\n".format(";".join(stack), count))
+
+
+class ProfiledSearch(object):
+    """Picklable search function wrapper which profiles each search it runs, e.g. to
+    profile a move with search_worker.SearchWorker.
+
+    Attributes:
+        search (function pointer): Search function to profile, e.g. ai.AI.timed_abnegamax.
+        filename (str): Output filename. Collapsed stacks when sampling, pstats data when deterministic.
+        deterministic (bool): Use cProfile instead of sampling. Exact call counts and times, but
+            no call stacks for flame graphs, and the instrumentation overhead skews the times.
+        interval (float): Seconds between samples when sampling.
+    """
+
+    def __init__(self, search, filename, deterministic=False, interval=0.001):
+        self.search = search
+        self.filename = filename
+        self.deterministic = deterministic
+        self.interval = interval
+
+    def __call__(self, *args):
+        if self.deterministic:
+            profile = cProfile.Profile()
+            result = profile.runcall(self.search, *args)
+            profile.dump_stats(self.filename)
+            pstats.Stats(profile).sort_stats("tottime").print_stats(20)
+            return result
+
+        profiler = SamplingProfiler(self.interval)
+        result = profiler.run(self.search, *args)
+        profiler.write_collapsed(self.filename)
+        profiler.print_stats()
+        return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile the AI search of a single move headless.")
+    parser.add_argument("--rows", type=int, default=5, help="number of rows in the board")
+    parser.add_argument("--columns", type=int, default=5, help="number of columns in the board")
+    parser.add_argument("--moves", type=int, default=2, help="random moves to play before the profiled move")
+    parser.add_argument("--seed", type=int, default=0, help="random seed for the moves played")
+    parser.add_argument("--depth", type=int, default=None, help="search depth, default from AI.search_limits")
+    parser.add_argument("--deterministic", action="store_true", help="use cProfile instead of sampling")
+    parser.add_argument("--out", default="search.folded", help="output filename")
+    args = parser.parse_args()
+
+    # Play random moves to reach a position to profile
+    rng = random.Random(args.seed)
+    game = board.Board(args.rows, args.columns)
+    for _ in range(args.moves):
+        if game.is_game_over():
+            break
+        game.make_move(*rng.choice(game.get_legal_moves()))
+
+    depth, time_budget = ai.AI.search_limits(game)
+    if args.depth is not None:
+        depth, time_budget = args.depth, None
+
+    search = ProfiledSearch(ai.AI.timed_abnegamax, args.out, args.deterministic)
+    best_score, best_move = search(game, depth, game.active_player, ai.AI.score_func2, time_budget)
+    print("Best move:", best_move, "score:", best_score, "profile:", args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""Recorded play.
+Copyright 2018 Mark Mitterdorfer
+
+Save and load recorded game sessions (replay files). Does not need Pygame.
+
+A recorded play is a pickled list:
+1st element is a tuple with board dimensions, if AI or human player and the boxes blocked by
+the board (rows, columns, human_playing, blocked_boxes). Older recordings omit blocked_boxes.
+Followed by tuple (active_player, score, move)
+tuple (active_player, None, move) if human is playing
+"""
+
+import pickle
+
+import board
+
+
+def save_replay(filename, record_play):
+    """Save a recorded play.
+
+    Args:
+        filename (str): Pickled filename to write.
+        record_play (list): Header tuple followed by the (active_player, score, move) tuples.
+
+    """
+    with open(filename, "wb") as handle:
+        pickle.dump(record_play, handle, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load_replay(filename):
+    """Load an earlier recorded play.
+
+    Args:
+        filename (str): Pickled filename to open.
+
+    Returns:
+        game (board.Board), human_playing (bool), record_play (list): Starting board, if a human
+        played and the list of recorded (active_player, score, move) tuples.
+
+    """
+    with open(filename, "rb") as input_file:
+        record_play = pickle.load(input_file)
+
+    header = record_play.pop(0)
+    (rows, columns, human_playing) = header[:3]
+    blocked_boxes = header[3] if len(header) > 3 else []
+
+    game = board.Board(rows, columns)
+    game.set_blocked_boxes(blocked_boxes)
+
+    return game, human_playing, record_play
@@ -1,9 +1,10 @@
 """Render a board in Pygame.
 Copyright 2018 Mark Mitterdorfer
 
-Class to render the board game in Pygame.
+Class to render the board game in Pygame, and helpers to draw a game board with it.
 """
 
+import board
 import pygame
 import sys
 from pygame.locals import *
@@ -17,6 +18,11 @@ LBLUE = (68, 68, 255)
 LRED = (255, 68, 68)
 BROWN = (102, 51, 0)
 
+# Player 1 = blue
+PLAYER1_COLOUR = BLUE
+# Player 2 = red
+PLAYER2_COLOUR = RED
+
 
 class RenderBoard(object):
     """Class to render the board to a Pygame surface.
@@ -32,6 +38,9 @@ class RenderBoard(object):
         board_width (int, optional): Board width.
         board_height (int): Board height.
         box_mapping (dict): int -> colour mapping for the boxes
+        __font (pygame.font.Font): Private font for status text, created on first use.
+        __drawn (list): Private list of the colour last drawn for each box, None if not drawn yet.
+        __highlight (tuple): Private (X, Y) box coordinates of the last drawn highlight, or None.
 
     """
 
@@ -51,6 +60,34 @@ class RenderBoard(object):
         self.board_width = self.columns * self.box_width + (self.columns - 1) * self.margin_width
         self.board_height = self.rows * self.box_width + (self.rows - 1) * self.margin_width
 
+        self.__font = None
+        self.__drawn = [None] * (self.rows * self.columns)
+        self.__highlight = None
+
+    @staticmethod
+    def fit_box_width(width, height, rows, columns, max_box_width=50):
+        """Obtain the largest box and margin widths for the board to fit in width x height pixels.
+        The margin is scaled with the box width.
+
+        Args:
+            width (int): Available width in pixels.
+            height (int): Available height in pixels.
+            rows (int): Number of rows in the board.
+            columns (int): Number of columns in the board.
+            max_box_width (int, optional): Largest box width to use.
+
+        Returns:
+            box_width (int), margin_width (int): Box and margin widths.
+
+        """
+        for box_width in range(max_box_width, 1, -1):
+            margin_width = max(1, box_width // 10)
+            if columns * box_width + (columns - 1) * margin_width <= width and \
+                    rows * box_width + (rows - 1) * margin_width <= height:
+                return box_width, margin_width
+
+        return 1, 1
+
     def draw_board(self, game_board):
         """Draw board to the Pygame surface.
 
@@ -70,14 +107,74 @@ class RenderBoard(object):
                 offset = x + y * self.columns
                 box = game_board[offset]
                 # Draw a row of boxes
-                pygame.draw.rect(self.pygame_surface, self.box_mapping[box],
+                colour = self.box_mapping[box]
+                pygame.draw.rect(self.pygame_surface, colour,
                                  (curr_x, curr_y, self.box_width, self.box_width))
+                self.__drawn[offset] = colour
                 curr_x += self.box_width + self.margin_width
 
             # Start new row
             curr_x = self.board_x
             curr_y += self.box_width + self.margin_width
 
+    def assume_drawn(self, game_board):
+        """Record the board as drawn without drawing it, e.g. when the Pygame surface is
+        a copy of a surface the same board was already drawn to with draw_board().
+
+        Args:
+            game_board (list): List containing a game board state. len(game_board) == rows * columns.
+
+        """
+        assert len(game_board) == self.rows * self.columns
+        self.__drawn = [self.box_mapping[box] for box in game_board]
+        self.__highlight = None
+
+    def update_boxes(self, game_board, boxes, overlay=None, highlight=None, highlight_colour=GREEN,
+                     background=BLACK):
+        """Incrementally draw the board to the Pygame surface.
+        Only the given boxes are checked, and only those whose colour or highlight changed since
+        they were last drawn are redrawn. Call draw_board() once first to draw the whole board.
+        Pass the returned rectangles to pygame.display.update(rects).
+
+        Args:
+            game_board (list): List containing a game board state. len(game_board) == rows * columns.
+            boxes (iterable): (X, Y) box coordinates which may have changed, e.g. old and new player positions.
+            overlay (dict, optional): (X, Y) -> colour overriding the box mapping, e.g. current player positions.
+            highlight (tuple, optional): (X, Y) box to highlight with a margin filled box, or None.
+            highlight_colour (tuple, optional): (R,G,B) colour of the highlight.
+            background (tuple, optional): (R,G,B) colour to erase an old highlight with.
+
+        Returns:
+            rects (list): List of pygame.Rect areas of the surface that were drawn to.
+
+        """
+        assert len(game_board) == self.rows * self.columns
+        if overlay is None:
+            overlay = {}
+
+        rects = []
+        forced = set()
+        # Move the highlight, the margin box overdraws the box so it must be drawn again
+        if highlight != self.__highlight:
+            if self.__highlight is not None:
+                rects.append(self.draw_margin_box(*self.__highlight, background))
+                forced.add(self.__highlight)
+            if highlight is not None:
+                rects.append(self.draw_margin_box(*highlight, highlight_colour))
+                forced.add(highlight)
+            self.__highlight = highlight
+
+        for box_x, box_y in forced.union(boxes):
+            offset = box_x + box_y * self.columns
+            colour = overlay.get((box_x, box_y))
+            if colour is None:
+                colour = self.box_mapping[game_board[offset]]
+
+            if colour != self.__drawn[offset] or (box_x, box_y) in forced:
+                rects.append(self.draw_box(box_x, box_y, colour))
+
+        return rects
+
     def mouse_in_board(self, mouse_x, mouse_y):
         """Check if the mouse coordinates fall within the board.
 
@@ -144,10 +241,14 @@ class RenderBoard(object):
             box_y (int): Y location of box in the board.
             colour (tuple): (R,G,B).
 
+        Returns:
+            rect (pygame.Rect): Area of the surface that was drawn to.
+
         """
         x = box_x * self.box_width + box_x * self.margin_width + self.board_x
         y = box_y * self.box_width + box_y * self.margin_width + self.board_y
-        pygame.draw.rect(self.pygame_surface, colour, (x, y, self.box_width, self.box_width))
+        self.__drawn[box_x + box_y * self.columns] = colour
+        return pygame.draw.rect(self.pygame_surface, colour, (x, y, self.box_width, self.box_width))
 
     def draw_margin_box(self, box_x, box_y, colour):
         """Draw a box spanning the margin in the board based on box coordinates to the Pygame surface.
@@ -160,11 +261,80 @@ class RenderBoard(object):
             box_y (int): Y location of box in the board.
             colour (tuple): (R,G,B).
 
+        Returns:
+            rect (pygame.Rect): Area of the surface that was drawn to.
+
         """
         x = box_x * self.box_width + box_x * self.margin_width - self.margin_width + self.board_x
         y = box_y * self.box_width + box_y * self.margin_width - self.margin_width + self.board_y
-        pygame.draw.rect(self.pygame_surface, colour, (x, y, self.box_width + 2*self.margin_width,
-                                                       self.box_width + 2*self.margin_width))
+        return pygame.draw.rect(self.pygame_surface, colour, (x, y, self.box_width + 2*self.margin_width,
+                                                              self.box_width + 2*self.margin_width))
+
+    def draw_status(self, text, colour, background=BLACK):
+        """Draw a line of status text underneath the board, clearing the previous status text.
+
+        Args:
+            text (str): Text to draw.
+            colour (tuple): (R,G,B) text colour.
+            background (tuple, optional): (R,G,B) colour to clear the status line with.
+
+        Returns:
+            rect (pygame.Rect): Area of the surface that was drawn to.
+
+        """
+        if self.__font is None:
+            self.__font = pygame.font.SysFont(None, 24)
+
+        x = self.board_x
+        y = self.board_y + self.board_height + 2*self.margin_width
+        rect = pygame.Rect(x, y, self.pygame_surface.get_width() - x, self.__font.get_linesize())
+        pygame.draw.rect(self.pygame_surface, background, rect)
+        self.pygame_surface.blit(self.__font.render(text, True, colour, background), (x, y))
+
+        return rect
+
+
+def board_box_mapping():
+    """Board/box state to rendering mappings, keyed by the raw board list values so
+    the board list can be drawn without unsetting the box blocked bit mask.
+
+    Returns:
+        box_mapping (dict): int -> colour mapping for the boxes.
+
+    """
+    return {board.Board.PLAYER1 | board.Board.BOX_BLOCKED_MASK: LBLUE,
+            board.Board.PLAYER2 | board.Board.BOX_BLOCKED_MASK: LRED,
+            board.Board.BOX_CLEAR: GREY,
+            board.Board.BOX_BLOCK | board.Board.BOX_BLOCKED_MASK: BROWN,
+            board.Board.BOX_BLOCKED_MASK: BLACK}  # Masked state is not actually used to draw
+
+
+def draw_ply(game, visual_board, drawn_positions):
+    """Incrementally draw the board after a move.
+    Only the previous and current player positions can change between moves.
+
+    Args:
+        game (board.Board): Game board object.
+        visual_board (RenderBoard): Renderer the board was fully drawn to once.
+        drawn_positions (list): Player positions returned by the previous call, [] at first.
+
+    Returns:
+        rects (list), positions (list): Areas drawn to and the player positions to pass next time.
+
+    """
+    positions = [game.player1_pos, game.player2_pos]
+    changed = [pos for pos in positions + drawn_positions if pos]
+
+    # Draw current position of players a darker colour
+    overlay = {}
+    if game.player1_pos:
+        overlay[game.player1_pos] = PLAYER1_COLOUR
+    if game.player2_pos:
+        overlay[game.player2_pos] = PLAYER2_COLOUR
+
+    # Highlight active player by drawing a margin filled box
+    rects = visual_board.update_boxes(game.board_list, changed, overlay, game.player_pos(game.active_player))
+    return rects, positions
 
 
 def main():
@@ -1,55 +1,195 @@
 """Game replay.
 Copyright 2018 Mark Mitterdorfer
 
-Side line application to replay a recorded game session.
+Side line application to replay a recorded game session, either interactively or
+headless to PNG frames / sprite sheets for batches of recorded games.
 """
 
-import board
+import record
 import renderer
 import pygame
 import sys
 from pygame.locals import *
-import pickle
 import argparse
+import math
+import multiprocessing
+import os
+
+# Static layers (grid and board blocked boxes) already rendered by this process,
+# keyed by (rows, columns, blocked_boxes, box_width, margin_width)
+_static_layers = {}
+
+
+def static_layer(game, box_width, margin_width):
+    """Obtain the static layer of a board, the grid and the boxes blocked by the board.
+    Layers are rendered once per process and copied for every replay that shares them.
+
+    Args:
+        game (board.Board): Game board object at the start of the game.
+        box_width (int): Width of individual *square* box in the board.
+        margin_width (int): Width of margins between individual boxes in the board.
+
+    Returns:
+        layer (pygame.Surface): Static layer, do not draw to it directly.
+
+    """
+    key = (game.rows, game.columns, tuple(game.get_blocked_boxes()), box_width, margin_width)
+    layer = _static_layers.get(key)
+    if layer is None:
+        # Leave a border around the board for the active player highlight
+        border = 2 * margin_width
+        width = game.columns * box_width + (game.columns - 1) * margin_width + 2 * border
+        height = game.rows * box_width + (game.rows - 1) * margin_width + 2 * border
+        layer = pygame.Surface((width, height))
+        layer.fill(renderer.BLACK)
+        visual_board = renderer.RenderBoard(layer, border, border, game.rows, game.columns,
+                                            renderer.board_box_mapping(), box_width, margin_width)
+        visual_board.draw_board(game.board_list)
+        _static_layers[key] = layer
+
+    return layer
+
+
+def render_replay(filename, out_dir, sheet=False, box_width=20, margin_width=2):
+    """Render every ply of a recorded game headless, to PNG frames or a single sprite sheet.
+    The frame starts as a copy of the static layer, each ply then only draws the changed boxes.
+
+    Args:
+        filename (str): Pickled filename to open.
+        out_dir (str): Directory to write the images to.
+        sheet (bool, optional): Write a single sprite sheet instead of a PNG per ply.
+        box_width (int, optional): Width of individual *square* box in the board.
+        margin_width (int, optional): Width of margins between individual boxes in the board.
+
+    Returns:
+        filenames (list): Images written.
+
+    """
+    game, human_playing, record_play = record.load_replay(filename)
+
+    frame = static_layer(game, box_width, margin_width).copy()
+    border = 2 * margin_width
+    visual_board = renderer.RenderBoard(frame, border, border, game.rows, game.columns,
+                                        renderer.board_box_mapping(), box_width, margin_width)
+    # The static layer already holds the full board
+    visual_board.assume_drawn(game.board_list)
+    drawn_positions = []
+
+    name = os.path.splitext(os.path.basename(filename))[0]
+    plies = len(record_play) + 1
+    sheet_columns = int(math.ceil(math.sqrt(plies)))
+    sprite_sheet = None
+    if sheet:
+        sprite_sheet = pygame.Surface((sheet_columns * frame.get_width(),
+                                       int(math.ceil(plies / sheet_columns)) * frame.get_height()))
+        sprite_sheet.fill(renderer.BLACK)
+
+    filenames = []
+    for ply in range(plies):
+        if ply > 0:
+            (active_player, score, move) = record_play[ply - 1]
+            game.make_move(*move)
+            _, drawn_positions = renderer.draw_ply(game, visual_board, drawn_positions)
+
+        if sprite_sheet is not None:
+            sprite_sheet.blit(frame, ((ply % sheet_columns) * frame.get_width(),
+                                      (ply // sheet_columns) * frame.get_height()))
+        else:
+            out_filename = os.path.join(out_dir, "{}_{:04d}.png".format(name, ply))
+            pygame.image.save(frame, out_filename)
+            filenames.append(out_filename)
+
+    if sprite_sheet is not None:
+        out_filename = os.path.join(out_dir, "{}_sheet.png".format(name))
+        pygame.image.save(sprite_sheet, out_filename)
+        filenames.append(out_filename)
+
+    return filenames
+
+
+def _init_headless():
+    """Use the SDL dummy video driver so no window is ever opened.
+
+    """
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+
+
+def _render_replay_job(job):
+    """Pool worker wrapper for render_replay().
+
+    Args:
+        job (tuple): Arguments for render_replay().
+
+    Returns:
+        filename (str), filenames (list): Replay rendered and images written.
+
+    """
+    return job[0], render_replay(*job)
+
+
+def render_replays(filenames, out_dir, sheet=False, box_width=20, margin_width=2, jobs=None):
+    """Render many recorded games headless in parallel, see render_replay().
+
+    Args:
+        filenames (list): Pickled filenames to open.
+        out_dir (str): Directory to write the images to.
+        sheet (bool, optional): Write a sprite sheet per replay instead of a PNG per ply.
+        box_width (int, optional): Width of individual *square* box in the board.
+        margin_width (int, optional): Width of margins between individual boxes in the board.
+        jobs (int, optional): Number of worker processes, default to the number of CPUs.
+
+    Yields:
+        filename (str), filenames (list): Replay rendered and images written, in completion order.
+
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    tasks = [(filename, out_dir, sheet, box_width, margin_width) for filename in filenames]
+    with multiprocessing.Pool(jobs, initializer=_init_headless) as pool:
+        for result in pool.imap_unordered(_render_replay_job, tasks):
+            yield result
 
 
 def main():
     parser = argparse.ArgumentParser(description="Replay a recorded Isolation game.")
-    parser.add_argument("filename", help="pickled filename to open")
+    parser.add_argument("filenames", nargs="+", help="pickled filename(s) to open")
+    parser.add_argument("--headless", action="store_true",
+                        help="render every ply to images instead of playing interactively")
+    parser.add_argument("--out", default="frames", help="directory for headless images")
+    parser.add_argument("--sheet", action="store_true", help="write one sprite sheet per replay")
+    parser.add_argument("--box-width", type=int, default=20, help="headless box width in pixels")
+    parser.add_argument("--margin-width", type=int, default=2, help="headless margin width in pixels")
+    parser.add_argument("--jobs", type=int, default=None, help="headless worker processes")
     args = parser.parse_args()
 
+    if args.headless:
+        _init_headless()
+        for filename, images in render_replays(args.filenames, args.out, args.sheet,
+                                               args.box_width, args.margin_width, args.jobs):
+            print(filename, "->", len(images), "image(s)")
+        return
+
+    if len(args.filenames) != 1:
+        parser.error("only one file can be replayed interactively")
+
     start_x = 10
     start_y = 10
 
     box_width = 50
     margin_width = 5
 
-    # Load and rerun an earlier recorded play:
-    # 1st element is a tuple with board dimensions and if AI or human player (rows, columns, human_playing)
-    # Followed by tuple (active_player, score, move)
-    # tuple (active_player, None, move) if human is playing
-    with open(args.filename, "rb") as input_file:
-        record_play = pickle.load(input_file)
-
-    (rows, columns, human_playing) = record_play.pop(0)
-
-    game = board.Board(rows, columns)
-    # Board/box state to rendering mappings
-    box_mapping = {game.PLAYER1: renderer.LBLUE,
-                   game.PLAYER2: renderer.LRED,
-                   game.BOX_CLEAR: renderer.GREY,
-                   game.BOX_BLOCK: renderer.BROWN,
-                   game.BOX_BLOCKED_MASK: renderer.BLACK}  # Masked state is not actually used to draw
-
-    # Player 1 = blue
-    player1_colour = renderer.BLUE
-    # Player 2 = red
-    player2_colour = renderer.RED
+    game, human_playing, record_play = record.load_replay(args.filenames[0])
 
     pygame.init()
     display = pygame.display.set_mode((800, 600), 0, 32)
     pygame.display.set_caption("Isolation - REPLAY")
-    visual_board = renderer.RenderBoard(display, start_x, start_y, rows, columns, box_mapping, box_width, margin_width)
+    visual_board = renderer.RenderBoard(display, start_x, start_y, game.rows, game.columns,
+                                        renderer.board_box_mapping(), box_width, margin_width)
+
+    # Render the entire board once, later frames only update the boxes which changed
+    display.fill(renderer.BLACK)
+    visual_board.draw_board(game.board_list)
+    pygame.display.update()
+    drawn_positions = []
 
     render_update = True
     game_over = False
@@ -58,37 +198,14 @@ def main():
     while True:
         # Only refresh the screen if an action caused a state change
         if render_update:
-            # Unset the box blocked bit mask pattern if it is set to get players colour etc.
-            # TODO Perhaps move this in to board.py
-            board_list = [i & ~game.BOX_BLOCKED_MASK if i != game.BOX_BLOCKED_MASK else
-                          game.BOX_BLOCKED_MASK for i in game.board_list]
-
-            display.fill(renderer.BLACK)
-
-            # Highlight active player by drawing a margin filled box
-            player_pos = game.player1_pos
-            if game.active_player == game.PLAYER2:
-                player_pos = game.player2_pos
-            if player_pos:
-                visual_board.draw_margin_box(*player_pos, renderer.GREEN)
-
-            # Render the entire board from the board_list
-            visual_board.draw_board(board_list)
-
-            # Draw current position of players a darker colour
-            player_pos = game.player1_pos
-            if player_pos:
-                visual_board.draw_box(*player_pos, player1_colour)
-            player_pos = game.player2_pos
-            if player_pos:
-                visual_board.draw_box(*player_pos, player2_colour)
+            rects, drawn_positions = renderer.draw_ply(game, visual_board, drawn_positions)
 
             winner = game.is_game_over()
             if winner:
                 print("Player", winner, "wins!")
                 game_over = True
 
-            pygame.display.update()
+            pygame.display.update(rects)
             render_update = False
 
         # Handle Pygame events
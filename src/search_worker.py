@@ -0,0 +1,206 @@
+"""Background AI search.
+Copyright 2018 Mark Mitterdorfer
+
+Class to run AI searches in a worker process so the game loop stays responsive.
+"""
+
+import multiprocessing
+import pickle
+import queue
+import threading
+import time
+import traceback
+
+import ai
+
+
+class SearchError(Exception):
+    """Raised by SearchWorker.poll() when a search failed or the worker process died."""
+    pass
+
+
+def _worker_loop(tasks, results, interval):
+    """Worker process entry point. Run searches from the task queue until None is received.
+    A reporter thread posts the node count, nodes/sec and best root move while searching.
+    A search raising an exception posts an "error" message with the traceback instead of a result.
+
+    Args:
+        tasks (multiprocessing.Queue): Queue of pickled (search, args) tuples.
+        results (multiprocessing.Queue): Queue to post progress and results to.
+        interval (float): Seconds between progress reports.
+
+    """
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+
+        ai.AI.nodes = 0
+        ai.AI.root_best = None
+        start = time.time()
+        done = threading.Event()
+
+        def report():
+            while not done.wait(interval):
+                elapsed = time.time() - start
+                results.put(("progress", ai.AI.nodes, ai.AI.nodes / elapsed, ai.AI.root_best, elapsed))
+
+        reporter = threading.Thread(target=report, daemon=True)
+        reporter.start()
+        try:
+            search, args = pickle.loads(task)
+            message, result = "done", search(*args)
+        except Exception:
+            message, result = "error", traceback.format_exc()
+        finally:
+            done.set()
+            reporter.join()
+
+        elapsed = time.time() - start
+        results.put((message, ai.AI.nodes, ai.AI.nodes / elapsed if elapsed > 0 else 0.0, result, elapsed))
+
+
+class SearchWorker(object):
+    """Run AI searches in a separate process and poll for the results.
+
+    Attributes:
+        interval (float): Seconds between progress reports from the worker.
+        nodes (int): Nodes visited by the current/last search.
+        nodes_per_sec (float): Search speed of the current/last search.
+        best (tuple): (best_score, best_move) found so far, None if nothing found yet.
+        elapsed (float): Seconds the current/last search has run in the worker process.
+        thinking (property, bool): True if a search is running.
+    """
+
+    def __init__(self, interval=0.25):
+        self.interval = interval
+        self.nodes = 0
+        self.nodes_per_sec = 0.0
+        self.best = None
+        self.elapsed = 0.0
+
+        self.__thinking = False
+        self.__process = None
+        # Use spawn so the worker does not inherit the parents Pygame/SDL state
+        self.__context = multiprocessing.get_context("spawn")
+        self.__tasks = None
+        self.__results = None
+
+    @property
+    def thinking(self):
+        return self.__thinking
+
+    def __start_process(self):
+        """Start the worker process if it is not running.
+
+        """
+        if self.__process is not None and self.__process.is_alive():
+            return
+        self.__tasks = self.__context.Queue()
+        self.__results = self.__context.Queue()
+        self.__process = self.__context.Process(target=_worker_loop,
+                                                args=(self.__tasks, self.__results, self.interval),
+                                                daemon=True)
+        self.__process.start()
+
+    def start(self, search, *args):
+        """Start a search in the worker process, this returns immediately.
+
+        Args:
+            search (function pointer): Search function, e.g. ai.AI.power_abnegamax. Must be picklable.
+            *args: Arguments passed to the search function, must be picklable.
+
+        """
+        assert not self.__thinking
+        # Pickle here so an unpicklable search raises now, not silently in the queues feeder thread
+        task = pickle.dumps((search, args), protocol=pickle.HIGHEST_PROTOCOL)
+        self.__start_process()
+        self.nodes = 0
+        self.nodes_per_sec = 0.0
+        self.best = None
+        self.elapsed = 0.0
+        self.__thinking = True
+        self.__tasks.put(task)
+
+    def poll(self):
+        """Process any pending messages from the worker without blocking.
+
+        Returns:
+            (best_score, best_move) if the search finished, None otherwise.
+
+        Raises:
+            SearchError: The search raised an exception, or the worker process died.
+
+        """
+        while self.__thinking:
+            try:
+                message, nodes, nodes_per_sec, result, elapsed = self.__results.get_nowait()
+            except queue.Empty:
+                if self.__process.is_alive():
+                    return None
+                # The process is gone, but messages it posted before exiting may still be in transit
+                try:
+                    message, nodes, nodes_per_sec, result, elapsed = self.__results.get(timeout=0.1)
+                except queue.Empty:
+                    exitcode = self.__process.exitcode
+                    self.__thinking = False
+                    self.__process = None
+                    raise SearchError("search worker process exited with code {}".format(exitcode))
+
+            self.nodes = nodes
+            self.nodes_per_sec = nodes_per_sec
+            self.elapsed = elapsed
+            if message == "error":
+                self.__thinking = False
+                raise SearchError(result)
+            if result is not None:
+                self.best = result
+            if message == "done":
+                self.__thinking = False
+                return result
+
+        return None
+
+    def cancel(self):
+        """Stop the worker process immediately, abandoning any running search.
+
+        """
+        if self.__process is not None:
+            self.__process.terminate()
+            self.__process.join()
+            self.__process = None
+        self.__thinking = False
+
+    def close(self):
+        """Ask an idle worker process to exit, or cancel it if it is still searching.
+
+        """
+        if self.__process is None:
+            return
+        if self.__thinking:
+            self.cancel()
+            return
+        self.__tasks.put(None)
+        self.__process.join()
+        self.__process = None
+
+
+def main():
+    import board
+
+    game = board.Board(5, 5)
+    worker = SearchWorker()
+    worker.start(ai.AI.power_abnegamax, game, 5, game.PLAYER1, float("-inf"), float("inf"), ai.AI.score_func2)
+
+    result = None
+    while result is None:
+        result = worker.poll()
+        print("Thinking... nodes:", worker.nodes, "nodes/sec:", int(worker.nodes_per_sec), "best:", worker.best)
+        time.sleep(0.2)
+
+    print("Best score, move:", result)
+    worker.close()
+
+
+if __name__ == "__main__":
+    main()
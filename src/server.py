@@ -0,0 +1,344 @@
+"""Game server.
+Copyright 2018 Mark Mitterdorfer
+
+Host many concurrent games over a local socket. The protocol is one JSON object per
+line in each direction. Requests carry a "cmd" and an optional "id" which is echoed in
+the response, so a client can have several requests in flight on one connection:
+
+    {"id": 1, "cmd": "new", "rows": 5, "columns": 5, "player1": "human", "player2": {"type": "abnegamax", "depth": 4}}
+    {"id": 2, "cmd": "move", "game": 1, "move": [2, 2]}
+    {"id": 3, "cmd": "advance", "game": 1}
+    {"id": 4, "cmd": "state", "game": 1}
+    {"id": 5, "cmd": "close", "game": 1, "save": true}
+    {"id": 6, "cmd": "stats"}
+
+"move" plays a human move and then the AI replies, "advance" plays AI moves until a human
+is to move or the game is over. Both respond with the game state and the AI moves played.
+Errors respond with {"error": message}. AI searches run in a process pool so the event
+loop keeps serving other games while searching. See client.py for a client.
+"""
+
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import multiprocessing
+import os
+import time
+
+import ai
+import controller
+import players
+
+# Largest supported board dimension, as main.py
+MAX_BOARD_SIZE = 32
+
+
+def _run_search(search, args):
+    """Process pool entry point, run one AI search.
+
+    Args:
+        search (function pointer): Search function.
+        args (tuple): Arguments passed to the search function.
+
+    Returns:
+        best_score (int), best_move (int, int), nodes (int), elapsed (float): Search result, nodes visited
+        and seconds searched, not counting the time the search waited for a worker process.
+
+    """
+    ai.AI.nodes = 0
+    start = time.time()
+    best_score, best_move = search(*args)
+    return best_score, best_move, ai.AI.nodes, time.time() - start
+
+
+def game_state(game_id, game_controller):
+    """JSON serialisable state of a game.
+
+    Args:
+        game_id (int): Game id.
+        game_controller (controller.GameController): Game.
+
+    Returns:
+        state (dict): Game state.
+
+    """
+    game = game_controller.game
+    return {"game": game_id,
+            "rows": game.rows,
+            "columns": game.columns,
+            "ply": game_controller.ply,
+            "active_player": game.active_player,
+            "player1_pos": game.player1_pos,
+            "player2_pos": game.player2_pos,
+            "blocked_boxes": game.get_blocked_boxes(),
+            "legal_moves": [] if game_controller.game_over else game.get_legal_moves(),
+            "winner": game_controller.winner or None,
+            "players": [game_controller.players[player].describe() for player in (game.PLAYER1, game.PLAYER2)]}
+
+
+class RequestError(Exception):
+    """Invalid request, reported to the client as {"error": message}.
+
+    """
+    pass
+
+
+class GameServer(object):
+    """Asyncio server hosting concurrent games.
+
+    Attributes:
+        max_games (int): Maximum number of open games.
+        replay_dir (str): Directory replays of closed games are saved to on request.
+        games (dict): (controller.GameController, asyncio.Lock) by game id.
+        __pool (concurrent.futures.ProcessPoolExecutor): Private process pool for the AI searches.
+        __next_id (int): Private, next game id.
+    """
+
+    def __init__(self, jobs=None, max_games=1000, replay_dir="."):
+        self.max_games = max_games
+        self.replay_dir = replay_dir
+        self.games = {}
+        # Use spawn as search_worker.SearchWorker, so workers do not inherit the event loop
+        self.__pool = concurrent.futures.ProcessPoolExecutor(jobs, mp_context=multiprocessing.get_context("spawn"))
+        self.__next_id = 1
+
+    async def start(self, host="127.0.0.1", port=8765):
+        """Start serving.
+
+        Args:
+            host (str, optional): Address to listen on, local only by default.
+            port (int, optional): Port to listen on, 0 for any free port.
+
+        Returns:
+            server (asyncio.Server): Running server, e.g. server.sockets[0].getsockname() for the port.
+
+        """
+        return await asyncio.start_server(self.handle_client, host, port)
+
+    def close(self):
+        """Shut down the process pool, abandoning pending searches.
+
+        """
+        self.__pool.shutdown(wait=False, cancel_futures=True)
+
+    async def handle_client(self, reader, writer):
+        """Serve one client connection, each request is handled concurrently.
+
+        Args:
+            reader (asyncio.StreamReader): Connection reader.
+            writer (asyncio.StreamWriter): Connection writer.
+
+        """
+        tasks = set()
+
+        async def respond(line):
+            try:
+                request = json.loads(line)
+            except ValueError:
+                request = None
+            if not isinstance(request, dict):
+                request = {}
+                response = {"error": "request must be a JSON object"}
+            else:
+                try:
+                    response = await self.handle_request(request)
+                except RequestError as error:
+                    response = {"error": str(error)}
+                except Exception as error:
+                    # Always respond so the client is not left waiting, and keep serving
+                    response = {"error": "internal error: {!r}".format(error)}
+            if "id" in request:
+                response["id"] = request["id"]
+            writer.write(json.dumps(response).encode() + b"\n")
+            await writer.drain()
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                task = asyncio.ensure_future(respond(line))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            # Finish the requests in flight before closing the connection
+            if tasks:
+                await asyncio.wait(tasks)
+        except (ConnectionError, asyncio.CancelledError):
+            for task in tasks:
+                task.cancel()
+        finally:
+            writer.close()
+
+    async def handle_request(self, request):
+        """Handle one request.
+
+        Args:
+            request (dict): Decoded request.
+
+        Returns:
+            response (dict): Response to send.
+
+        Raises:
+            RequestError: Invalid request.
+
+        """
+        handlers = {"new": self.new_game,
+                    "move": self.move,
+                    "advance": self.advance,
+                    "state": self.state,
+                    "close": self.close_game,
+                    "stats": self.stats}
+        handler = handlers.get(request.get("cmd"))
+        if handler is None:
+            raise RequestError("unknown cmd, expected one of: {}".format(", ".join(sorted(handlers))))
+        return await handler(request)
+
+    def __game(self, request):
+        """Look up the game of a request.
+
+        Returns:
+            game_id (int), game_controller (controller.GameController), lock (asyncio.Lock)
+
+        """
+        game_id = request.get("game")
+        # JSON true / false are bools, which isinstance(value, int) would accept
+        if type(game_id) is not int or game_id not in self.games:
+            raise RequestError("unknown game: {}".format(game_id))
+        game_controller, lock = self.games[game_id]
+        return game_id, game_controller, lock
+
+    def __check_open(self, game_id):
+        """Check a game looked up by __game() was not closed while waiting for its lock.
+
+        Raises:
+            RequestError: The game was closed.
+
+        """
+        if game_id not in self.games:
+            raise RequestError("unknown game: {}".format(game_id))
+
+    async def new_game(self, request):
+        if len(self.games) >= self.max_games:
+            raise RequestError("too many games")
+        rows = request.get("rows", 5)
+        columns = request.get("columns", 5)
+        if not all(type(size) is int and 1 <= size <= MAX_BOARD_SIZE for size in (rows, columns)):
+            raise RequestError("board dimensions must be integers between 1 and {}".format(MAX_BOARD_SIZE))
+        try:
+            player1 = players.create_player(request.get("player1", "timed_abnegamax"))
+            player2 = players.create_player(request.get("player2", "timed_abnegamax"))
+        except (ValueError, TypeError) as error:
+            raise RequestError(str(error))
+
+        game_id = self.__next_id
+        self.__next_id += 1
+        game_controller = controller.GameController(rows, columns, player1, player2)
+        self.games[game_id] = (game_controller, asyncio.Lock())
+        return game_state(game_id, game_controller)
+
+    async def __play_ai(self, game_controller):
+        """Play AI moves until a human is to move or the game is over. Hold the game lock.
+
+        Returns:
+            moves (list): List of (player, best_score, best_move, nodes) played.
+
+        """
+        loop = asyncio.get_running_loop()
+        moves = []
+        while game_controller.ai_to_move:
+            task = game_controller.search_task()
+            if task is None:
+                break
+            search, args = task
+            best_score, best_move, nodes, elapsed = await loop.run_in_executor(self.__pool, _run_search, search,
+                                                                               args)
+            moves.append((game_controller.game.active_player, best_score, best_move, nodes))
+            game_controller.play(best_move, best_score, elapsed)
+        return moves
+
+    async def move(self, request):
+        game_id, game_controller, lock = self.__game(request)
+        move = request.get("move")
+        if not (isinstance(move, list) and len(move) == 2 and all(type(value) is int for value in move)):
+            raise RequestError("move must be [x, y]")
+
+        async with lock:
+            self.__check_open(game_id)
+            if game_controller.game_over or not game_controller.active.is_human:
+                raise RequestError("not a human players turn")
+            x, y = move
+            game = game_controller.game
+            if not (0 <= x < game.columns and 0 <= y < game.rows) or not game_controller.is_legal_move(x, y):
+                raise RequestError("illegal move: {}".format(move))
+            game_controller.play((x, y))
+            moves = await self.__play_ai(game_controller)
+            return dict(game_state(game_id, game_controller), ai_moves=moves)
+
+    async def advance(self, request):
+        game_id, game_controller, lock = self.__game(request)
+        async with lock:
+            self.__check_open(game_id)
+            moves = await self.__play_ai(game_controller)
+            return dict(game_state(game_id, game_controller), ai_moves=moves)
+
+    async def state(self, request):
+        game_id, game_controller, lock = self.__game(request)
+        return game_state(game_id, game_controller)
+
+    async def close_game(self, request):
+        game_id, game_controller, lock = self.__game(request)
+        # Wait for any search of the game to finish
+        async with lock:
+            # Another request may have closed the game while waiting for the lock
+            if self.games.pop(game_id, None) is None:
+                raise RequestError("unknown game: {}".format(game_id))
+            response = {"closed": game_id}
+            if request.get("save"):
+                filename = "REPLAY{}_{}.pickle".format(os.getpid(), game_id)
+                response["replay"] = game_controller.save(os.path.join(self.replay_dir, filename))
+            return response
+
+    async def stats(self, request):
+        return {"games": len(self.games),
+                "in_play": sum(not game_controller.game_over for game_controller, lock in self.games.values())}
+
+
+async def serve(host, port, jobs, max_games, replay_dir):
+    """Run a game server until cancelled.
+
+    Args:
+        host (str): Address to listen on.
+        port (int): Port to listen on.
+        jobs (int): Number of search processes, None for the number of CPUs.
+        max_games (int): Maximum number of open games.
+        replay_dir (str): Directory replays are saved to.
+
+    """
+    game_server = GameServer(jobs, max_games, replay_dir)
+    server = await game_server.start(host, port)
+    print("Serving on", ", ".join(str(sock.getsockname()) for sock in server.sockets))
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        game_server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Host Isolation games over a local socket.")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--port", type=int, default=8765, help="port to listen on")
+    parser.add_argument("--jobs", type=int, default=None, help="search processes, default to the number of CPUs")
+    parser.add_argument("--max-games", type=int, default=1000, help="maximum number of open games")
+    parser.add_argument("--replay-dir", default=".", help="directory replays of closed games are saved to")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(args.host, args.port, args.jobs, args.max_games, args.replay_dir))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
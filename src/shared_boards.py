@@ -0,0 +1,78 @@
+"""Shared memory boards.
+Copyright 2018 Mark Mitterdorfer
+
+Class to pass boards between processes through a shared memory buffer. Boards are
+encoded in place with board.Board.to_bytes() and decoded straight from the buffer,
+so only a name and an index have to be sent between processes, not the boards.
+"""
+
+from multiprocessing import shared_memory
+
+import board
+
+
+class SharedBoards(object):
+    """Fixed size array of boards with the same dimensions in shared memory.
+    Create it in one process, then attach to it by name in others.
+
+    Attributes:
+        rows (int): Number of rows in the boards.
+        columns (int): Number of columns in the boards.
+        count (int): Number of boards.
+        slot_size (int): Bytes per board.
+        name (property, str): Shared memory name to attach with.
+        __memory (shared_memory.SharedMemory): Private shared memory block.
+        __owner (bool): Private, True if this object created the shared memory.
+    """
+
+    def __init__(self, rows, columns, count, name=None):
+        self.rows = rows
+        self.columns = columns
+        self.count = count
+        self.slot_size = board.Board.packed_size(rows, columns)
+
+        self.__owner = name is None
+        if self.__owner:
+            self.__memory = shared_memory.SharedMemory(create=True, size=max(1, count * self.slot_size))
+        else:
+            self.__memory = shared_memory.SharedMemory(name=name)
+
+    @property
+    def name(self):
+        return self.__memory.name
+
+    def __len__(self):
+        return self.count
+
+    def write(self, index, game):
+        """Encode a board in to a slot.
+
+        Args:
+            index (int): Slot index.
+            game (board.Board): Board to write, must have the array's dimensions.
+
+        """
+        assert 0 <= index < self.count
+        assert game.rows == self.rows and game.columns == self.columns
+        game.to_bytes(self.__memory.buf, index * self.slot_size)
+
+    def read(self, index):
+        """Decode the board in a slot.
+
+        Args:
+            index (int): Slot index.
+
+        Returns:
+            board (board.Board): Decoded board.
+
+        """
+        assert 0 <= index < self.count
+        return board.Board.from_bytes(self.__memory.buf, index * self.slot_size)
+
+    def close(self):
+        """Detach from the shared memory, and free it if this object created it.
+
+        """
+        self.__memory.close()
+        if self.__owner:
+            self.__memory.unlink()
@@ -0,0 +1,463 @@
+"""Endgame tablebase.
+Copyright 2018 Mark Mitterdorfer
+
+Solve every position with at most K free boxes by retrograde analysis, and look positions
+up through a memory mapped file. Every move blocks one free box, so the positions with k
+free boxes only lead to positions with k - 1 free boxes: the layers are solved in order of
+free boxes, each from the layer below it. Run e.g.:
+
+    python tablebase.py --rows 5 --columns 5 --free 4 --out tablebase5x5.bin
+
+Layers are solved in parallel chunks, and an interrupted run resumes from its progress file.
+Pass the tablebase to ai.AI.timed_abnegamax() (or main.py --tablebase) to replace the search
+below the threshold with a lookup.
+
+File layout: HEADER followed by one layer per number of free boxes k = 0 ... K. A position is
+the set of free boxes (every other box is blocked), both players positions and the player to
+move. Within a layer it is indexed as
+((rank(free boxes) * (N - k) + rank(player 1)) * (N - k - 1) + rank(player 2)) * 2 + player to move - 1
+where rank(free boxes) is the colex rank of the box offsets, and the players are ranked among
+the blocked boxes (N boxes in the board). One byte per position, see encode().
+"""
+
+import argparse
+import json
+import math
+import mmap
+import multiprocessing
+import os
+import struct
+import time
+
+import board
+
+# magic, version, rows, columns, max free boxes, number of complete layers
+HEADER = struct.Struct("<5sBBBBB")
+MAGIC = b"ISOTB"
+VERSION = 1
+
+# Value byte: 0 for unsolved, otherwise WIN for the player to move plus 1 + plies to the end of the game
+WIN = 0x80
+# Every ply blocks a free box, so a distance is at most the free boxes and 1 + distance must stay below WIN
+MAX_FREE = WIN - 2
+
+
+def encode(win, distance):
+    """Encode a position value.
+
+    Args:
+        win (bool): True if the player to move wins.
+        distance (int): Plies to the end of the game with best play, the winner ends it quickly
+            and the loser delays it. At most MAX_FREE.
+
+    Returns:
+        value (int): Value byte.
+
+    """
+    assert 0 <= distance <= MAX_FREE
+    return (WIN if win else 0) | (distance + 1)
+
+
+def decode(value):
+    """Decode a position value.
+
+    Args:
+        value (int): Value byte, not 0.
+
+    Returns:
+        win (bool), distance (int): See encode().
+
+    """
+    return bool(value & WIN), (value & ~WIN) - 1
+
+
+def layer_size(rows, columns, free):
+    """Obtain the number of positions with "free" free boxes.
+
+    Args:
+        rows (int), columns (int): Board dimensions.
+        free (int): Number of free boxes.
+
+    Returns:
+        size (int): Positions in the layer.
+
+    """
+    size = rows * columns
+    return math.comb(size, free) * (size - free) * (size - free - 1) * 2
+
+
+def layer_offsets(rows, columns, max_free):
+    """Obtain the file offset of every layer.
+
+    Args:
+        rows (int), columns (int): Board dimensions.
+        max_free (int): Maximum number of free boxes.
+
+    Returns:
+        offsets (list): File offset per number of free boxes, and the file size last.
+
+    """
+    offsets = [HEADER.size]
+    for free in range(max_free + 1):
+        offsets.append(offsets[-1] + layer_size(rows, columns, free))
+    return offsets
+
+
+def position_index(size, free_boxes, player1, player2, active_player):
+    """Obtain the index of a position within its layer.
+
+    Args:
+        size (int): Number of boxes in the board.
+        free_boxes (list): Sorted offsets of the free boxes.
+        player1 (int), player2 (int): Offsets of the players positions.
+        active_player (int): Player to move.
+
+    Returns:
+        index (int): Index in to the layer of len(free_boxes) free boxes.
+
+    """
+    free = len(free_boxes)
+    rank = 0
+    player1_rank = player1
+    player2_rank = player2 - (player1 < player2)
+    for i, offset in enumerate(free_boxes):
+        rank += math.comb(offset, i + 1)
+        player1_rank -= offset < player1
+        player2_rank -= offset < player2
+    return ((rank * (size - free) + player1_rank) * (size - free - 1) + player2_rank) * 2 + active_player - 1
+
+
+def unrank(rank, free, size):
+    """Obtain the free boxes of a colex rank, the inverse of the rank in position_index().
+
+    Args:
+        rank (int): Colex rank.
+        free (int): Number of free boxes.
+        size (int): Number of boxes in the board.
+
+    Returns:
+        free_boxes (list): Sorted offsets of the free boxes.
+
+    """
+    free_boxes = []
+    offset = size - 1
+    for i in range(free, 0, -1):
+        while math.comb(offset, i) > rank:
+            offset -= 1
+        free_boxes.append(offset)
+        rank -= math.comb(offset, i)
+        offset -= 1
+    free_boxes.reverse()
+    return free_boxes
+
+
+def queen_rays(rows, columns):
+    """Obtain the box offsets in each direction from every box, as board.Board.get_moves_from().
+
+    Args:
+        rows (int), columns (int): Board dimensions.
+
+    Returns:
+        rays (list): Per box offset, a tuple of tuples of box offsets.
+
+    """
+    dirs_deltas = [(-1, -1), (+0, -1), (+1, -1), (+1, +0),
+                   (+1, +1), (+0, +1), (-1, +1), (-1, +0)]
+    rays = []
+    for offset in range(rows * columns):
+        x, y = offset % columns, offset // columns
+        box_rays = []
+        for dx, dy in dirs_deltas:
+            ray = []
+            move_x, move_y = x + dx, y + dy
+            while 0 <= move_x < columns and 0 <= move_y < rows:
+                ray.append(move_x + move_y * columns)
+                move_x += dx
+                move_y += dy
+            if ray:
+                box_rays.append(tuple(ray))
+        rays.append(tuple(box_rays))
+    return rays
+
+
+class Tablebase(object):
+    """Read only, memory mapped tablebase. Pickling a tablebase (e.g. to send it to a worker
+    process) only sends the filename, the file is mapped again when unpickled.
+
+    Attributes:
+        filename (str): Tablebase filename.
+        rows (int): Number of rows in the board.
+        columns (int): Number of columns in the board.
+        max_free (int): Maximum number of free boxes of the positions in the file.
+        complete (int): Number of solved layers, positions with fewer free boxes can be looked up.
+        probes (int): Number of lookups.
+        __file (file): Private open file.
+        __map (mmap.mmap): Private memory map of the file.
+        __offsets (list): Private file offset per layer.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.probes = 0
+        self.__file = open(filename, "rb")
+        self.__map = mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.rows, self.columns, self.max_free, self.complete = HEADER.unpack_from(self.__map)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("not a version {} tablebase: {}".format(VERSION, filename))
+        self.__offsets = layer_offsets(self.rows, self.columns, self.max_free)
+
+    def __getstate__(self):
+        return {"filename": self.filename}
+
+    def __setstate__(self, state):
+        self.__init__(state["filename"])
+
+    def close(self):
+        """Unmap and close the file.
+
+        """
+        self.__map.close()
+        self.__file.close()
+
+    def value(self, free_boxes, player1, player2, active_player):
+        """Look up a position by box offsets, see position_index().
+
+        Returns:
+            value (int): Value byte, see decode(). 0 if the layer is not solved yet.
+
+        """
+        size = self.rows * self.columns
+        index = position_index(size, free_boxes, player1, player2, active_player)
+        return self.__map[self.__offsets[len(free_boxes)] + index]
+
+    def covers(self, game):
+        """Determine if a board can be looked up.
+
+        Args:
+            game (board.Board): Game board object.
+
+        Returns:
+            True if the board is solved in this tablebase, False otherwise.
+
+        """
+        return (game.num_free_boxes < self.complete and game.rows == self.rows and game.columns == self.columns
+                and game.player1_pos is not None and game.player2_pos is not None)
+
+    def probe(self, game):
+        """Look up a board, which must be covered.
+
+        Args:
+            game (board.Board): Game board object.
+
+        Returns:
+            win (bool), distance (int): True if the player to move wins, and the plies to the end of the game.
+
+        """
+        self.probes += 1
+        free_boxes = [game.offset(*box) for box in game.get_free_boxes()]
+        return decode(self.value(free_boxes, game.offset(*game.player1_pos), game.offset(*game.player2_pos),
+                                 game.active_player))
+
+    def best_move(self, game):
+        """Look up the best move of a board, which must be covered and in play. The winner plays the
+        quickest win, the loser the longest loss.
+
+        Args:
+            game (board.Board): Game board object.
+
+        Returns:
+            win (bool), distance (int), move (int, int): Value of the board and the move to play.
+
+        """
+        win, distance = self.probe(game)
+        for move in game.get_legal_moves():
+            child_win, child_distance = self.probe(game.make_move_copy(*move))
+            if child_win != win and child_distance == distance - 1:
+                return win, distance, move
+        raise ValueError("tablebase inconsistent with the board")
+
+
+# Tablebase and board geometry of a generator worker process, set once by _init_worker()
+_worker = None
+
+
+def _init_worker(filename):
+    """Pool initializer, map the tablebase being generated to look up the solved layers.
+
+    Args:
+        filename (str): Tablebase filename.
+
+    """
+    global _worker
+    tablebase = Tablebase(filename)
+    _worker = (tablebase, queen_rays(tablebase.rows, tablebase.columns))
+
+
+def _solve_chunk(task):
+    """Solve the positions of a range of free box ranks in a layer, looking up the layer below.
+
+    Args:
+        task (tuple): (free, start, stop) number of free boxes and range of free box ranks.
+
+    Returns:
+        free (int), start (int), values (bytes): The task and the value bytes of its positions.
+
+    """
+    free, start, stop = task
+    tablebase, rays = _worker
+    size = tablebase.rows * tablebase.columns
+    values = bytearray()
+
+    for rank in range(start, stop):
+        free_boxes = unrank(rank, free, size)
+        free_set = set(free_boxes)
+        blocked = [offset for offset in range(size) if offset not in free_set]
+
+        # Moves from each blocked box, as board.Board.get_moves_from() with only free_boxes free
+        moves_from = {}
+        for offset in blocked:
+            moves = []
+            for ray in rays[offset]:
+                for box in ray:
+                    if box not in free_set:
+                        break
+                    moves.append(box)
+            moves_from[offset] = moves
+
+        for player1 in blocked:
+            for player2 in blocked:
+                if player2 == player1:
+                    continue
+                for active_player in (board.Board.PLAYER1, board.Board.PLAYER2):
+                    pos, opp_pos = (player1, player2) if active_player == board.Board.PLAYER1 else (player2, player1)
+                    moves = moves_from[pos]
+                    # Game over as board.Board.is_game_over(), checking the active player first
+                    if not moves:
+                        values.append(encode(False, 0))
+                        continue
+                    if not moves_from[opp_pos]:
+                        values.append(encode(True, 0))
+                        continue
+
+                    # Win with the quickest move to a lost position, otherwise lose as slowly as possible
+                    win_distance = None
+                    loss_distance = 0
+                    inactive_player = 3 - active_player
+                    for move in moves:
+                        child_free = [box for box in free_boxes if box != move]
+                        child_player1, child_player2 = ((move, player2) if active_player == board.Board.PLAYER1
+                                                        else (player1, move))
+                        child_win, child_distance = decode(tablebase.value(child_free, child_player1, child_player2,
+                                                                           inactive_player))
+                        if not child_win:
+                            if win_distance is None or child_distance < win_distance:
+                                win_distance = child_distance
+                        else:
+                            loss_distance = max(loss_distance, child_distance)
+
+                    if win_distance is not None:
+                        values.append(encode(True, win_distance + 1))
+                    else:
+                        values.append(encode(False, loss_distance + 1))
+
+    return free, start, bytes(values)
+
+
+def generate(filename, rows, columns, max_free, jobs=None, chunk_ranks=256, verbose=True):
+    """Generate a tablebase, or resume generating it. Progress within a layer is kept in
+    filename + ".progress", complete layers are recorded in the header.
+
+    Args:
+        filename (str): Tablebase filename.
+        rows (int), columns (int): Board dimensions.
+        max_free (int): Maximum number of free boxes.
+        jobs (int, optional): Number of worker processes, default to the number of CPUs.
+        chunk_ranks (int, optional): Free box ranks solved per task.
+        verbose (bool, optional): Print progress.
+
+    Raises:
+        ValueError: Invalid board dimensions or free boxes, or filename is a different tablebase.
+
+    """
+    size = rows * columns
+    if not 0 <= max_free <= min(size - 2, MAX_FREE) or size > 255:
+        raise ValueError("need at most {} free boxes and boards of at most 255 boxes".format(
+            min(size - 2, MAX_FREE)))
+
+    offsets = layer_offsets(rows, columns, max_free)
+    if os.path.exists(filename):
+        with open(filename, "rb") as input_file:
+            header = HEADER.unpack(input_file.read(HEADER.size))
+        if header[:5] != (MAGIC, VERSION, rows, columns, max_free):
+            raise ValueError("{} is a different tablebase".format(filename))
+        complete = header[5]
+    else:
+        with open(filename, "wb") as output_file:
+            output_file.write(HEADER.pack(MAGIC, VERSION, rows, columns, max_free, 0))
+            output_file.truncate(offsets[-1])
+        complete = 0
+
+    progress_filename = filename + ".progress"
+    done = []
+    if os.path.exists(progress_filename):
+        with open(progress_filename) as input_file:
+            progress = json.load(input_file)
+        if progress["free"] == complete:
+            done = progress["done"]
+
+    with open(filename, "r+b") as output_file:
+        for free in range(complete, max_free + 1):
+            start_time = time.time()
+            ranks = math.comb(size, free)
+            tasks = [(free, start, min(start + chunk_ranks, ranks)) for start in range(0, ranks, chunk_ranks)
+                     if start not in done]
+            per_rank = (size - free) * (size - free - 1) * 2
+
+            # A new pool per layer, so the workers map the layers solved so far
+            with multiprocessing.Pool(jobs, initializer=_init_worker, initargs=(filename,)) as pool:
+                for task_free, start, values in pool.imap_unordered(_solve_chunk, tasks):
+                    output_file.seek(offsets[free] + start * per_rank)
+                    output_file.write(values)
+                    output_file.flush()
+                    done.append(start)
+                    # Write the progress atomically so an interruption never leaves it half written
+                    with open(progress_filename + ".tmp", "w") as progress_file:
+                        json.dump({"free": free, "done": done}, progress_file)
+                    os.replace(progress_filename + ".tmp", progress_filename)
+
+            output_file.seek(0)
+            output_file.write(HEADER.pack(MAGIC, VERSION, rows, columns, max_free, free + 1))
+            output_file.flush()
+            os.fsync(output_file.fileno())
+            done = []
+            if verbose:
+                print("Solved {} free boxes: {} positions, time: {:.1f}".format(
+                    free, layer_size(rows, columns, free), time.time() - start_time))
+
+    if os.path.exists(progress_filename):
+        os.remove(progress_filename)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate an endgame tablebase by retrograde analysis.")
+    parser.add_argument("--rows", type=int, default=5, help="number of rows in the board")
+    parser.add_argument("--columns", type=int, default=5, help="number of columns in the board")
+    parser.add_argument("--free", type=int, default=4, help="solve positions with at most this many free boxes")
+    parser.add_argument("--out", default=None, help="tablebase file, default to tablebase<rows>x<columns>.bin")
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes, default to the number of CPUs")
+    args = parser.parse_args()
+
+    out = args.out or "tablebase{}x{}.bin".format(args.rows, args.columns)
+    print("Positions:", sum(layer_size(args.rows, args.columns, free) for free in range(args.free + 1)))
+    try:
+        generate(out, args.rows, args.columns, args.free, args.jobs)
+    except ValueError as error:
+        parser.error(str(error))
+
+    tablebase = Tablebase(out)
+    print("Wrote", out, "solved up to", tablebase.complete - 1, "free boxes")
+    tablebase.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""Heuristic tuner.
+Copyright 2018 Mark Mitterdorfer
+
+Fit the ai.WeightedScore weights from the results of parallel headless self-play games.
+Each round plays a batch of games with the current weights in a process pool, records the
+features of every position and whether the player to move went on to win, and fits the
+weights by logistic regression on all positions played so far. Progress is checkpointed
+after every round so an interrupted run resumes where it stopped.
+"""
+
+import argparse
+import math
+import multiprocessing
+import os
+import pickle
+import random
+
+import ai
+import board
+
+
+def play_game(task):
+    """Play one headless self-play game.
+
+    Args:
+        task (tuple): (seed, rows, columns, weights, depth, random_moves, blocked)
+            seed (int): Random seed for the blocked boxes and random opening moves.
+            rows (int), columns (int): Board dimensions.
+            weights (list): ai.WeightedScore weights used by both players.
+            depth (int): Search depth.
+            random_moves (int): Number of random opening moves, for variety between games.
+            blocked (int): Number of boxes blocked by the board.
+
+    Returns:
+        samples (list): List of (features, result) per position, result is 1.0 if the
+        active player went on to win, 0.0 otherwise.
+
+    """
+    (seed, rows, columns, weights, depth, random_moves, blocked) = task
+    rng = random.Random(seed)
+    game = board.Board(rows, columns)
+    game.set_blocked_boxes(rng.sample(game.get_free_boxes(), blocked))
+    score_func = ai.WeightedScore(weights)
+
+    positions = []
+    ply = 0
+    winner = game.is_game_over()
+    while not winner:
+        positions.append((ai.WeightedScore.features(game), game.active_player))
+        if ply < random_moves:
+            move = rng.choice(game.get_legal_moves())
+        else:
+            best_score, move = ai.AI.timed_abnegamax(game, depth, game.active_player, score_func)
+        game.make_move(*move)
+        ply += 1
+        winner = game.is_game_over()
+
+    return [(features, 1.0 if player == winner else 0.0) for features, player in positions]
+
+
+def solve(matrix, vector):
+    """Solve matrix * x = vector by Gaussian elimination with partial pivoting.
+
+    Args:
+        matrix (list): n x n list of lists.
+        vector (list): n values.
+
+    Returns:
+        x (list): n values.
+
+    """
+    n = len(vector)
+    a = [row[:] + [value] for row, value in zip(matrix, vector)]
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda row: abs(a[row][col]))
+        a[col], a[pivot] = a[pivot], a[col]
+        for row in range(col + 1, n):
+            factor = a[row][col] / a[col][col]
+            for k in range(col, n + 1):
+                a[row][k] -= factor * a[col][k]
+
+    x = [0.0] * n
+    for row in range(n - 1, -1, -1):
+        x[row] = (a[row][n] - sum(a[row][k] * x[k] for k in range(row + 1, n))) / a[row][row]
+    return x
+
+
+def fit_weights(samples, l2=1.0, iterations=15):
+    """Fit the weights by L2 regularised logistic regression (Newton's method) so that
+    sigmoid(weights . features + bias) predicts the result. Features are standardised for
+    the fit and the weights scaled back. The bias (side to move advantage) is dropped as
+    it is the same for every move of a search.
+
+    Args:
+        samples (list): List of (features, result).
+        l2 (float, optional): L2 regularisation strength.
+        iterations (int, optional): Number of Newton steps.
+
+    Returns:
+        weights (list): Weight per feature.
+
+    """
+    num_features = len(ai.WeightedScore.FEATURES)
+    count = float(len(samples))
+    means = [sum(features[i] for features, _ in samples) / count for i in range(num_features)]
+    stds = [math.sqrt(sum((features[i] - means[i]) ** 2 for features, _ in samples) / count)
+            for i in range(num_features)]
+
+    # Standardised rows with a trailing bias term, constant features are left out (weight 0)
+    used = [i for i in range(num_features) if stds[i] > 0]
+    rows = [[(features[i] - means[i]) / stds[i] for i in used] + [1.0] for features, _ in samples]
+    results = [result for _, result in samples]
+
+    size = len(used) + 1
+    w = [0.0] * size
+    for _ in range(iterations):
+        gradient = [-l2 * w[i] for i in range(size)]
+        hessian = [[l2 if i == j else 0.0 for j in range(size)] for i in range(size)]
+        for row, result in zip(rows, results):
+            z = sum(wi * xi for wi, xi in zip(w, row))
+            p = 1.0 / (1.0 + math.exp(-max(-30.0, min(30.0, z))))
+            error = result - p
+            curvature = p * (1.0 - p)
+            for i in range(size):
+                gradient[i] += error * row[i]
+                hessian_row = hessian[i]
+                for j in range(i, size):
+                    hessian_row[j] += curvature * row[i] * row[j]
+        for i in range(size):
+            for j in range(i):
+                hessian[i][j] = hessian[j][i]
+
+        step = solve(hessian, gradient)
+        w = [wi + si for wi, si in zip(w, step)]
+        if max(abs(si) for si in step) < 1e-6:
+            break
+
+    weights = [0.0] * num_features
+    for index, i in enumerate(used):
+        weights[i] = w[index] / stds[i]
+    return weights
+
+
+def tune(checkpoint, out, rounds=10, games=64, rows=5, columns=5, depth=2, random_moves=2, blocked=0,
+         jobs=None, seed=0):
+    """Run or resume the tuning rounds, see the module docstring.
+
+    Args:
+        checkpoint (str): Checkpoint filename, resumed from if it exists.
+        out (str): Weights filename written after every round.
+        rounds (int, optional): Total number of rounds.
+        games (int, optional): Self-play games per round.
+        rows (int, optional), columns (int, optional): Board dimensions.
+        depth (int, optional): Search depth.
+        random_moves (int, optional): Random opening moves per game.
+        blocked (int, optional): Boxes blocked by the board per game.
+        jobs (int, optional): Number of worker processes, default to the number of CPUs.
+        seed (int, optional): Base random seed, game seeds are derived from it.
+
+    Returns:
+        weights (list): Tuned weights.
+
+    """
+    state = {"round": 0, "weights": list(ai.WeightedScore.DEFAULT_WEIGHTS), "samples": []}
+    if os.path.exists(checkpoint):
+        with open(checkpoint, "rb") as input_file:
+            state = pickle.load(input_file)
+        print("Resuming from round", state["round"])
+
+    with multiprocessing.Pool(jobs) as pool:
+        for round_num in range(state["round"], rounds):
+            tasks = [(seed + round_num * games + i, rows, columns, state["weights"], depth, random_moves, blocked)
+                     for i in range(games)]
+            for samples in pool.imap_unordered(play_game, tasks):
+                state["samples"].extend(samples)
+
+            state["weights"] = fit_weights(state["samples"])
+            state["round"] = round_num + 1
+
+            # Write the checkpoint atomically so an interruption never leaves it half written
+            with open(checkpoint + ".tmp", "wb") as output_file:
+                pickle.dump(state, output_file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(checkpoint + ".tmp", checkpoint)
+            ai.WeightedScore(state["weights"]).save(out)
+
+            print("Round", state["round"], "positions:", len(state["samples"]), "weights:",
+                  ", ".join("{}={:.4f}".format(name, weight)
+                            for name, weight in zip(ai.WeightedScore.FEATURES, state["weights"])))
+
+    return state["weights"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tune the weighted scoring heuristic by self-play.")
+    parser.add_argument("--out", default="weights.json", help="weights file to write")
+    parser.add_argument("--checkpoint", default="tuner.checkpoint", help="checkpoint file to resume from")
+    parser.add_argument("--rounds", type=int, default=10, help="total number of rounds")
+    parser.add_argument("--games", type=int, default=64, help="self-play games per round")
+    parser.add_argument("--rows", type=int, default=5, help="number of rows in the board")
+    parser.add_argument("--columns", type=int, default=5, help="number of columns in the board")
+    parser.add_argument("--depth", type=int, default=2, help="search depth")
+    parser.add_argument("--random-moves", type=int, default=2, help="random opening moves per game")
+    parser.add_argument("--blocked", type=int, default=0, help="boxes blocked by the board per game")
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes")
+    parser.add_argument("--seed", type=int, default=0, help="base random seed")
+    args = parser.parse_args()
+
+    tune(args.checkpoint, args.out, args.rounds, args.games, args.rows, args.columns, args.depth,
+         args.random_moves, args.blocked, args.jobs, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""Game window.
+Copyright 2018 Mark Mitterdorfer
+
+Play a game from a controller.GameController in a Pygame window. Only imported by
+main.py when a display is requested, so headless use never loads Pygame.
+"""
+
+import time
+
+import pygame
+from pygame.locals import *
+
+import profiler
+import renderer
+import search_worker
+
+
+def run(controller, profile=None, profile_ply=0, profile_deterministic=False):
+    """Run the game loop in a Pygame window until it is closed, then save the recorded moves and return.
+
+    Args:
+        controller (controller.GameController): Game to play.
+        profile (str, optional): Profile the AI move search at profile_ply and write to this file.
+        profile_ply (int, optional): Ply of the AI move to profile, 0 is the first.
+        profile_deterministic (bool, optional): Profile with cProfile instead of sampling.
+
+    """
+    start_x = 10
+    start_y = 10
+
+    display_width = 800
+    display_height = 600
+    # Room to leave below the board for the status line
+    status_height = 40
+
+    game = controller.game
+
+    # Scale the boxes so the board fits the window
+    box_width, margin_width = renderer.RenderBoard.fit_box_width(display_width - 2 * start_x,
+                                                                 display_height - start_y - status_height,
+                                                                 game.rows, game.columns)
+
+    pygame.init()
+    display = pygame.display.set_mode((display_width, display_height), 0, 32)
+    pygame.display.set_caption("Isolation")
+    visual_board = renderer.RenderBoard(display, start_x, start_y, game.rows, game.columns,
+                                        renderer.board_box_mapping(), box_width, margin_width)
+
+    # Render the entire board once, later frames only update the boxes which changed
+    display.fill(renderer.BLACK)
+    visual_board.draw_board(game.board_list)
+    pygame.display.update()
+    drawn_positions = []
+
+    render_update = True
+
+    # AI searches run in a worker process so the window keeps handling events while thinking
+    worker = search_worker.SearchWorker()
+    clock = pygame.time.Clock()
+    start = 0
+    status = None
+    # Error of a failed AI search, the game stops as the AI can not move
+    search_error = None
+
+    while True:
+        # Only refresh the screen if an action caused a state change
+        if render_update:
+            rects, drawn_positions = renderer.draw_ply(game, visual_board, drawn_positions)
+            if controller.game_over:
+                print("Player", controller.winner, "wins!")
+
+            pygame.display.update(rects)
+            render_update = False
+
+        if controller.ai_to_move and search_error is None:
+            if not worker.thinking:
+                search, args = controller.search_task()
+                if profile and controller.ply == profile_ply:
+                    search = profiler.ProfiledSearch(search, profile, profile_deterministic)
+                start = time.time()
+                worker.start(search, *args)
+
+            try:
+                result = worker.poll()
+            except search_worker.SearchError as error:
+                print("AI search failed for player {}:".format(game.active_player), error)
+                search_error = error
+                result = None
+            if result:
+                best_score, best_move = result
+                print("Best move player {}:".format(game.active_player), best_move, "score:", best_score,
+                      "time:", time.time() - start)
+                # Charge game clocks with the search time, not the time to start the worker process
+                controller.play(best_move, best_score, worker.elapsed)
+                render_update = True
+
+        # Show the thinking state with live search statistics
+        new_status = ""
+        if search_error is not None:
+            new_status = "Player {} AI search failed, see the console".format(game.active_player)
+        elif worker.thinking:
+            new_status = "Player {} thinking... {} nodes/sec".format(game.active_player, int(worker.nodes_per_sec))
+            if worker.best:
+                new_status += " best move: {}".format(worker.best[1])
+        if new_status != status:
+            colour = renderer.RED if search_error is not None else renderer.GREEN
+            pygame.display.update(visual_board.draw_status(new_status, colour))
+            status = new_status
+
+        # Handle Pygame events
+        for event in pygame.event.get():
+            if event.type == QUIT:
+                # Abandon any running search rather than waiting for it
+                worker.cancel()
+                pygame.quit()
+                # Save recorded moves
+                controller.save()
+                return
+            # Only process a mouse button event if a human is to move
+            elif event.type == MOUSEBUTTONDOWN and not controller.game_over and controller.active.is_human:
+                mouse_x, mouse_y = pygame.mouse.get_pos()
+
+                if visual_board.mouse_in_board(mouse_x, mouse_y):
+                    box_x, box_y = visual_board.get_box_coord(mouse_x, mouse_y)
+                    if not visual_board.mouse_in_margin(mouse_x, mouse_y, box_x, box_y):
+                        # Make sure the box selected is a legal move
+                        if controller.is_legal_move(box_x, box_y):
+                            # Record and make the move, best_score = None for human player
+                            controller.play((box_x, box_y))
+                            # Force a render/board refresh
+                            render_update = True
+
+        clock.tick(60)